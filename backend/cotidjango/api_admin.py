@@ -1,4 +1,4 @@
-from datetime import timedelta
+import json
 from decimal import Decimal
 from math import ceil
 
@@ -7,7 +7,7 @@ from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.db.models.deletion import ProtectedError
 from django.db import transaction
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.http import HttpResponse
 from django.utils import timezone
 from rest_framework import permissions, status
@@ -15,9 +15,12 @@ from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from orders.models import Order, OrderItem
+from orders.models import DailySales, Order, OrderItem
+from orders.sales import local_day_range
+from orders.stock import StockInsuficiente, record_stock_adjustment
 from products.models import Category, Offer, Product, StoreSettings
 from .api_common import (
+    parse_pagination,
     User,
     _abs_media,
     build_invoice_pdf,
@@ -25,13 +28,17 @@ from .api_common import (
     parse_image_urls_payload,
     resolve_category,
     resolve_product,
+    resolve_products,
     serialize_category,
+    order_summary_queryset,
     serialize_order,
+    serialize_order_summary,
     serialize_product,
     serialize_user,
     sync_product_images,
 )
 from .api_order_utils import build_order_item_input
+from .api_overview import get_admin_overview
 
 
 def _normalize_person_name(value):
@@ -66,25 +73,7 @@ class AdminOverviewView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        counts = {
-            "users": User.objects.count(),
-            "products": Product.objects.filter(activo=True).count(),
-            "categories": Category.objects.count(),
-            "orders": Order.objects.count(),
-        }
-        since = timezone.now() - timedelta(days=30)
-        recent = Order.objects.filter(creado_en__gte=since, status__in=["paid", "shipped", "delivered"])
-        revenue = recent.aggregate(total=Sum("total")).get("total") or Decimal("0.00")
-        last_orders = Order.objects.prefetch_related("items__product").select_related("user").order_by("-creado_en")[:5]
-        pending_orders = Order.objects.filter(status="created").prefetch_related("items__product").select_related("user").order_by("-creado_en")[:5]
-        recent_users = User.objects.order_by("-date_joined")[:5]
-        return Response({
-            "counts": counts,
-            "last30d": {"revenue": float(revenue or 0), "orders": recent.count(), "items": sum(o.items.count() for o in recent)},
-            "lastOrders": [serialize_order(o, request) for o in last_orders],
-            "pendingOrders": [serialize_order(o, request) for o in pending_orders],
-            "recentUsers": [serialize_user(u, request) for u in recent_users],
-        })
+        return Response(get_admin_overview(request))
 
 
 class AdminUsersView(APIView):
@@ -92,8 +81,7 @@ class AdminUsersView(APIView):
 
     def get(self, request):
         q = (request.query_params.get("q") or "").strip()
-        page = max(1, int(request.query_params.get("page") or 1))
-        limit = max(1, min(100, int(request.query_params.get("limit") or 20)))
+        page, limit = parse_pagination(request.query_params)
         qs = User.objects.all().order_by("-date_joined")
         if q:
             qs = qs.filter(
@@ -202,49 +190,140 @@ class AdminOrdersView(APIView):
 
     def get(self, request):
         status_filter = request.query_params.get("status")
-        page = max(1, int(request.query_params.get("page") or 1))
-        limit = max(1, min(100, int(request.query_params.get("limit") or 20)))
-        qs = Order.objects.select_related("user").prefetch_related("items__product").order_by("-creado_en")
+        page, limit = parse_pagination(request.query_params)
+        qs = Order.objects.order_by("-creado_en")
         if status_filter:
             qs = qs.filter(status=status_filter)
         total = qs.count()
-        items = qs[(page - 1) * limit:(page - 1) * limit + limit]
-        return Response({"items": [serialize_order(o, request) for o in items], "total": total, "page": page, "pages": ceil(total / limit) if total else 1})
+        items = order_summary_queryset(qs)[(page - 1) * limit:(page - 1) * limit + limit]
+        return Response({"items": [serialize_order_summary(o) for o in items], "total": total, "page": page, "pages": ceil(total / limit) if total else 1})
 
 
 class AdminOrderDetailView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def patch(self, request, pk):
-        order = _get_order_or_404(pk)
+        # Sin prefetch: los items cambian aca y recalc_total tiene que leerlos de nuevo.
+        order = Order.objects.filter(pk=pk).first()
         if not order:
             return Response({"error": "Pedido no encontrado"}, status=status.HTTP_404_NOT_FOUND)
         status_val = request.data.get("status")
         if status_val not in {"created", "approved", "pending_payment", "paid", "shipped", "delivered", "cancelled", "draft"}:
             return Response({"error": "Estado invalido"}, status=status.HTTP_400_BAD_REQUEST)
-        order.status = status_val
         raw_items = request.data.get("items")
-        if isinstance(raw_items, list) and raw_items:
+        try:
             with transaction.atomic():
-                order.items.all().delete()
-                built_items = [build_order_item_input(raw, resolve_product) for raw in raw_items]
-                built_items = [item for item in built_items if item["name"] and item["product"]]
-                if built_items:
-                    for it in built_items:
-                        OrderItem.objects.create(
-                            order=order,
-                            product=it["product"],
-                            product_name=it["name"],
-                            cantidad=it["qty"],
-                            precio_unitario=it["price"],
-                            atributos=it.get("attrs") or {},
-                        )
+                order.status = status_val
+                order.save()
+                if isinstance(raw_items, list) and raw_items and _sync_order_items(order, raw_items):
                     order.recalc_total()
-        order.save()
-        order.refresh_from_db()
+        except StockInsuficiente as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        order = _get_order_or_404(order.pk)
         return Response(serialize_order(order, request))
 
 
+ORDER_ITEM_SYNC_FIELDS = ["product", "product_name", "cantidad", "precio_unitario", "atributos"]
+ORDER_ITEM_SNAPSHOT_FIELDS = ["product_sku", "categoria_nombre", "sort_key"]
+
+
+def _order_item_key(product_id, attrs):
+    return product_id, json.dumps(attrs or {}, sort_keys=True, default=str)
+
+
+def _sync_order_items(order, raw_items):
+    """Aplica la lista enviada como diferencia contra los items actuales del pedido.
+
+    Cada fila se empareja por ``itemId`` o, si no viene, por producto + atributos; los
+    items emparejados se actualizan, los nuevos se insertan y los que faltan se borran.
+    Devuelve True si cambio algo. Si ninguna fila es valida no se toca el pedido.
+    """
+    raw_items = [raw for raw in raw_items if isinstance(raw, dict)]
+    products = resolve_products(
+        raw.get("productId") or raw.get("product_id") or raw.get("product") or raw.get("id") or raw.get("slug")
+        for raw in raw_items
+    )
+    built_items = []
+    for raw in raw_items:
+        item = build_order_item_input(raw, lambda value: products.get(str(value).strip()) if value else None)
+        if item["name"] and item["product"]:
+            item["item_id"] = raw.get("itemId") or raw.get("item_id")
+            built_items.append(item)
+    if not built_items:
+        return False
+
+    existing = {item.pk: item for item in order.items.select_related("product__categoria")}
+    by_key = {}
+    for item in existing.values():
+        by_key.setdefault(_order_item_key(item.product_id, item.atributos), []).append(item)
+
+    matched = {}
+    unmatched = []
+    for built in built_items:
+        try:
+            current = existing.get(int(built["item_id"])) if built["item_id"] else None
+        except (TypeError, ValueError):
+            current = None
+        if current is not None and current.pk not in matched:
+            matched[current.pk] = built
+        else:
+            unmatched.append(built)
+    inserts = []
+    for built in unmatched:
+        candidates = [
+            item for item in by_key.get(_order_item_key(built["product"].pk, built["attrs"]), [])
+            if item.pk not in matched
+        ]
+        if candidates:
+            matched[candidates[0].pk] = built
+        else:
+            inserts.append(built)
+
+    to_update = []
+    snapshot_changed = False
+    for pk, built in matched.items():
+        item = existing[pk]
+        values = {
+            "product": built["product"],
+            "product_name": built["name"],
+            "cantidad": built["qty"],
+            "precio_unitario": built["price"],
+            "atributos": built["attrs"] or {},
+        }
+        if all(getattr(item, field) == value for field, value in values.items()):
+            continue
+        product_changed = item.product_id != built["product"].pk
+        for field, value in values.items():
+            setattr(item, field, value)
+        if product_changed:
+            item.snapshot_product()
+            snapshot_changed = True
+        to_update.append(item)
+
+    to_create = []
+    for built in inserts:
+        item = OrderItem(
+            order=order,
+            product=built["product"],
+            product_name=built["name"],
+            cantidad=built["qty"],
+            precio_unitario=built["price"],
+            atributos=built["attrs"] or {},
+        )
+        item.snapshot_product()
+        to_create.append(item)
+
+    to_delete = [pk for pk in existing if pk not in matched]
+    if to_delete:
+        OrderItem.objects.filter(order=order, pk__in=to_delete).delete()
+    if to_update:
+        fields = ORDER_ITEM_SYNC_FIELDS + (ORDER_ITEM_SNAPSHOT_FIELDS if snapshot_changed else [])
+        OrderItem.objects.bulk_update(to_update, fields, batch_size=500)
+    if to_create:
+        OrderItem.objects.bulk_create(to_create, batch_size=500)
+    return bool(to_delete or to_update or to_create)
+
+
 class AdminOrderPdfView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
@@ -281,9 +360,8 @@ class AdminProductsView(APIView):
 
     def get(self, request):
         q = (request.query_params.get("q") or "").strip()
-        page = max(1, int(request.query_params.get("page") or 1))
-        limit = max(1, min(100, int(request.query_params.get("limit") or 20)))
-        qs = Product.objects.select_related("categoria").prefetch_related("extra_images").order_by("-creado_en")
+        page, limit = parse_pagination(request.query_params)
+        qs = Product.objects.select_related("categoria").prefetch_related("extra_images", "variants").order_by("-creado_en")
         if q:
             qs = qs.filter(Q(nombre__icontains=q) | Q(descripcion__icontains=q))
         total = qs.count()
@@ -339,10 +417,14 @@ class AdminProductDetailView(APIView):
             product.descripcion = request.data.get("description") or ""
         if "videoUrl" in request.data or "video_url" in request.data:
             product.video_url = str(request.data.get("videoUrl") or request.data.get("video_url") or "").strip()
+        previous_stock = product.stock
         if "stock" in request.data:
             product.stock = int(request.data.get("stock") or 0)
         if "active" in request.data:
             product.activo = str(request.data.get("active")).lower() in {"1", "true", "yes"}
+        if "controlaStock" in request.data or "controla_stock" in request.data:
+            raw_value = request.data.get("controlaStock", request.data.get("controla_stock"))
+            product.controla_stock = str(raw_value).lower() in {"1", "true", "yes"}
         if "category" in request.data:
             product.categoria = resolve_category(request.data.get("category"))
         incoming_images = None
@@ -355,6 +437,7 @@ class AdminProductDetailView(APIView):
         if request.FILES.get("image"):
             product.imagen = request.FILES["image"]
         product.save()
+        record_stock_adjustment(product, previous_stock, nota=f"API admin: {request.user}")
         if incoming_images is not None:
             sync_product_images(product, incoming_images)
             product.refresh_from_db()
@@ -471,32 +554,26 @@ class AdminStoreConfigView(APIView):
         })
 
 from django.db.models.functions import TruncDate
-from datetime import datetime
+from datetime import date, datetime
 
 class AdminSalesCalendarView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        year = int(request.query_params.get("year", timezone.now().year))
-        month = int(request.query_params.get("month", timezone.now().month))
-        
-        qs = Order.objects.filter(
-            creado_en__year=year, 
-            creado_en__month=month,
-            status="paid"
-        )
-        
-        data = {}
-        for order in qs:
-            day_str = order.creado_en.astimezone(timezone.get_current_timezone()).strftime("%Y-%m-%d")
-            if day_str not in data:
-                data[day_str] = {"total": Decimal("0.00"), "orders": 0}
-            data[day_str]["total"] += order.total
-            data[day_str]["orders"] += 1
-            
-        for day in data:
-            data[day]["total"] = float(data[day]["total"])
-            
+        today = timezone.localdate()
+        year = int(request.query_params.get("year", today.year))
+        month = int(request.query_params.get("month", today.month))
+
+        try:
+            first_day = date(year, month, 1)
+        except ValueError:
+            return Response({"error": "Mes invalido"}, status=400)
+        next_month = date(year + month // 12, month % 12 + 1, 1)
+        rows = DailySales.objects.filter(status="paid", fecha__gte=first_day, fecha__lt=next_month)
+        data = {
+            row.fecha.strftime("%Y-%m-%d"): {"total": float(row.revenue), "orders": row.orders}
+            for row in rows
+        }
         return Response(data)
 
 class AdminDailySalesView(APIView):
@@ -508,37 +585,53 @@ class AdminDailySalesView(APIView):
         except ValueError:
             return Response({"error": "Formato de fecha invalido"}, status=400)
             
+        # Rango semiabierto del dia local: usa el indice (status, creado_en) sin convertir cada fila.
+        start, end = local_day_range(dt)
         qs = Order.objects.filter(
-            creado_en__date=dt,
-            status="paid"
-        ).prefetch_related("items", "user")
-        
+            status="paid",
+            creado_en__gte=start,
+            creado_en__lt=end,
+        ).select_related("user").prefetch_related("items__product").order_by("creado_en")
+
+        # Totales y productos salen de los mismos pedidos que se listan, no de los resumenes,
+        # asi el detalle del dia nunca muestra dos numeros distintos.
         orders_list = []
         total_day = Decimal("0.00")
+        items_day = 0
+        products = {}
         for order in qs:
             order_products = []
             for item in order.items.all():
                 qty = item.cantidad
-                unit_price = item.precio_unitario or Decimal("0.00")
+                subtotal = (item.precio_unitario or Decimal("0.00")) * qty
                 order_products.append({
                     "name": item.product_name,
                     "qty": qty,
-                    "total": float(unit_price * qty)
+                    "total": float(subtotal)
                 })
-            
+                row = products.setdefault(item.product_id, {"id": item.product_id, "name": item.product.nombre, "qty": 0, "total": Decimal("0.00")})
+                row["qty"] += qty
+                row["total"] += subtotal
+                items_day += qty
+
             orders_list.append({
                 "id": order.id,
                 "user": order.user.name if order.user else str(order.nombre),
                 "total": float(order.total),
-                "time": order.creado_en.astimezone(timezone.get_current_timezone()).strftime("%H:%M"),
+                "time": timezone.localtime(order.creado_en).strftime("%H:%M"),
                 "products": order_products
             })
             total_day += order.total
-        
+
         return Response({
             "date": date_str,
             "total": float(total_day),
-            "orders": orders_list
+            "items": items_day,
+            "orders": orders_list,
+            "products": [
+                {**row, "total": float(row["total"])}
+                for row in sorted(products.values(), key=lambda row: (-row["qty"], row["id"]))
+            ],
         })
 
 from .api_pdf import build_daily_sales_pdf
@@ -552,10 +645,12 @@ class AdminDailySalesPdfView(APIView):
         except ValueError:
             return Response({"error": "Formato de fecha invalido"}, status=400)
             
+        start, end = local_day_range(dt)
         qs = Order.objects.filter(
-            creado_en__date=dt,
-            status="paid"
-        ).prefetch_related("items")
+            status="paid",
+            creado_en__gte=start,
+            creado_en__lt=end,
+        ).select_related("user").prefetch_related("items").order_by("creado_en")
         
         pdf_bytes = build_daily_sales_pdf(date_str, qs)
         resp = HttpResponse(pdf_bytes, content_type="application/pdf")
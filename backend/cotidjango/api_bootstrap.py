@@ -0,0 +1,77 @@
+"""Arranque del frontend en un solo pedido: ``GET /api/bootstrap``.
+
+Devuelve juntos /api/store-config, /api/home-images, /api/categories-list, /api/offers y
+el usuario de /api/auth/me (``null`` si no hay sesion). La parte publica se guarda en el
+cache hasta ``BOOTSTRAP_CACHE_SECONDS`` o hasta que se cambie la configuracion, el home,
+las categorias o las ofertas. El ETag cubre esa parte y el usuario, asi un reload sin
+cambios responde 304 sin cuerpo.
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .api_common import serialize_user
+from .api_contact import build_home_images, build_store_config
+from .api_products import build_categories_list, build_offers_list
+
+
+BOOTSTRAP_VERSION_KEY = "api:bootstrap:version"
+
+
+def _digest(data):
+    raw = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode("utf-8")
+    return hashlib.md5(raw).hexdigest()
+
+
+def get_public_bootstrap(request=None):
+    """Parte publica del arranque y su digest, reutilizando el cache si esta vigente."""
+    version = cache.get_or_set(BOOTSTRAP_VERSION_KEY, uuid.uuid4().hex, None)
+    # Las URLs de imagenes subidas dependen del host con el que se pidio.
+    host = request.get_host() if request is not None else ""
+    key = f"api:bootstrap:{version}:{host}"
+    entry = cache.get(key)
+    if entry is None:
+        payload = {
+            "storeConfig": build_store_config(),
+            "homeImages": build_home_images(),
+            "categories": build_categories_list(),
+            "offers": build_offers_list(request),
+        }
+        entry = {"payload": payload, "digest": _digest(payload)}
+        cache.set(key, entry, settings.BOOTSTRAP_CACHE_SECONDS)
+    return entry
+
+
+def invalidate_public_bootstrap():
+    """Descarta la parte publica cacheada cuando se confirma la transaccion en curso."""
+    transaction.on_commit(lambda: cache.set(BOOTSTRAP_VERSION_KEY, uuid.uuid4().hex, None))
+
+
+class BootstrapView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        public = get_public_bootstrap(request)
+        user = serialize_user(request.user, request) if request.user.is_authenticated else None
+        etag = quote_etag(f"{public['digest']}-{_digest(user)}")
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({**public["payload"], "user": user})
+        response["ETag"] = etag
+        # Cada carga revalida con el ETag; la respuesta depende de la sesion o el token.
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ["Authorization", "Cookie"])
+        return response
@@ -25,9 +25,10 @@ from .api_auth import (
     AuthRegisterView,
     AuthResetPasswordView,
 )
+from .api_bootstrap import BootstrapView
 from .api_contact import HomeImagesView, StoreConfigView, SupplierContactCreateView
 from .api_orders import MyOrdersView, OrderCreateView, OrderDetailView, OrderMarkPaidView, OrderPdfView
-from .api_products import OffersListView, ProductDetailView, ProductListView
+from .api_products import OffersListView, ProductChangesView, ProductDetailView, ProductListView
 from .api_products import CategoriesListView
 
 __all__ = [
@@ -54,6 +55,7 @@ __all__ = [
     "AuthMeView",
     "AuthRegisterView",
     "AuthResetPasswordView",
+    "BootstrapView",
     "CategoriesListView",
     "HomeImagesView",
     "MyOrdersView",
@@ -62,6 +64,7 @@ __all__ = [
     "OrderDetailView",
     "OrderMarkPaidView",
     "OrderPdfView",
+    "ProductChangesView",
     "ProductDetailView",
     "ProductListView",
     "StoreConfigView",
@@ -15,8 +15,8 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.db import transaction, models
-from django.db.models import Q, Sum
-from django.db.models.functions import Coalesce
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
 from django.utils import timezone
 from django.utils.text import slugify
 from rest_framework import permissions, status
@@ -42,6 +42,18 @@ def _norm_text(value):
     return "".join(c for c in text if not unicodedata.combining(c))
 
 
+def parse_pagination(query_params, default_limit=20, max_limit=100):
+    """(page, limit) de la query; lo que no sea un numero usa el valor por defecto."""
+
+    def _int(name, default):
+        try:
+            return int(query_params.get(name) or default)
+        except (TypeError, ValueError):
+            return default
+
+    return max(1, _int("page", 1)), max(1, min(max_limit, _int("limit", default_limit)))
+
+
 def build_token(user):
     token = AccessToken.for_user(user)
     token.set_exp(from_time=timezone.now(), lifetime=timedelta(days=7))
@@ -81,7 +93,8 @@ def _verify_turnstile(token, remote_ip=""):
         return False
 
 
-def _collect_product_images(prod, request=None):
+def _product_image_sources(prod):
+    """URLs externas y rutas de archivos subidos (sin host), en orden y sin repetir."""
     out = []
     seen = set()
 
@@ -95,7 +108,7 @@ def _collect_product_images(prod, request=None):
     append(getattr(prod, "image_url", ""))
     if getattr(prod, "imagen", None):
         try:
-            append(_abs_media(request, prod.imagen.url))
+            append(prod.imagen.url)
         except Exception:
             pass
 
@@ -110,12 +123,31 @@ def _collect_product_images(prod, request=None):
         append(getattr(img, "image_url", ""))
         if getattr(img, "image", None):
             try:
-                append(_abs_media(request, img.image.url))
+                append(img.image.url)
             except Exception:
                 pass
     return out
 
 
+def _absolute_images(sources, request=None):
+    out = []
+    seen = set()
+    for source in sources:
+        if not str(source).startswith("http"):
+            # Sin request no hay host para los archivos subidos.
+            if request is None:
+                continue
+            source = _abs_media(request, source)
+        if source not in seen:
+            seen.add(source)
+            out.append(source)
+    return out
+
+
+def _collect_product_images(prod, request=None):
+    return _absolute_images(_product_image_sources(prod), request)
+
+
 def serialize_user(user, request=None):
     display_name = user.get_display_name() if hasattr(user, "get_display_name") else (user.name or user.username)
     missing_profile_fields = user.get_missing_profile_fields() if hasattr(user, "get_missing_profile_fields") else []
@@ -174,9 +206,8 @@ def serialize_category(cat):
     }
 
 
-def serialize_product(prod, request=None):
-    images = _collect_product_images(prod, request)
-    discount = resolve_discount_for_product(prod)
+def build_product_document(prod, discount):
+    """Lo de ``serialize_product`` que no depende del pedido: imagenes sin host y el descuento dado."""
     final_price = discount["final_price"] if discount else prod.precio
     return {
         "_id": prod.id,
@@ -185,11 +216,11 @@ def serialize_product(prod, request=None):
         "name": prod.nombre,
         "price": float(final_price),
         "priceOriginal": float(prod.precio),
-        "imageUrl": images[0] if images else None,
+        "imageUrl": None,
         "videoUrl": prod.video_url or "",
         "discount": discount["meta"] if discount else None,
         "description": prod.descripcion or "",
-        "images": images,
+        "images": _product_image_sources(prod),
         "attributes": prod.atributos or {},
         "attributes_stock": prod.atributos_stock or {},
         "attributes_price": prod.atributos_precio or {},
@@ -197,28 +228,80 @@ def serialize_product(prod, request=None):
         "category": serialize_category(prod.categoria),
         "stock": prod.stock,
         "sin_stock": prod.sin_stock,
+        "controla_stock": prod.controla_stock,
         "active": prod.activo,
         "createdAt": prod.creado_en.isoformat() if prod.creado_en else None,
-        "updatedAt": None,
+        "updatedAt": prod.actualizado_en.isoformat() if prod.actualizado_en else None,
     }
 
 
-def serialize_order(order, request=None):
-    status_labels = {
-        "created": "Creado",
-        "approved": "Aprobado",
-        "pending_payment": "Falta pago",
-        "paid": "Pagado",
-        "shipped": "Enviado",
-        "delivered": "Entregado",
-        "cancelled": "Cancelado",
-        "draft": "Borrador",
+def render_product_document(data, request=None):
+    images = _absolute_images(data["images"], request)
+    return {**data, "imageUrl": images[0] if images else None, "images": images}
+
+
+def serialize_product(prod, request=None):
+    return render_product_document(build_product_document(prod, resolve_discount_for_product(prod)), request)
+
+
+ORDER_STATUS_LABELS = {
+    "created": "Creado",
+    "approved": "Aprobado",
+    "pending_payment": "Falta pago",
+    "paid": "Pagado",
+    "shipped": "Enviado",
+    "delivered": "Entregado",
+    "cancelled": "Cancelado",
+    "draft": "Borrador",
+}
+
+ORDER_SUMMARY_FIELDS = ("id", "user_id", "nombre", "email", "ciudad", "status", "envio", "total", "creado_en")
+
+
+def order_summary_queryset(queryset=None):
+    """Pedidos con lo justo para un listado: cantidades y cliente salen de anotaciones."""
+    queryset = Order.objects.all() if queryset is None else queryset
+    full_name = Trim(Concat("user__first_name", Value(" "), "user__last_name"))
+    return queryset.only(*ORDER_SUMMARY_FIELDS).annotate(
+        item_count=Coalesce(Sum("items__cantidad"), 0),
+        line_count=Count("items"),
+        customer_name=Coalesce(
+            NullIf(full_name, Value("")),
+            NullIf("user__name", Value("")),
+            "nombre",
+        ),
+    )
+
+
+def serialize_order_summary(order):
+    return {
+        "_id": order.id,
+        "id": order.id,
+        "userId": order.user_id,
+        "customer": {
+            "name": order.customer_name or order.nombre,
+            "email": order.email,
+            "city": order.ciudad,
+        },
+        "totals": {
+            "items": order.item_count,
+            "lines": order.line_count,
+            "shipping": float(order.envio or 0),
+            "amount": float(order.total or 0),
+        },
+        "status": order.status,
+        "status_label": ORDER_STATUS_LABELS.get(order.status, order.status),
+        "createdAt": order.creado_en.isoformat() if order.creado_en else None,
     }
+
+
+def serialize_order(order, request=None):
     items = []
     for item in order.items.all():
         attrs = item.atributos or {}
         attrs_label = _order_item_attrs_label(attrs)
         items.append({
+            "itemId": item.id,
             "productId": item.product_id,
             "name": _order_item_name(item) + attrs_label,
             "price": float(item.precio_unitario),
@@ -238,7 +321,7 @@ def serialize_order(order, request=None):
         "items": items,
         "totals": totals,
         "status": order.status,
-        "status_label": status_labels.get(order.status, order.status),
+        "status_label": ORDER_STATUS_LABELS.get(order.status, order.status),
         "shipping": {
             "name": order.nombre,
             "address": order.direccion,
@@ -383,13 +466,27 @@ def get_ancestor_ids(category):
     return out
 
 
-def resolve_product(value):
+def resolve_product(value, queryset=None):
     if not value:
         return None
+    products = queryset if queryset is not None else Product.objects.select_related("categoria")
     try:
-        return Product.objects.get(pk=value)
+        return products.get(pk=value)
     except Exception:
-        return Product.objects.filter(slug=value).first()
+        return products.filter(slug=value).first()
+
+
+def resolve_products(values):
+    """``resolve_product`` para varios ids o slugs a la vez; devuelve {str(valor): producto}."""
+    values = {str(value).strip() for value in values if value not in (None, "")}
+    products = Product.objects.select_related("categoria")
+    by_id = products.in_bulk({int(value) for value in values if value.isdigit()})
+    resolved = {value: by_id[int(value)] for value in values if value.isdigit() and int(value) in by_id}
+    pending = values - set(resolved)
+    if pending:
+        for product in products.filter(slug__in=pending):
+            resolved[product.slug] = product
+    return resolved
 
 
 def parse_image_urls_payload(raw_value):
@@ -466,6 +563,10 @@ def resolve_discount_for_product(product: Product):
             ).filter(*active_window).order_by("-porcentaje").first()
         offer = category_offer
 
+    return discount_from_offer(product, offer)
+
+
+def discount_from_offer(product, offer):
     if not offer:
         return None
     base_price = product.precio if isinstance(product.precio, Decimal) else Decimal(str(product.precio or "0"))
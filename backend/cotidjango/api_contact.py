@@ -11,32 +11,40 @@ from products.models import HomeImage, HomeMarquee, StoreSettings, SupplierConta
 from .api_common import _verify_turnstile, serialize_home_image, serialize_home_marquee
 
 
+def build_home_images():
+    qs = HomeImage.objects.filter(activo=True).order_by("section", "order", "id")
+    items = [serialize_home_image(x) for x in qs]
+    by_key_image = {x["key"]: x["imageUrl"] for x in items}
+    by_key_target = {x["key"]: x["targetUrl"] for x in items if x.get("targetUrl")}
+    marquee = HomeMarquee.objects.order_by("-id").first()
+    return {
+        "items": items,
+        "byKey": by_key_image,
+        "byKeyTarget": by_key_target,
+        "marquee": serialize_home_marquee(marquee),
+    }
+
+
+def build_store_config():
+    settings_row = StoreSettings.get_solo()
+    return {
+        "minOrderAmount": float(settings_row.min_order_amount),
+        "showPricesToGuests": settings_row.mostrar_precios_invitados,
+    }
+
+
 class HomeImagesView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        qs = HomeImage.objects.filter(activo=True).order_by("section", "order", "id")
-        items = [serialize_home_image(x) for x in qs]
-        by_key_image = {x["key"]: x["imageUrl"] for x in items}
-        by_key_target = {x["key"]: x["targetUrl"] for x in items if x.get("targetUrl")}
-        marquee = HomeMarquee.objects.order_by("-id").first()
-        return Response({
-            "items": items,
-            "byKey": by_key_image,
-            "byKeyTarget": by_key_target,
-            "marquee": serialize_home_marquee(marquee),
-        })
+        return Response(build_home_images())
 
 
 class StoreConfigView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        settings_row = StoreSettings.get_solo()
-        return Response({
-            "minOrderAmount": float(settings_row.min_order_amount),
-            "showPricesToGuests": settings_row.mostrar_precios_invitados,
-        })
+        return Response(build_store_config())
 
 
 class SupplierContactCreateView(APIView):
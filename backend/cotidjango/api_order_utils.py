@@ -1,5 +1,7 @@
 from decimal import Decimal
 
+from orders.models import SortKeyOrder
+
 
 def order_item_name(item):
     if getattr(item, "product_name", ""):
@@ -9,6 +11,11 @@ def order_item_name(item):
     return "Producto"
 
 
+def sorted_order_items(order):
+    """Items del pedido en el orden de los remitos: ``sort_key`` byte a byte y luego id."""
+    return order.items.select_related("product").order_by(SortKeyOrder().asc(), "pk")
+
+
 def order_item_attrs_label(attrs, prefix=" (", separator="; ", suffix=")"):
     if not isinstance(attrs, dict) or not attrs:
         return ""
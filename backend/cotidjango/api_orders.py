@@ -1,15 +1,70 @@
+import hashlib
+import json
+from datetime import timedelta
 from decimal import Decimal
+from math import ceil
 
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
+from django.utils import timezone
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from orders.models import Order, OrderItem
+from orders.models import Order, OrderIdempotencyKey, OrderItem
+from orders.stock import StockInsuficiente, reserve_order_stock
 from products.models import StoreSettings
-from .api_common import build_invoice_pdf, resolve_product, send_admin_order_email, send_invoice_email, serialize_order
+from .api_common import (
+    build_invoice_pdf,
+    order_summary_queryset,
+    parse_pagination,
+    resolve_product,
+    send_admin_order_email,
+    send_invoice_email,
+    serialize_order,
+    serialize_order_summary,
+)
 from .api_order_utils import build_order_item_input
+from .api_overview import invalidate_admin_overview
+
+
+def _idempotency_cutoff():
+    return timezone.now() - timedelta(seconds=settings.ORDER_IDEMPOTENCY_WINDOW_SECONDS)
+
+
+def _idempotency_request_hash(data):
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _idempotent_replay(entry, request_hash):
+    """Respuesta para una clave ya usada: la original, o un error si no se puede repetir."""
+    if entry.request_hash != request_hash:
+        return Response(
+            {"error": "La clave de idempotencia ya se uso con otro pedido"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if entry.response_status is None:
+        return Response({"error": "El pedido se esta procesando"}, status=status.HTTP_409_CONFLICT)
+    response = Response(entry.response_body, status=entry.response_status)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim_idempotency_key(user, key, request_hash):
+    """Reserva la clave en la transaccion en curso: devuelve (clave, None) o (None, respuesta).
+
+    Dos pedidos simultaneos con la misma clave chocan en la restriccion unica; el segundo
+    espera a que el primero confirme y repite su respuesta.
+    """
+    OrderIdempotencyKey.objects.filter(user=user, creado_en__lt=_idempotency_cutoff()).delete()
+    try:
+        with transaction.atomic():
+            return OrderIdempotencyKey.objects.create(user=user, key=key, request_hash=request_hash), None
+    except IntegrityError:
+        entry = OrderIdempotencyKey.objects.get(user=user, key=key)
+    return None, _idempotent_replay(entry, request_hash)
 
 
 def _get_order_for_user(user, pk):
@@ -25,6 +80,18 @@ class OrderCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        idempotency_key = (request.headers.get("Idempotency-Key") or "").strip()
+        request_hash = ""
+        if idempotency_key:
+            if len(idempotency_key) > 255:
+                return Response({"error": "Idempotency-Key demasiado larga"}, status=status.HTTP_400_BAD_REQUEST)
+            request_hash = _idempotency_request_hash(request.data)
+            previous = OrderIdempotencyKey.objects.filter(
+                user=request.user, key=idempotency_key, creado_en__gte=_idempotency_cutoff(),
+            ).first()
+            if previous:
+                return _idempotent_replay(previous, request_hash)
+
         raw_items = request.data.get("items") or []
         shipping = request.data.get("shipping") or {}
         note = (request.data.get("note") or request.data.get("nota") or "").strip()
@@ -67,6 +134,11 @@ class OrderCreateView(APIView):
             )
 
         with transaction.atomic():
+            claim = None
+            if idempotency_key:
+                claim, replay = _claim_idempotency_key(request.user, idempotency_key, request_hash)
+                if replay:
+                    return replay
             order = Order.objects.create(
                 user=request.user,
                 nombre=shipping.get("name") or request.user.name or request.user.username,
@@ -81,21 +153,34 @@ class OrderCreateView(APIView):
                 envio=request.user.shipping_quote_amount or Decimal("0.00"),
                 total=Decimal("0.00"),
             )
+            order_items = []
             for item in built_items:
                 if item["product"] is None:
                     transaction.set_rollback(True)
                     return Response({"error": "Producto no encontrado"}, status=status.HTTP_400_BAD_REQUEST)
-                OrderItem.objects.create(
+                order_items.append(OrderItem.objects.create(
                     order=order,
                     product=item["product"],
                     product_name=item["name"],
                     cantidad=item["qty"],
                     precio_unitario=item["price"],
                     atributos=item.get("attrs") or {},
-                )
+                ))
+            try:
+                reserve_order_stock(order, order_items)
+            except StockInsuficiente as exc:
+                transaction.set_rollback(True)
+                return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
             order.recalc_total()
+            invalidate_admin_overview()
+            order = Order.objects.prefetch_related("items__product").select_related("user").get(pk=order.pk)
+            body = {"order": serialize_order(order, request)}
+            if claim:
+                claim.order = order
+                claim.response_status = status.HTTP_201_CREATED
+                claim.response_body = body
+                claim.save(update_fields=["order", "response_status", "response_body"])
 
-        order = Order.objects.prefetch_related("items__product").select_related("user").get(pk=order.pk)
         try:
             send_invoice_email(order, request)
         except Exception:
@@ -104,15 +189,27 @@ class OrderCreateView(APIView):
             send_admin_order_email(order, request)
         except Exception:
             pass
-        return Response({"order": serialize_order(order, request)}, status=status.HTTP_201_CREATED)
+        return Response(body, status=status.HTTP_201_CREATED)
 
 
 class MyOrdersView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        qs = Order.objects.filter(user=request.user).prefetch_related("items__product").order_by("-creado_en")
-        return Response({"orders": [serialize_order(o, request) for o in qs]})
+        qs = Order.objects.filter(user=request.user).order_by("-creado_en")
+        if "page" not in request.query_params and "limit" not in request.query_params:
+            # Forma original para los clientes que no paginan: todos los pedidos completos.
+            return Response({"orders": [serialize_order(o, request) for o in qs.prefetch_related("items__product")]})
+        page, limit = parse_pagination(request.query_params)
+        total = qs.count()
+        orders = order_summary_queryset(qs)[(page - 1) * limit:(page - 1) * limit + limit]
+        # Resumenes paginados en "items"; el detalle completo queda para /api/orders/<id>.
+        return Response({
+            "items": [serialize_order_summary(o) for o in orders],
+            "total": total,
+            "page": page,
+            "pages": ceil(total / limit) if total else 1,
+        })
 
 
 class OrderDetailView(APIView):
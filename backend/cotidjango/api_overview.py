@@ -0,0 +1,135 @@
+"""Metricas del panel admin con cache y refresco en segundo plano.
+
+El resumen se guarda en el cache de Django. Mientras tiene menos de
+``ADMIN_OVERVIEW_CACHE_SECONDS`` se sirve tal cual; despues, y hasta
+``ADMIN_OVERVIEW_STALE_SECONDS``, se sirve el valor viejo y un solo hilo lo recalcula
+(stale-while-revalidate). Un pedido nuevo lo invalida.
+
+El resumen se arma sin request (el hilo de fondo no debe tocar el de otro pedido) y
+guarda las rutas de los avatares; ``get_admin_overview`` las vuelve absolutas con el
+host de cada pedido.
+
+Con el ``LocMemCache`` por defecto el cache, el lock del recalculo y la invalidacion son
+de cada proceso: con varios workers de gunicorn cada uno recalcula el suyo y un pedido
+nuevo solo invalida el del worker que lo recibio; los demas lo ven a lo sumo
+``ADMIN_OVERVIEW_CACHE_SECONDS`` tarde. Con un cache compartido (Redis, Memcached) los
+tres pasan a valer para todos.
+"""
+
+import copy
+
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from orders.models import DailySales, Order
+from orders.sales import SALES_STATUSES
+from products.models import Category, Product
+from .api_common import User, _abs_media, serialize_order, serialize_user
+
+
+ADMIN_OVERVIEW_CACHE_KEY = "api:admin-overview"
+ADMIN_OVERVIEW_LOCK_KEY = "api:admin-overview:refreshing"
+ADMIN_OVERVIEW_LOCK_SECONDS = 60
+
+
+def build_admin_overview():
+    counts = {
+        "users": User.objects.count(),
+        "products": Product.objects.filter(activo=True).count(),
+        "categories": Category.objects.count(),
+        "orders": Order.objects.count(),
+    }
+    since = timezone.localdate() - timedelta(days=29)
+    recent = DailySales.objects.filter(fecha__gte=since, status__in=SALES_STATUSES).aggregate(
+        revenue=Sum("revenue"),
+        orders=Sum("orders"),
+        items=Sum("items"),
+    )
+    last_orders = Order.objects.prefetch_related("items__product").select_related("user").order_by("-creado_en")[:5]
+    pending_orders = Order.objects.filter(status="created").prefetch_related("items__product").select_related("user").order_by("-creado_en")[:5]
+    recent_users = User.objects.order_by("-date_joined")[:5]
+    return {
+        "counts": counts,
+        "last30d": {
+            "revenue": float(recent["revenue"] or 0),
+            "orders": recent["orders"] or 0,
+            "items": recent["items"] or 0,
+        },
+        "lastOrders": [_overview_order(o) for o in last_orders],
+        "pendingOrders": [_overview_order(o) for o in pending_orders],
+        "recentUsers": [_overview_user(u) for u in recent_users],
+    }
+
+
+def _overview_order(order):
+    data = serialize_order(order)
+    _with_avatar_path(data["user"], order.user)
+    return data
+
+
+def _overview_user(user):
+    return _with_avatar_path(serialize_user(user), user)
+
+
+def _with_avatar_path(data, user):
+    """Deja en ``avatar`` la ruta sin host; ``_absolute_urls`` la completa al responder."""
+    if data is not None:
+        data["profile"]["avatar"] = user.avatar.url if user.avatar else None
+    return data
+
+
+def _absolute_urls(payload, request):
+    payload = copy.deepcopy(payload)
+    users = [order["user"] for key in ("lastOrders", "pendingOrders") for order in payload[key]]
+    for user in users + payload["recentUsers"]:
+        if user and user["profile"]["avatar"]:
+            user["profile"]["avatar"] = _abs_media(request, user["profile"]["avatar"]) if request else None
+    return payload
+
+
+def refresh_admin_overview():
+    payload = build_admin_overview()
+    cache.set(
+        ADMIN_OVERVIEW_CACHE_KEY,
+        {"payload": payload, "computed_at": time.time()},
+        settings.ADMIN_OVERVIEW_STALE_SECONDS,
+    )
+    return payload
+
+
+def get_admin_overview(request=None):
+    entry = cache.get(ADMIN_OVERVIEW_CACHE_KEY)
+    if entry is None:
+        return _absolute_urls(refresh_admin_overview(), request)
+    if time.time() - entry["computed_at"] > settings.ADMIN_OVERVIEW_CACHE_SECONDS:
+        # Solo el primero que lo ve vencido lanza el recalculo; el resto sigue con el valor viejo.
+        if cache.add(ADMIN_OVERVIEW_LOCK_KEY, True, ADMIN_OVERVIEW_LOCK_SECONDS):
+            start_admin_overview_refresh()
+    return _absolute_urls(entry["payload"], request)
+
+
+def start_admin_overview_refresh():
+    threading.Thread(target=_refresh_admin_overview_thread, daemon=True).start()
+
+
+def _refresh_admin_overview_thread():
+    try:
+        refresh_admin_overview()
+    finally:
+        cache.delete(ADMIN_OVERVIEW_LOCK_KEY)
+        connection.close()
+
+
+def invalidate_admin_overview():
+    """Descarta el resumen cacheado cuando se confirma la transaccion en curso.
+
+    Con ``LocMemCache`` solo lo descarta en este proceso (ver el docstring del modulo).
+    """
+    transaction.on_commit(lambda: cache.delete(ADMIN_OVERVIEW_CACHE_KEY))
@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 from django.conf import settings
-from .api_order_utils import order_item_attrs_label, order_item_name
+from .api_order_utils import order_item_attrs_label, order_item_name, sorted_order_items
 
 def _invoice_logo_path():
     explicit_logo = getattr(settings, "INVOICE_LOGO_PATH", "") or os.getenv("INVOICE_LOGO_PATH", "")
@@ -170,33 +170,10 @@ def build_invoice_pdf(order) -> bytes:
     canvas_obj.drawRightString(x_right - 6, y - 15, "Total")
     y -= row_h
 
-    import re
-    items = list(order.items.all())
-    
-    def sort_key(item):
-        has_sku = 1
-        sku_sort = []
-        cat_name = "zzzzz"
-        prod_name = ""
-        
-        if item.product:
-            sku = (item.product.sku or "").strip()
-            if sku:
-                has_sku = 0
-                # Split strings and numbers for natural sorting (e.g., 2 comes before 10)
-                sku_sort = [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', sku)]
-                
-            if item.product.categoria and item.product.categoria.nombre:
-                cat_name = item.product.categoria.nombre.lower()
-                
-            prod_name = (item.product.nombre or "").lower()
-            
-        return (has_sku, cat_name, sku_sort, prod_name)
-    
-    items.sort(key=sort_key)
+    items = sorted_order_items(order)
 
     for item in items:
-        sku_val = getattr(item.product, "sku", "").strip() if item.product else ""
+        sku_val = item.product_sku or (getattr(item.product, "sku", "").strip() if item.product else "")
         desc = f"{order_item_name(item)}{_attrs_label(item.atributos)}"
         
         desc_lines = _wrap_text(desc, x_right - 140 - (x_left + 115), font_regular, 9)
@@ -269,7 +246,6 @@ def build_stock_request_pdf(order) -> bytes:
     from reportlab.pdfbase import pdfmetrics
     from reportlab.pdfbase.ttfonts import TTFont
     from reportlab.pdfgen import canvas
-    import re
 
     def _attrs_label(attrs):
         return order_item_attrs_label(attrs, prefix=" - ", separator=" | ", suffix="")
@@ -371,31 +347,10 @@ def build_stock_request_pdf(order) -> bytes:
     canvas_obj.drawString(x_left + 115, y - 15, "Descripción")
     y -= row_h
 
-    items = list(order.items.all())
-    
-    def sort_key(item):
-        has_sku = 1
-        sku_sort = []
-        cat_name = "zzzzz"
-        prod_name = ""
-        
-        if item.product:
-            sku = (item.product.sku or "").strip()
-            if sku:
-                has_sku = 0
-                sku_sort = [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', sku)]
-                
-            if item.product.categoria and item.product.categoria.nombre:
-                cat_name = item.product.categoria.nombre.lower()
-                
-            prod_name = (item.product.nombre or "").lower()
-            
-        return (has_sku, cat_name, sku_sort, prod_name)
-    
-    items.sort(key=sort_key)
+    items = sorted_order_items(order)
 
     for item in items:
-        sku_val = getattr(item.product, "sku", "").strip() if item.product else ""
+        sku_val = item.product_sku or (getattr(item.product, "sku", "").strip() if item.product else "")
         desc = f"{order_item_name(item)}{_attrs_label(item.atributos)}"
         
         desc_lines = _wrap_text(desc, x_right - (x_left + 115) - 5, font_regular, 9)
@@ -1,20 +1,23 @@
+import re
 from math import ceil
 
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import Count, Q, Sum
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from products.models import Category, Offer, Product
+from products.changes import PRODUCT_CHANGES_DEFAULT_LIMIT, PRODUCT_CHANGES_MAX_LIMIT, product_changes
+from products.documents import product_documents
+from products.models import Category, Offer, Product, ProductVariant
 from .api_common import (
     build_category_path_name,
     build_category_path_slug,
     _norm_text,
     get_descendant_ids,
-    resolve_discount_for_product,
+    parse_pagination,
     resolve_category_reference,
     resolve_product,
     serialize_category,
@@ -22,6 +25,7 @@ from .api_common import (
 )
 
 OFFERS_CATEGORY_SLUG = "ofertas"
+ATTRIBUTE_FILTER_RE = re.compile(r"^attr\[(.+)\]$")
 
 
 def _is_offers_root_category(category):
@@ -30,35 +34,106 @@ def _is_offers_root_category(category):
     return not category.parent_id and (_norm_text(category.nombre) == OFFERS_CATEGORY_SLUG or (category.slug or "") == OFFERS_CATEGORY_SLUG)
 
 
+def _parse_attribute_filters(query_params):
+    """Lee ``?attr[Color]=Rojo&attr[Color]=Azul&attr[Talle]=M`` como {"Color": [...], "Talle": [...]}."""
+    filters = {}
+    for key, values in query_params.lists():
+        match = ATTRIBUTE_FILTER_RE.match(key)
+        if not match:
+            continue
+        cleaned = [value.strip() for raw in values for value in raw.split(",") if value.strip()]
+        if cleaned:
+            filters[match.group(1).strip()] = cleaned
+    return filters
+
+
+def _filter_by_attributes(qs, filters, skip=None):
+    # Valores del mismo atributo se suman (O); atributos distintos se combinan (Y).
+    for name, values in filters.items():
+        if name == skip:
+            continue
+        qs = qs.filter(pk__in=ProductVariant.objects.filter(atributo=name, valor__in=values, disponible=True).values("product_id"))
+    return qs
+
+
+def _attribute_facets(qs, filters):
+    """Cantidad de productos por atributo y valor; cada atributo ignora su propio filtro."""
+    counts = {}
+    for skip in [None, *filters]:
+        rows = (
+            ProductVariant.objects.filter(
+                product_id__in=_filter_by_attributes(qs, filters, skip=skip).order_by().values("pk"),
+                disponible=True,
+            )
+            .values("atributo", "valor")
+            .annotate(total=Count("product_id", distinct=True))
+            .order_by()
+        )
+        if skip is not None:
+            rows = rows.filter(atributo=skip)
+        for row in rows:
+            if skip is None and row["atributo"] in filters:
+                continue
+            counts.setdefault(row["atributo"], []).append({"value": row["valor"], "count": row["total"]})
+    return [
+        {"name": name, "values": sorted(values, key=lambda item: (-item["count"], item["value"]))}
+        for name, values in sorted(counts.items())
+    ]
+
+
+def build_categories_list():
+    items = Category.objects.select_related("parent").all().order_by("nombre", "id")
+    if not any(_is_offers_root_category(cat) for cat in items):
+        virtual_offers = {
+            "id": None,
+            "nombre": "Ofertas",
+            "slug": OFFERS_CATEGORY_SLUG,
+            "path_name": "Ofertas",
+            "path_slug": OFFERS_CATEGORY_SLUG,
+            "descripcion": "",
+            "parent": None,
+        }
+    else:
+        virtual_offers = None
+    data = [{
+        "id": cat.id,
+        "nombre": cat.nombre,
+        "slug": cat.slug,
+        "path_name": build_category_path_name(cat),
+        "path_slug": build_category_path_slug(cat),
+        "descripcion": cat.descripcion or "",
+        "parent": cat.parent_id,
+    } for cat in items]
+    if virtual_offers:
+        data.append(virtual_offers)
+    return {"items": data}
+
+
+def build_offers_list(request=None):
+    now = timezone.now()
+    offers = Offer.objects.filter(activo=True).filter(
+        models.Q(empieza__isnull=True) | models.Q(empieza__lte=now),
+        models.Q(termina__isnull=True) | models.Q(termina__gte=now),
+    ).order_by("-porcentaje")
+    data = [{
+        "id": off.id,
+        "slug": off.slug,
+        "name": off.nombre,
+        "description": off.descripcion,
+        "percent": float(off.porcentaje),
+        "product": serialize_product(off.producto, request) if off.producto else None,
+        "category": serialize_category(off.categoria),
+        "starts": off.empieza.isoformat() if off.empieza else None,
+        "ends": off.termina.isoformat() if off.termina else None,
+    } for off in offers]
+    return {"items": data}
+
+
 class CategoriesListView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        items = Category.objects.select_related("parent").all().order_by("nombre", "id")
-        if not any(_is_offers_root_category(cat) for cat in items):
-            virtual_offers = {
-                "id": None,
-                "nombre": "Ofertas",
-                "slug": OFFERS_CATEGORY_SLUG,
-                "path_name": "Ofertas",
-                "path_slug": OFFERS_CATEGORY_SLUG,
-                "descripcion": "",
-                "parent": None,
-            }
-        else:
-            virtual_offers = None
-        data = [{
-            "id": cat.id,
-            "nombre": cat.nombre,
-            "slug": cat.slug,
-            "path_name": build_category_path_name(cat),
-            "path_slug": build_category_path_slug(cat),
-            "descripcion": cat.descripcion or "",
-            "parent": cat.parent_id,
-        } for cat in items]
-        if virtual_offers:
-            data.append(virtual_offers)
-        return Response({"items": data})
+        return Response(build_categories_list())
 
 
 class ProductListView(APIView):
@@ -70,11 +145,12 @@ class ProductListView(APIView):
         category_id = request.query_params.get("category_id")
         include_inactive = str(request.query_params.get("all") or "").lower() in {"1", "true", "yes", "si", "s"}
         sort = (request.query_params.get("sort") or "").strip().lower()
-        page = max(1, int(request.query_params.get("page") or 1))
-        limit = max(1, min(100, int(request.query_params.get("limit") or 20)))
+        page, limit = parse_pagination(request.query_params)
+        attribute_filters = _parse_attribute_filters(request.query_params)
+        with_facets = str(request.query_params.get("facets") or "").lower() in {"1", "true", "yes", "si", "s"}
         offers_filter = False
 
-        qs = Product.objects.select_related("categoria").prefetch_related("extra_images")
+        qs = Product.objects.select_related("document")
         if not include_inactive:
             qs = qs.filter(activo=True)
         if q:
@@ -118,6 +194,8 @@ class ProductListView(APIView):
             elif _norm_text(category) == OFFERS_CATEGORY_SLUG:
                 offers_filter = True
 
+        facet_base = qs
+        qs = _filter_by_attributes(qs, attribute_filters)
         if sort in {"mas_vendidos", "relevancia"}:
             qs = qs.annotate(sold=Coalesce(Sum("order_items__cantidad"), 0)).order_by("-sold", "-creado_en")
         elif sort == "precio_asc":
@@ -132,43 +210,51 @@ class ProductListView(APIView):
             qs = qs.order_by("-creado_en")
 
         if offers_filter:
-            discounted_items = [product for product in qs if resolve_discount_for_product(product)]
+            # El descuento vigente ya esta en el documento de cada producto.
+            discounted_items = [item for item in product_documents(qs, request) if item["discount"]]
             total = len(discounted_items)
             items = discounted_items[(page - 1) * limit:(page - 1) * limit + limit]
         else:
             total = qs.count()
-            items = qs[(page - 1) * limit:(page - 1) * limit + limit]
-        return Response({"items": [serialize_product(p, request) for p in items], "total": total, "page": page, "pages": ceil(total / limit) if total else 1})
+            items = product_documents(qs[(page - 1) * limit:(page - 1) * limit + limit], request)
+        data = {"items": items, "total": total, "page": page, "pages": ceil(total / limit) if total else 1}
+        if with_facets:
+            if offers_filter:
+                facet_base = Product.objects.filter(
+                    pk__in=[item["id"] for item in product_documents(facet_base, request) if item["discount"]]
+                )
+            data["facets"] = _attribute_facets(facet_base, attribute_filters)
+        return Response(data)
+
+
+class ProductChangesView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit") or PRODUCT_CHANGES_DEFAULT_LIMIT)
+        except ValueError:
+            return Response({"error": "Parametro limit invalido"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(PRODUCT_CHANGES_MAX_LIMIT, limit))
+        try:
+            data = product_changes(request.query_params.get("since") or "", limit=limit)
+        except ValueError:
+            return Response({"error": "Parametro since invalido"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
 
 
 class ProductDetailView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, pk):
-        prod = resolve_product(pk)
+        prod = resolve_product(pk, Product.objects.select_related("document"))
         if not prod:
             return Response({"error": "Producto no encontrado"}, status=status.HTTP_404_NOT_FOUND)
-        return Response(serialize_product(prod, request))
+        return Response(product_documents([prod], request)[0])
 
 
 class OffersListView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        now = timezone.now()
-        offers = Offer.objects.filter(activo=True).filter(
-            models.Q(empieza__isnull=True) | models.Q(empieza__lte=now),
-            models.Q(termina__isnull=True) | models.Q(termina__gte=now),
-        ).order_by("-porcentaje")
-        data = [{
-            "id": off.id,
-            "slug": off.slug,
-            "name": off.nombre,
-            "description": off.descripcion,
-            "percent": float(off.porcentaje),
-            "product": serialize_product(off.producto, request) if off.producto else None,
-            "category": serialize_category(off.categoria),
-            "starts": off.empieza.isoformat() if off.empieza else None,
-            "ends": off.termina.isoformat() if off.termina else None,
-        } for off in offers]
-        return Response({"items": data})
+        return Response(build_offers_list(request))
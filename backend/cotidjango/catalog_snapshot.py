@@ -0,0 +1,293 @@
+"""Snapshot estatico del catalogo publico para servir sin pasar por Django ni la DB.
+
+``build_catalog_snapshot`` arma, con las mismas vistas de la API, la lista de categorias,
+los datos del home, las ofertas y las primeras paginas de productos de cada categoria. Los
+deja como JSON (con ``.gz`` y ``.br``) en ``CATALOG_SNAPSHOT_ROOT``; el middleware
+``CatalogSnapshotMiddleware`` los sirve con WhiteNoise bajo ``CATALOG_SNAPSHOT_URL``. Si un
+archivo falta, el frontend vuelve a la API en vivo.
+
+Una vez publicado se regenera en segundo plano despues de cada importacion de catalogo.
+Las ediciones sueltas del admin no lo regeneran: ``manifest.json`` guarda en
+``validUntil`` el proximo inicio o fin de una oferta y, a partir de ese momento, el
+middleware deja de servir el snapshot y pide uno nuevo. Un lock de archivo junto a
+``CATALOG_SNAPSHOT_ROOT`` hace que los workers armen de a uno y no borren la version
+que publico otro; el que espera no vuelve a armar si otro ya lo hizo despues de su pedido.
+
+Estructura::
+
+    manifest.json                    version, fecha y paginas por categoria
+    categories.json                  = /api/categories-list
+    home-images.json                 = /api/home-images
+    store-config.json                = /api/store-config
+    offers.json                      = /api/offers
+    products/<pagina>.json           = /api/products?page=<pagina>
+    products/<path_slug>/<pagina>.json = /api/products?category=<path_slug>&page=<pagina>
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Min, Q
+from django.test import RequestFactory
+from django.utils import timezone
+from whitenoise.compress import Compressor
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from products.models import Category, Offer
+from .api_common import build_category_path_slug
+from .api_contact import HomeImagesView, StoreConfigView
+from .api_products import OFFERS_CATEGORY_SLUG, CategoriesListView, OffersListView, ProductListView
+
+
+CATALOG_SNAPSHOT_PAGE_SIZE = 20
+CATALOG_SNAPSHOT_LOCK_KEY = "catalog-snapshot:building"
+CATALOG_SNAPSHOT_DIRTY_KEY = "catalog-snapshot:dirty"
+CATALOG_SNAPSHOT_LOCK_SECONDS = 30 * 60
+# Espera antes de armar: pedidos seguidos (importaciones, vencimientos) arman un solo snapshot.
+CATALOG_SNAPSHOT_DEBOUNCE_SECONDS = 5
+
+_deferred = threading.local()
+
+
+def _default_base_url():
+    host = next((host for host in settings.ALLOWED_HOSTS if host and "*" not in host and not host.startswith(".")), "localhost")
+    return f"{'http' if settings.DEBUG else 'https'}://{host}"
+
+
+class CatalogSnapshotBuilder:
+    def __init__(self, *, root=None, pages=None, base_url=None):
+        self.root = Path(root or settings.CATALOG_SNAPSHOT_ROOT)
+        self.pages = settings.CATALOG_SNAPSHOT_PAGES if pages is None else max(0, int(pages))
+        parsed = urlsplit(base_url or settings.CATALOG_SNAPSHOT_BASE_URL or _default_base_url())
+        # Las URLs absolutas de imagenes subidas salen de este host, como en la API.
+        self.factory = RequestFactory(HTTP_HOST=parsed.netloc)
+        self.secure = parsed.scheme == "https"
+        self.compressor = Compressor(quiet=True)
+        self.files = 0
+
+    def build(self, *, unless_built_since=None):
+        """Escribe el snapshot en una carpeta nueva y la publica reemplazando la anterior.
+
+        Con ``unless_built_since`` no hace nada (devuelve ``None``) si la version publicada
+        empezo a armarse despues de ese momento.
+        """
+        with self._build_lock():
+            if unless_built_since is not None:
+                generated_at = self._published_generated_at()
+                if generated_at is not None and generated_at >= unless_built_since:
+                    return None
+            staging = self.root.with_name(f"{self.root.name}.tmp-{uuid.uuid4().hex[:8]}")
+            staging.mkdir(parents=True)
+            try:
+                manifest = self._write_all(staging)
+                self._publish(staging)
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            return manifest
+
+    @contextmanager
+    def _build_lock(self):
+        """Lock entre procesos: el cache LocMem de cada worker no alcanza."""
+        if fcntl is None:
+            yield
+            return
+        self.root.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.root.with_name(f"{self.root.name}.lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _published_generated_at(self):
+        try:
+            with open(self.root / "manifest.json", encoding="utf-8") as fh:
+                return datetime.fromisoformat(json.load(fh)["generatedAt"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_all(self, target):
+        # generatedAt es el inicio: todo lo confirmado antes de este momento queda adentro.
+        started_at = timezone.now()
+        valid_until = _next_offer_boundary(started_at)
+        self._write(target / "categories.json", self._get(CategoriesListView, "/api/categories-list"))
+        self._write(target / "home-images.json", self._get(HomeImagesView, "/api/home-images"))
+        self._write(target / "store-config.json", self._get(StoreConfigView, "/api/store-config"))
+        self._write(target / "offers.json", self._get(OffersListView, "/api/offers"))
+
+        categories = {"": self._write_product_pages(target / "products", {})}
+        for category in Category.objects.select_related("parent").order_by("id"):
+            path_slug = build_category_path_slug(category)
+            if path_slug and path_slug not in categories:
+                categories[path_slug] = self._write_product_pages(target / "products" / path_slug, {"category": path_slug})
+        if OFFERS_CATEGORY_SLUG not in categories:
+            # La categoria virtual de ofertas existe en la API aunque no este en la tabla.
+            categories[OFFERS_CATEGORY_SLUG] = self._write_product_pages(
+                target / "products" / OFFERS_CATEGORY_SLUG, {"category": OFFERS_CATEGORY_SLUG}
+            )
+
+        manifest = {
+            "version": uuid.uuid4().hex,
+            "generatedAt": started_at.isoformat(),
+            "validUntil": valid_until.isoformat() if valid_until else None,
+            "pageSize": CATALOG_SNAPSHOT_PAGE_SIZE,
+            "categories": categories,
+        }
+        self._write(target / "manifest.json", manifest)
+        return manifest
+
+    def _write_product_pages(self, folder, params):
+        first = self._get(ProductListView, "/api/products", {**params, "page": 1, "limit": CATALOG_SNAPSHOT_PAGE_SIZE})
+        self._write(folder / "1.json", first)
+        pages = first["pages"]
+        written = pages if not self.pages else min(pages, self.pages)
+        for page in range(2, written + 1):
+            data = self._get(ProductListView, "/api/products", {**params, "page": page, "limit": CATALOG_SNAPSHOT_PAGE_SIZE})
+            self._write(folder / f"{page}.json", data)
+        return {"total": first["total"], "pages": pages, "snapshotPages": written}
+
+    def _get(self, view_class, path, params=None):
+        request = self.factory.get(path, params or {}, secure=self.secure)
+        response = view_class.as_view()(request)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} respondio {response.status_code}")
+        return response.data
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        self.compressor.compress(str(path))
+        self.files += 1
+
+    def _publish(self, staging):
+        """Cambia ``root`` (un symlink a la version vigente) de una sola vez con ``os.replace``.
+
+        Nunca hay un instante sin snapshot: los pedidos ven la version anterior o la nueva.
+        La anterior se conserva hasta la proxima publicacion por si alguno la estaba leyendo.
+        """
+        version = staging.rename(self.root.with_name(f"{self.root.name}.v-{uuid.uuid4().hex[:8]}"))
+        previous = Path(os.readlink(self.root)).name if self.root.is_symlink() else None
+        link = self.root.with_name(f"{self.root.name}.link-{uuid.uuid4().hex[:8]}")
+        try:
+            link.symlink_to(version.name, target_is_directory=True)
+        except OSError:
+            # Sin permiso para symlinks (Windows): reemplazo con dos renames.
+            self._publish_by_rename(version)
+            return
+        if self.root.exists() and not self.root.is_symlink():
+            # Primera publicacion sobre una carpeta comun: queda como version anterior.
+            previous = self.root.rename(self.root.with_name(f"{self.root.name}.old-{uuid.uuid4().hex[:8]}")).name
+        os.replace(link, self.root)
+        for path in self.root.parent.glob(f"{self.root.name}.*"):
+            stale = path.name.startswith((f"{self.root.name}.v-", f"{self.root.name}.old-"))
+            if stale and path.name not in (version.name, previous):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _publish_by_rename(self, version):
+        previous = self.root.with_name(f"{self.root.name}.old-{uuid.uuid4().hex[:8]}")
+        if self.root.exists():
+            self.root.rename(previous)
+        version.rename(self.root)
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def _next_offer_boundary(now):
+    """Proximo inicio o fin de una oferta activa: ahi cambian precios de ``offers.json`` y listados."""
+    bounds = Offer.objects.filter(activo=True).aggregate(
+        start=Min("empieza", filter=Q(empieza__gt=now)),
+        end=Min("termina", filter=Q(termina__gt=now)),
+    )
+    return min((moment for moment in bounds.values() if moment is not None), default=None)
+
+
+def build_catalog_snapshot(*, unless_built_since=None, **kwargs):
+    builder = CatalogSnapshotBuilder(**kwargs)
+    manifest = builder.build(unless_built_since=unless_built_since)
+    return manifest, builder.files
+
+
+def catalog_snapshot_enabled():
+    """El snapshot se regenera solo despues de publicarlo una vez a mano."""
+    return (Path(settings.CATALOG_SNAPSHOT_ROOT) / "manifest.json").is_file()
+
+
+def schedule_catalog_snapshot_refresh():
+    """Regenera el snapshot en segundo plano cuando se confirma la transaccion en curso."""
+    if not catalog_snapshot_enabled():
+        return False
+    if getattr(_deferred, "requested", None) is not None:
+        _deferred.requested = True
+        return True
+    transaction.on_commit(_start_catalog_snapshot_refresh)
+    return True
+
+
+@contextmanager
+def deferred_catalog_snapshot(*, wait=False):
+    """Junta los pedidos de regeneracion de un proceso masivo y pide uno solo al final.
+
+    Con ``wait`` (comandos de consola) lo arma en el mismo hilo, porque un hilo en segundo
+    plano moriria con el proceso. Devuelve un objeto cuyo ``files`` indica cuantos archivos
+    se escribieron (0 si no hizo falta armarlo).
+    """
+    result = SimpleNamespace(files=0)
+    if getattr(_deferred, "requested", None) is not None:
+        yield result
+        return
+    _deferred.requested = False
+    try:
+        yield result
+        requested = _deferred.requested
+    finally:
+        _deferred.requested = None
+    if not requested:
+        return
+    if wait:
+        _manifest, result.files = build_catalog_snapshot()
+    else:
+        schedule_catalog_snapshot_refresh()
+
+
+def _start_catalog_snapshot_refresh():
+    # La marca va antes del lock: si ya hay un hilo armando, la ve al terminar y vuelve a
+    # armar con este cambio; dos cambios seguidos no arman dos snapshots a la vez.
+    cache.set(CATALOG_SNAPSHOT_DIRTY_KEY, True, CATALOG_SNAPSHOT_LOCK_SECONDS)
+    if cache.add(CATALOG_SNAPSHOT_LOCK_KEY, True, CATALOG_SNAPSHOT_LOCK_SECONDS):
+        threading.Thread(target=_refresh_catalog_snapshot_thread, daemon=True).start()
+
+
+def _refresh_catalog_snapshot_thread():
+    try:
+        while True:
+            requested_at = timezone.now()
+            time.sleep(CATALOG_SNAPSHOT_DEBOUNCE_SECONDS)
+            cache.delete(CATALOG_SNAPSHOT_DIRTY_KEY)
+            try:
+                # Otro worker pudo haberlo armado mientras este esperaba el lock.
+                build_catalog_snapshot(unless_built_since=requested_at)
+            finally:
+                cache.delete(CATALOG_SNAPSHOT_LOCK_KEY)
+            if not cache.get(CATALOG_SNAPSHOT_DIRTY_KEY):
+                break
+            if not cache.add(CATALOG_SNAPSHOT_LOCK_KEY, True, CATALOG_SNAPSHOT_LOCK_SECONDS):
+                # Otro cambio ya arranco su propio hilo.
+                break
+    finally:
+        connection.close()
@@ -1,5 +1,13 @@
+import json
+import os
+from datetime import datetime
+
 from django.conf import settings
 from django.http import HttpResponseForbidden
+from django.utils import timezone
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import MissingFileError
+from whitenoise.string_utils import ensure_leading_trailing_slash
 
 
 class AdminAccessMiddleware:
@@ -15,3 +23,69 @@ class AdminAccessMiddleware:
             if client_ip not in allowed_ips:
                 return HttpResponseForbidden("Admin access denied")
         return self.get_response(request)
+
+
+class CatalogSnapshotMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise que ademas sirve el snapshot de ``build_catalog_snapshot``.
+
+    Los archivos del snapshot se buscan en cada pedido (un ``stat``, sin DB) porque el
+    comando los reemplaza sin reiniciar el proceso; el resto de los estaticos sigue igual.
+    Pasado el ``validUntil`` del manifiesto (una oferta empezo o vencio) deja de servirlo,
+    asi el frontend usa la API en vivo, y pide regenerarlo.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.snapshot_prefix = ensure_leading_trailing_slash(settings.CATALOG_SNAPSHOT_URL)
+        self.snapshot_root = os.path.join(os.path.abspath(settings.CATALOG_SNAPSHOT_ROOT), "")
+        self.manifest_key = None
+        self.valid_until = None
+        self.refresh_requested = False
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.snapshot_prefix) and not self.snapshot_expired():
+            snapshot_file = self.find_snapshot_file(request.path_info)
+            if snapshot_file is not None:
+                return self.serve(snapshot_file, request)
+        return super().__call__(request)
+
+    def find_snapshot_file(self, url):
+        if not self.url_is_canonical(url):
+            return None
+        path = os.path.join(self.snapshot_root, url[len(self.snapshot_prefix):])
+        if not path.startswith(self.snapshot_root) or self.is_compressed_variant(path) or not os.path.isfile(path):
+            return None
+        try:
+            return self.get_static_file(path, url)
+        except MissingFileError:
+            # Se publico un snapshot nuevo entre el stat y la apertura.
+            return None
+
+    def snapshot_expired(self):
+        manifest_path = os.path.join(self.snapshot_root, "manifest.json")
+        try:
+            stat = os.stat(manifest_path)
+        except OSError:
+            return False
+        # El manifiesto se relee solo cuando se publica otra version.
+        manifest_key = (stat.st_ino, stat.st_mtime_ns)
+        if manifest_key != self.manifest_key:
+            self.valid_until = self.read_valid_until(manifest_path)
+            self.manifest_key = manifest_key
+            self.refresh_requested = False
+        if self.valid_until is None or timezone.now() < self.valid_until:
+            return False
+        if not self.refresh_requested:
+            from .catalog_snapshot import schedule_catalog_snapshot_refresh
+
+            self.refresh_requested = True
+            schedule_catalog_snapshot_refresh()
+        return True
+
+    def read_valid_until(self, manifest_path):
+        try:
+            with open(manifest_path, encoding="utf-8") as fh:
+                valid_until = json.load(fh).get("validUntil")
+            return datetime.fromisoformat(valid_until) if valid_until else None
+        except (OSError, ValueError, AttributeError):
+            return None
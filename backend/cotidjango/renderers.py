@@ -0,0 +1,35 @@
+"""Renderer JSON de la API con orjson.
+
+Produce el mismo JSON que ``rest_framework.renderers.JSONRenderer`` (compacto, UTF-8,
+Decimal como numero, fechas ISO con ``Z`` en UTC y ``\\u2028``/``\\u2029`` escapados), pero
+serializa en C. Los tipos que orjson no conoce (Decimal, textos lazy, QuerySet...) pasan
+por el encoder de DRF. Sin orjson instalado, o si se pide ``indent``, usa el de DRF.
+"""
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+_drf_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_drf_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Enteros de mas de 64 bits u otros casos raros: el renderer de DRF los resuelve o falla igual.
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
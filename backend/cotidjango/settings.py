@@ -15,6 +15,7 @@ import secrets
 from pathlib import Path
 from datetime import timedelta
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -118,7 +119,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'cotidjango.middleware.CatalogSnapshotMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -244,6 +245,9 @@ CORS_ALLOWED_ORIGINS = _env_csv(
 )
 
 CORS_ALLOW_ALL_ORIGINS = _env_bool("CORS_ALLOW_ALL_ORIGINS", default=False)
+# El checkout manda Idempotency-Key para que los reintentos no dupliquen pedidos.
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed"]
 
 CSRF_TRUSTED_ORIGINS = _env_csv(
     "CSRF_TRUSTED_ORIGINS",
@@ -259,6 +263,30 @@ if not DEBUG:
 DATA_UPLOAD_MAX_MEMORY_SIZE = _env_int("DATA_UPLOAD_MAX_MEMORY_SIZE", 50 * 1024 * 1024)  # 50MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000 # Aumentado para pedidos con muchos artículos
 FILE_UPLOAD_MAX_MEMORY_SIZE = _env_int("FILE_UPLOAD_MAX_MEMORY_SIZE", 1 * 1024 * 1024)    # 1MB
+# Hilos para hashear las claves al importar clientes (0 = segun CPUs, 1 = sin paralelismo).
+USER_IMPORT_HASH_WORKERS = _env_int("USER_IMPORT_HASH_WORKERS", 0)
+# Una importacion de clientes que sigue en cola o procesando despues de esto se da por muerta.
+USER_IMPORT_STALE_SECONDS = _env_int("USER_IMPORT_STALE_SECONDS", 2 * 60 * 60)
+# Resumen del panel admin: fresco durante CACHE_SECONDS, se sirve viejo y se recalcula hasta STALE_SECONDS.
+ADMIN_OVERVIEW_CACHE_SECONDS = _env_int("ADMIN_OVERVIEW_CACHE_SECONDS", 30)
+ADMIN_OVERVIEW_STALE_SECONDS = _env_int("ADMIN_OVERVIEW_STALE_SECONDS", 600)
+# Tiempo durante el que un Idempotency-Key de POST /api/orders devuelve el pedido original.
+ORDER_IDEMPOTENCY_WINDOW_SECONDS = _env_int("ORDER_IDEMPOTENCY_WINDOW_SECONDS", 24 * 60 * 60)
+# Vida maxima de la parte publica de /api/bootstrap (se descarta antes si cambia el catalogo).
+BOOTSTRAP_CACHE_SECONDS = _env_int("BOOTSTRAP_CACHE_SECONDS", 60)
+# /api/products/changes solo informa cambios con esta antiguedad, para no dejar detras del cursor
+# los de transacciones que todavia no confirmaron.
+PRODUCT_CHANGES_SAFETY_SECONDS = _env_int("PRODUCT_CHANGES_SAFETY_SECONDS", 30)
+# Snapshot estatico del catalogo (build_catalog_snapshot), servido por WhiteNoise bajo CATALOG_SNAPSHOT_URL.
+CATALOG_SNAPSHOT_ROOT = Path(os.getenv("CATALOG_SNAPSHOT_ROOT", "").strip() or BASE_DIR / "catalog_snapshot")
+CATALOG_SNAPSHOT_URL = "/catalog-snapshot/"
+# Paginas de productos por categoria (0 = todas) y URL publica del backend para las imagenes subidas
+# (vacio = el primer host de ALLOWED_HOSTS).
+CATALOG_SNAPSHOT_PAGES = _env_int("CATALOG_SNAPSHOT_PAGES", 5)
+CATALOG_SNAPSHOT_BASE_URL = os.getenv("CATALOG_SNAPSHOT_BASE_URL", "").strip()
+
+# Las vistas api_* responden con orjson (cotidjango.renderers); en False vuelve al JSONRenderer de DRF.
+API_FAST_JSON = _env_bool("API_FAST_JSON", default=True)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -269,6 +297,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'cotidjango.renderers.FastJSONRenderer' if API_FAST_JSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_THROTTLE_RATES': {
@@ -41,6 +41,8 @@ urlpatterns = [
     path("mis-ordenes/", MyOrdersView.as_view(), name="orders-mine"),
     path("productos/nuevo/", ProductCreateView.as_view(), name="product-new"),
     path("api/", include("users.urls")),
+    # Antes del router: con "/" final, "changes" caeria en el detalle de ProductViewSet.
+    re_path(r"^api/products/changes/?$", api_bridge.ProductChangesView.as_view(), name="api-bridge-product-changes"),
     path("api/", include("products.urls")),
     path("api/", include("orders.urls")),
     path("api/auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
@@ -58,6 +60,7 @@ urlpatterns += [
     re_path(r"^api/account/profile/?$", api_bridge.AccountProfileView.as_view(), name="api-bridge-profile"),
     re_path(r"^api/account/password/?$", api_bridge.AccountPasswordView.as_view(), name="api-bridge-password"),
     re_path(r"^api/home-images/?$", api_bridge.HomeImagesView.as_view(), name="api-bridge-home-images"),
+    re_path(r"^api/bootstrap/?$", api_bridge.BootstrapView.as_view(), name="api-bridge-bootstrap"),
     re_path(r"^api/store-config/?$", api_bridge.StoreConfigView.as_view(), name="api-bridge-store-config"),
     re_path(r"^api/categories-list/?$", api_bridge.CategoriesListView.as_view(), name="api-bridge-categories"),
     re_path(r"^api/supplier-contacts/?$", api_bridge.SupplierContactCreateView.as_view(), name="api-bridge-supplier-contacts"),
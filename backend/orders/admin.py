@@ -1,7 +1,13 @@
+import json
+from decimal import Decimal, InvalidOperation
+from math import ceil
+
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Count, Q, Sum
 from django.http import HttpResponse, JsonResponse
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
 from django.urls import path, reverse
 from django.utils.html import format_html
@@ -9,7 +15,10 @@ from django.utils.safestring import mark_safe
 
 from products.models import Product
 
-from .models import Order, OrderItem
+from .models import Order, OrderItem, StockMovement
+from .sales import refresh_sales_rollups, sales_day
+from .stock import StockInsuficiente, release_order_stock, sync_order_stock
+from cotidjango.api_order_utils import build_order_item_display_name, normalize_order_item_attrs
 from cotidjango.api_pdf import (
     LABEL_SIZES,
     build_shipping_label_pdf,
@@ -18,6 +27,11 @@ from cotidjango.api_pdf import (
 )
 
 
+# Con mas items que esto el inline no se dibuja y se edita con el editor paginado.
+ORDER_ITEMS_INLINE_LIMIT = 60
+ORDER_ITEMS_PAGE_SIZE = 50
+ORDER_ITEMS_MAX_BATCH = 500
+
 LABEL_SIZE_CHOICES = (
     ("thermal", "Estándar térmica 100x150 mm"),
     ("courier", "Via Cargo / Andreani 100x190 mm"),
@@ -184,6 +198,21 @@ class OrderAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.stock_pdf_view),
                 name="orders_order_stock_pdf",
             ),
+            path(
+                "<path:object_id>/items-editor/",
+                self.admin_site.admin_view(self.items_editor_view),
+                name="orders_order_items_editor",
+            ),
+            path(
+                "<path:object_id>/items-json/",
+                self.admin_site.admin_view(self.items_json_view),
+                name="orders_order_items_json",
+            ),
+            path(
+                "items-products/",
+                self.admin_site.admin_view(self.items_products_view),
+                name="orders_order_items_products",
+            ),
             path(
                 "product-price/<int:product_id>/",
                 self.admin_site.admin_view(self.product_price_view),
@@ -197,8 +226,22 @@ class OrderAdmin(admin.ModelAdmin):
         ]
         return custom + urls
 
+    def get_inlines(self, request, obj):
+        if obj is not None and self._is_large_order(obj):
+            return []
+        return super().get_inlines(request, obj)
+
+    def _is_large_order(self, obj):
+        if not hasattr(obj, "_item_count"):
+            obj._item_count = obj.items.count()
+        return obj._item_count > ORDER_ITEMS_INLINE_LIMIT
+
     def change_view(self, request, object_id, form_url="", extra_context=None):
         extra_context = extra_context or {}
+        if object_id:
+            extra_context["items_editor_url"] = reverse("admin:orders_order_items_editor", args=[object_id])
+            order = self.get_object(request, object_id)
+            extra_context["large_order"] = bool(order and self._is_large_order(order))
         extra_context["labels_url"] = self._labels_url(object_id)
         extra_context["download_pdf_url"] = self._download_pdf_url(object_id)
         extra_context["stock_pdf_url"] = self._stock_pdf_url(object_id)
@@ -279,6 +322,183 @@ class OrderAdmin(admin.ModelAdmin):
         }
         return TemplateResponse(request, "admin/orders/order/labels_form.html", context)
 
+    def items_editor_view(self, request, object_id):
+        order = get_object_or_404(Order, pk=object_id)
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "original": order,
+            "order": order,
+            "title": f"Productos del pedido #{order.id}",
+            "items_url": reverse("admin:orders_order_items_json", args=[order.pk]),
+            "products_url": reverse("admin:orders_order_items_products"),
+            "change_url": reverse("admin:orders_order_change", args=[order.pk]),
+            "page_size": ORDER_ITEMS_PAGE_SIZE,
+            "can_change": self.has_change_permission(request, order),
+        }
+        return TemplateResponse(request, "admin/orders/order/items_editor.html", context)
+
+    def items_json_view(self, request, object_id):
+        order = get_object_or_404(Order, pk=object_id)
+        if request.method == "POST":
+            if not self.has_change_permission(request, order):
+                return JsonResponse({"error": "Sin permiso para editar el pedido."}, status=403)
+            try:
+                payload = json.loads(request.body or b"{}")
+                with transaction.atomic():
+                    if self._apply_items_batch(order, payload):
+                        order.recalc_total()
+            except (ValueError, TypeError) as exc:
+                return JsonResponse({"error": str(exc) or "Datos invalidos."}, status=400)
+            except StockInsuficiente as exc:
+                return JsonResponse({"error": str(exc)}, status=409)
+            return JsonResponse({"ok": True, "order": self._items_order_summary(order)})
+
+        try:
+            page = max(1, int(request.GET.get("page") or 1))
+            limit = max(1, min(200, int(request.GET.get("limit") or ORDER_ITEMS_PAGE_SIZE)))
+        except ValueError:
+            return JsonResponse({"error": "Pagina invalida."}, status=400)
+        items = order.items.select_related("product")
+        query = (request.GET.get("q") or "").strip()
+        if query:
+            items = items.filter(Q(product_name__icontains=query) | Q(product_sku__icontains=query))
+        total = items.count()
+        rows = items[(page - 1) * limit:page * limit]
+        return JsonResponse({
+            "items": [self._serialize_editor_item(item) for item in rows],
+            "total": total,
+            "page": page,
+            "pages": ceil(total / limit) if total else 1,
+            "order": self._items_order_summary(order),
+        })
+
+    def items_products_view(self, request):
+        query = (request.GET.get("q") or "").strip()
+        if len(query) < 2:
+            return JsonResponse({"items": []})
+        products = (
+            Product.objects.filter(Q(nombre__icontains=query) | Q(sku__iexact=query))
+            .only("id", "nombre", "sku", "precio")
+            .order_by("nombre")[:20]
+        )
+        return JsonResponse({
+            "items": [
+                {"id": product.id, "name": product.nombre, "sku": product.sku, "price": str(product.precio)}
+                for product in products
+            ]
+        })
+
+    def _serialize_editor_item(self, item):
+        return {
+            "id": item.id,
+            "productId": item.product_id,
+            "name": item.product_name or item.product.nombre,
+            "sku": item.product_sku,
+            "category": item.categoria_nombre,
+            "qty": item.cantidad,
+            "price": str(item.precio_unitario),
+            "attributes": item.atributos or {},
+            "subtotal": str(item.subtotal),
+        }
+
+    def _items_order_summary(self, order):
+        order.refresh_from_db(fields=["total", "envio"])
+        counts = order.items.aggregate(lines=Count("id"), units=Sum("cantidad"))
+        return {
+            "total": str(order.total),
+            "shipping": str(order.envio),
+            "lines": counts["lines"],
+            "units": counts["units"] or 0,
+        }
+
+    def _apply_items_batch(self, order, payload):
+        """Aplica ``{"update": [...], "create": [...], "delete": [...]}`` con operaciones bulk.
+
+        Devuelve True si cambio algun item; el llamador abre la transaccion y recalcula el total una vez.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("Formato invalido.")
+        updates = payload.get("update") or []
+        creates = payload.get("create") or []
+        deletes = payload.get("delete") or []
+        if not all(isinstance(value, list) for value in (updates, creates, deletes)):
+            raise ValueError("update, create y delete deben ser listas.")
+        if not all(isinstance(row, dict) for row in updates + creates):
+            raise ValueError("Cada cambio debe ser un objeto.")
+        if len(updates) + len(creates) + len(deletes) > ORDER_ITEMS_MAX_BATCH:
+            raise ValueError(f"Se pueden guardar hasta {ORDER_ITEMS_MAX_BATCH} cambios por vez.")
+
+        def parse_qty(value):
+            qty = int(value)
+            if qty < 1:
+                raise ValueError("La cantidad debe ser mayor a cero.")
+            return qty
+
+        price_field = OrderItem._meta.get_field("precio_unitario")
+        # El mayor valor que entra en la columna (99999999.99 con max_digits=10).
+        max_price = Decimal(10) ** (price_field.max_digits - price_field.decimal_places) - Decimal("0.01")
+
+        def parse_price(value):
+            try:
+                price = Decimal(str(value).replace(",", "."))
+            except InvalidOperation:
+                raise ValueError("Precio invalido.")
+            if not price.is_finite() or price > max_price:
+                raise ValueError("Precio invalido.")
+            if price < 0:
+                raise ValueError("El precio no puede ser negativo.")
+            return price.quantize(Decimal("0.01"))
+
+        update_ids = [int(row.get("id")) for row in updates]
+        existing = order.items.in_bulk(update_ids) if update_ids else {}
+        to_update = []
+        for row in updates:
+            item = existing.get(int(row["id"]))
+            if item is None:
+                raise ValueError(f"El item {row['id']} no pertenece al pedido.")
+            if "qty" in row:
+                item.cantidad = parse_qty(row["qty"])
+            if "price" in row:
+                item.precio_unitario = parse_price(row["price"])
+            to_update.append(item)
+
+        product_ids = {int(row.get("productId")) for row in creates}
+        products = Product.objects.select_related("categoria").in_bulk(product_ids) if product_ids else {}
+        to_create = []
+        for row in creates:
+            product = products.get(int(row["productId"]))
+            if product is None:
+                raise ValueError(f"No existe el producto {row['productId']}.")
+            if row.get("price") not in (None, ""):
+                price = parse_price(row["price"])
+            else:
+                from cotidjango.api_common import resolve_discount_for_product
+
+                discount = resolve_discount_for_product(product)
+                price = discount["final_price"] if discount else product.precio
+            attrs = normalize_order_item_attrs(row.get("attributes"))
+            item = OrderItem(
+                order=order,
+                product=product,
+                product_name=build_order_item_display_name(product.nombre, attrs),
+                cantidad=parse_qty(row.get("qty") or 1),
+                precio_unitario=price,
+                atributos=attrs,
+            )
+            item.snapshot_product()
+            to_create.append(item)
+
+        delete_ids = [int(value) for value in deletes]
+        deleted = 0
+        if delete_ids:
+            deleted, _ = OrderItem.objects.filter(order=order, pk__in=delete_ids).delete()
+        if to_update:
+            OrderItem.objects.bulk_update(to_update, ["cantidad", "precio_unitario"], batch_size=ORDER_ITEMS_MAX_BATCH)
+        if to_create:
+            OrderItem.objects.bulk_create(to_create, batch_size=ORDER_ITEMS_MAX_BATCH)
+        return bool(deleted or to_update or to_create)
+
     def user_shipping_view(self, request, user_id):
         user_model = Order._meta.get_field("user").remote_field.model
         user = user_model.objects.filter(pk=user_id).first()
@@ -314,6 +534,15 @@ class OrderAdmin(admin.ModelAdmin):
             }
         )
 
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        # Reactivar un pedido o subir cantidades vuelve a tomar stock; si no alcanza se
+        # deshace todo el guardado (la vista corre en una transaccion) y se avisa.
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except StockInsuficiente as exc:
+            self.message_user(request, f"No se guardo el pedido: {exc}", messages.ERROR)
+            return redirect(request.get_full_path())
+
     def save_related(self, request, form, formsets, change):
         super().save_related(request, form, formsets, change)
         form.instance.recalc_total()
@@ -329,15 +558,48 @@ class OrderAdmin(admin.ModelAdmin):
             setattr(obj, field_name, (getattr(obj, field_name, "") or "").strip())
         super().save_model(request, obj, form, change)
 
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            days = {sales_day(value) for value in queryset.values_list("creado_en", flat=True)}
+            release_order_stock(list(queryset.values_list("pk", flat=True)), nota="Pedido eliminado")
+            super().delete_queryset(request, queryset)
+            refresh_sales_rollups(days)
+
+    def _update_status(self, request, queryset, status):
+        # update() no pasa por Order.save: resumenes de ventas y stock se actualizan aca.
+        try:
+            with transaction.atomic():
+                rows = list(queryset.values_list("pk", "creado_en"))
+                queryset.update(status=status)
+                refresh_sales_rollups({sales_day(creado_en) for _pk, creado_en in rows})
+                sync_order_stock([pk for pk, _creado_en in rows], status)
+        except StockInsuficiente as exc:
+            self.message_user(request, f"No se cambio el estado: {exc}", messages.ERROR)
+
     @admin.action(description="Aprobar pedidos seleccionados")
     def aprobar(self, request, queryset):
-        queryset.update(status="approved")
+        self._update_status(request, queryset, "approved")
 
     @admin.action(description="Marcar como pagado")
     def marcar_pagado(self, request, queryset):
-        queryset.update(status="paid")
+        self._update_status(request, queryset, "paid")
 
     @admin.action(description="Cancelar pedidos")
     def cancelar(self, request, queryset):
-        queryset.update(status="cancelled")
+        self._update_status(request, queryset, "cancelled")
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "tipo", "product", "cantidad", "atributos", "order", "nota")
+    list_filter = ("tipo", "creado_en")
+    search_fields = ("product__nombre", "product__sku", "order__id", "nota")
+    list_select_related = ("product", "order")
+    raw_id_fields = ("product", "order")
+    date_hierarchy = "creado_en"
+
+    def has_add_permission(self, request):
+        return False
 
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.sales import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye los resumenes de ventas por dia y por producto desde los pedidos. "
+        "Usar despues de cargar pedidos por fuera de la app o para verificar los resumenes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            default="",
+            help="Solo recalcula desde esta fecha (YYYY-MM-DD, hora local). Por defecto, todo.",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options.get("since"):
+            try:
+                since = datetime.strptime(options["since"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--since debe tener el formato YYYY-MM-DD.")
+
+        days = rebuild_sales_rollups(since=since)
+        scope = f" desde {since:%Y-%m-%d}" if since else ""
+        self.stdout.write(self.style.SUCCESS(f"Resumenes de ventas reconstruidos{scope}. Dias con ventas: {days}"))
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:09
+
+import re
+
+from django.db import migrations, models
+
+
+# Copia congelada de orders.models.order_item_sort_key tal como estaba en esta migracion.
+def order_item_sort_key(sku, categoria, nombre):
+    sku = str(sku or "").strip()
+    natural_sku = "".join(
+        part.zfill(12) if part.isdigit() else part.lower()
+        for part in re.split(r"(\d+)", sku)
+    )
+    key = "\x1f".join([
+        "0" if sku else "1",
+        str(categoria or "").strip().lower() or "zzzzz",
+        natural_sku,
+        str(nombre or "").strip().lower(),
+    ])
+    return key[:255]
+
+
+def snapshot_order_items(apps, schema_editor):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    batch = []
+    items = OrderItem.objects.select_related("product__categoria").order_by("id")
+    for item in items.iterator(chunk_size=500):
+        product = item.product
+        item.product_sku = (product.sku or "").strip()
+        item.categoria_nombre = product.categoria.nombre if product.categoria_id else ""
+        item.sort_key = order_item_sort_key(item.product_sku, item.categoria_nombre, product.nombre)
+        batch.append(item)
+        if len(batch) >= 500:
+            OrderItem.objects.bulk_update(batch, ["product_sku", "categoria_nombre", "sort_key"])
+            batch = []
+    if batch:
+        OrderItem.objects.bulk_update(batch, ["product_sku", "categoria_nombre", "sort_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_alter_orderitem_options'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='orderitem',
+            options={'ordering': ['sort_key', 'id'], 'verbose_name': 'Item de pedido', 'verbose_name_plural': 'Items de pedido'},
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='categoria_nombre',
+            field=models.CharField(blank=True, default='', max_length=150),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_sku',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='sort_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(snapshot_order_items, migrations.RunPython.noop),
+    ]
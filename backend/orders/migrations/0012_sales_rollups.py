@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_orderitem_sort_snapshot'),
+        ('products', '0031_product_sku_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('status', models.CharField(choices=[('created', 'Creado'), ('approved', 'Aprobado'), ('pending_payment', 'Falta pago'), ('draft', 'Borrador'), ('paid', 'Pagado'), ('shipped', 'Enviado'), ('delivered', 'Entregado'), ('cancelled', 'Cancelado')], max_length=20)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Venta diaria',
+                'verbose_name_plural': 'Ventas diarias',
+                'ordering': ['fecha', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'status'), name='orders_dailysales_fecha_status_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('status', models.CharField(choices=[('created', 'Creado'), ('approved', 'Aprobado'), ('pending_payment', 'Falta pago'), ('draft', 'Borrador'), ('paid', 'Pagado'), ('shipped', 'Enviado'), ('delivered', 'Entregado'), ('cancelled', 'Cancelado')], max_length=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Venta por producto',
+                'verbose_name_plural': 'Ventas por producto',
+                'ordering': ['fecha', 'status', 'product_id'],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'status', 'product'), name='orders_productsales_fecha_status_product_uniq')],
+            },
+        ),
+    ]
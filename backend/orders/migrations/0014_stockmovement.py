@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_order_status_creado_en_index'),
+        ('products', '0032_product_controla_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('reserva', 'Reserva'), ('liberacion', 'Liberacion'), ('confirmacion', 'Confirmacion'), ('ajuste', 'Ajuste manual')], max_length=20)),
+                ('cantidad', models.IntegerField()),
+                ('atributos', models.JSONField(blank=True, default=dict)),
+                ('nota', models.CharField(blank=True, default='', max_length=255)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='orders.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['-creado_en', '-id'],
+                'indexes': [models.Index(fields=['order', 'tipo'], name='orders_stockmov_order_tipo')],
+            },
+        ),
+    ]
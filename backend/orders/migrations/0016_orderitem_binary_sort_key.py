@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:06
+
+import re
+import unicodedata
+
+import orders.models
+from django.db import migrations, models
+
+
+# Copias congeladas de orders.models._sort_text y order_item_sort_key para esta migracion.
+def _sort_text(value):
+    text = unicodedata.normalize("NFKD", str(value or "").strip().lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def order_item_sort_key(sku, categoria, nombre):
+    sku = str(sku or "").strip()
+    natural_sku = "".join(
+        part.zfill(12) if part.isdigit() else _sort_text(part)
+        for part in re.split(r"(\d+)", sku)
+    )
+    categoria = _sort_text(categoria)
+    key = "\x1f".join([
+        "0" if sku else "1",
+        f"0{categoria}" if categoria else "1",
+        natural_sku,
+        _sort_text(nombre),
+    ])
+    return key[:255]
+
+
+def rebuild_sort_keys(apps, schema_editor):
+    """Recalcula la clave sobre la copia guardada en cada item (no sobre el producto actual)."""
+    OrderItem = apps.get_model("orders", "OrderItem")
+    batch = []
+    items = OrderItem.objects.select_related("product").order_by("id")
+    for item in items.iterator(chunk_size=500):
+        nombre = item.product_name or item.product.nombre
+        item.sort_key = order_item_sort_key(item.product_sku, item.categoria_nombre, nombre)
+        batch.append(item)
+        if len(batch) >= 500:
+            OrderItem.objects.bulk_update(batch, ["sort_key"])
+            batch = []
+    if batch:
+        OrderItem.objects.bulk_update(batch, ["sort_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_orderidempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='orderitem',
+            options={'ordering': [models.OrderBy(orders.models.SortKeyOrder()), 'id'], 'verbose_name': 'Item de pedido', 'verbose_name_plural': 'Items de pedido'},
+        ),
+        migrations.RunPython(rebuild_sort_keys, migrations.RunPython.noop),
+    ]
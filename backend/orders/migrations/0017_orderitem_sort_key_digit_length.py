@@ -0,0 +1,58 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+# Copias congeladas de orders.models._sort_text, _sort_number y order_item_sort_key.
+def _sort_text(value):
+    text = unicodedata.normalize("NFKD", str(value or "").strip().lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _sort_number(digits):
+    digits = digits.lstrip("0") or "0"
+    return f"{len(digits):02d}{digits}"
+
+
+def order_item_sort_key(sku, categoria, nombre):
+    sku = str(sku or "").strip()
+    natural_sku = "".join(
+        _sort_number(part) if part.isdigit() else _sort_text(part)
+        for part in re.split(r"(\d+)", sku)
+    )
+    categoria = _sort_text(categoria)
+    key = "\x1f".join([
+        "0" if sku else "1",
+        f"0{categoria}" if categoria else "1",
+        natural_sku,
+        _sort_text(nombre),
+    ])
+    return key[:255]
+
+
+def rebuild_sort_keys(apps, schema_editor):
+    """Los numeros del SKU pasan de 12 digitos con ceros a su largo seguido del numero."""
+    OrderItem = apps.get_model("orders", "OrderItem")
+    batch = []
+    items = OrderItem.objects.select_related("product").order_by("id")
+    for item in items.iterator(chunk_size=500):
+        nombre = item.product_name or item.product.nombre
+        item.sort_key = order_item_sort_key(item.product_sku, item.categoria_nombre, nombre)
+        batch.append(item)
+        if len(batch) >= 500:
+            OrderItem.objects.bulk_update(batch, ["sort_key"])
+            batch = []
+    if batch:
+        OrderItem.objects.bulk_update(batch, ["sort_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_orderitem_binary_sort_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_sort_keys, migrations.RunPython.noop),
+    ]
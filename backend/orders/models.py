@@ -1,5 +1,9 @@
+import re
+import unicodedata
+
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.utils import timezone
 from decimal import Decimal
 
@@ -41,14 +45,129 @@ class Order(models.Model):
         ordering = ["-creado_en"]
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
+        indexes = [
+            # Ventas por dia y listados por estado filtran por status y un rango de creado_en.
+            models.Index(fields=["status", "creado_en"], name="orders_order_status_created"),
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id or ''} - {self.nombre}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._sales_snapshot = instance._sales_state()
+        return instance
+
+    def _sales_state(self):
+        return tuple(self.__dict__.get(name) for name in ("status", "creado_en", "total"))
+
+    def save(self, *args, **kwargs):
+        previous = getattr(self, "_sales_snapshot", None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous != self._sales_state():
+                self.refresh_sales(previous)
+            if previous and previous[0] != self.status:
+                self.sync_stock()
+        self._sales_snapshot = self._sales_state()
+
+    def delete(self, *args, **kwargs):
+        from .stock import release_order_stock
+
+        previous = self._sales_state()
+        with transaction.atomic():
+            release_order_stock([self.pk], nota="Pedido eliminado")
+            result = super().delete(*args, **kwargs)
+            self.refresh_sales(previous, deleted=True)
+        return result
+
+    def refresh_sales(self, previous=None, *, deleted=False):
+        """Recalcula los resumenes de ventas de los dias que toca este pedido."""
+        from .sales import SALES_STATUSES, refresh_sales_rollups, sales_day
+
+        states = [previous] if deleted else [previous, self._sales_state()]
+        states = [state for state in states if state and state[0] in SALES_STATUSES and state[1]]
+        if states:
+            refresh_sales_rollups({sales_day(state[1]) for state in states})
+
+    def sync_stock(self):
+        """Libera o confirma la reserva de stock segun el estado actual."""
+        from .stock import sync_order_stock
+
+        sync_order_stock([self.pk], self.status)
+
     def recalc_total(self):
         total = sum(item.subtotal for item in self.items.all()) + (self.envio or Decimal("0.00"))
+        unchanged = self.total == total
         self.total = total
-        self.save(update_fields=["total"])
+        with transaction.atomic():
+            self.save(update_fields=["total"])
+            if unchanged:
+                # Los items pueden cambiar sin mover el total; save() no lo detecta.
+                self.refresh_sales()
+            self.reconcile_stock()
+
+    def reconcile_stock(self):
+        """Ajusta la reserva de stock a los items actuales (despues de editarlos)."""
+        from .stock import reconcile_order_stock
+
+        reconcile_order_stock(self)
+
+
+SORT_KEY_SEPARATOR = "\x1f"
+
+
+def _sort_text(value):
+    text = unicodedata.normalize("NFKD", str(value or "").strip().lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _sort_number(digits):
+    digits = digits.lstrip("0") or "0"
+    return f"{len(digits):02d}{digits}"
+
+
+def order_item_sort_key(sku, categoria, nombre):
+    """Clave de orden de los remitos: con SKU primero, luego categoria, SKU natural y nombre.
+
+    Cada numero del SKU va precedido por su cantidad de digitos para que "A2" quede antes
+    que "A10" al comparar texto, sin tope de largo (codigos EAN-13 incluidos); el
+    separador es menor que cualquier caracter imprimible. Se pasa a
+    minusculas sin acentos para que "Árbol" quede junto a "arbol" y no despues de "z".
+    """
+    sku = str(sku or "").strip()
+    natural_sku = "".join(
+        _sort_number(part) if part.isdigit() else _sort_text(part)
+        for part in re.split(r"(\d+)", sku)
+    )
+    categoria = _sort_text(categoria)
+    key = SORT_KEY_SEPARATOR.join([
+        "0" if sku else "1",
+        f"0{categoria}" if categoria else "1",
+        natural_sku,
+        _sort_text(nombre),
+    ])
+    return key[:255]
+
+
+class SortKeyOrder(models.Func):
+    """``sort_key`` comparado byte a byte en cualquier motor, igual que ``sorted()`` en los remitos.
+
+    SQLite ya compara asi; PostgreSQL y MySQL usarian la collation de la base, que
+    ignora el separador y mezcla mayusculas y acentos.
+    """
+
+    template = "%(expressions)s"
+
+    def __init__(self, expression="sort_key", **extra):
+        super().__init__(expression, output_field=models.CharField(), **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='%(expressions)s COLLATE "C"', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="%(expressions)s COLLATE utf8mb4_bin", **extra_context)
 
 
 class OrderItem(models.Model):
@@ -58,11 +177,40 @@ class OrderItem(models.Model):
     cantidad = models.PositiveIntegerField(default=1)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     atributos = models.JSONField(default=dict, blank=True)
+    # Copia del producto al crear el item: el orden del pedido no cambia si despues se
+    # renombra o recategoriza el producto, y ordenar no necesita el join.
+    product_sku = models.CharField(max_length=100, blank=True, default="")
+    categoria_nombre = models.CharField(max_length=150, blank=True, default="")
+    sort_key = models.CharField(max_length=255, blank=True, default="")
 
     class Meta:
         verbose_name = "Item de pedido"
         verbose_name_plural = "Items de pedido"
-        ordering = ["product__categoria__nombre", "product__nombre"]
+        ordering = [SortKeyOrder().asc(), "id"]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_product_id = instance.__dict__.get("product_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.product_id and self.product_id != getattr(self, "_snapshot_product_id", None):
+            self.snapshot_product()
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "product_sku", "categoria_nombre", "sort_key"}
+        super().save(*args, **kwargs)
+        self._snapshot_product_id = self.product_id
+
+    def snapshot_product(self):
+        product = self.product
+        self.product_sku = (product.sku or "").strip()
+        self.categoria_nombre = product.categoria.nombre if product.categoria_id else ""
+        # El mismo nombre que usan las migraciones al recalcular la clave.
+        self.sort_key = order_item_sort_key(
+            self.product_sku, self.categoria_nombre, self.product_name or product.nombre
+        )
 
     @property
     def subtotal(self):
@@ -72,3 +220,109 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product} x{self.cantidad}"
+
+
+class DailySales(models.Model):
+    """Ventas por dia local y estado; se mantiene desde ``orders.sales``."""
+
+    fecha = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["fecha", "status"]
+        verbose_name = "Venta diaria"
+        verbose_name_plural = "Ventas diarias"
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "status"], name="orders_dailysales_fecha_status_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.status}: {self.orders} pedidos"
+
+
+class ProductSales(models.Model):
+    """Unidades e ingresos por producto, dia local y estado."""
+
+    fecha = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="sales_rollups")
+    cantidad = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["fecha", "status", "product_id"]
+        verbose_name = "Venta por producto"
+        verbose_name_plural = "Ventas por producto"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fecha", "status", "product"],
+                name="orders_productsales_fecha_status_product_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.status}: {self.product_id} x{self.cantidad}"
+
+
+class StockMovement(models.Model):
+    """Libro de movimientos de stock; se escribe desde ``orders.stock``.
+
+    ``cantidad`` es el cambio aplicado a ``Product.stock``: negativo al reservar, positivo
+    al liberar. Las confirmaciones registran las unidades vendidas sin mover el stock.
+    """
+
+    RESERVA = "reserva"
+    LIBERACION = "liberacion"
+    CONFIRMACION = "confirmacion"
+    AJUSTE = "ajuste"
+    TIPO_CHOICES = [
+        (RESERVA, "Reserva"),
+        (LIBERACION, "Liberacion"),
+        (CONFIRMACION, "Confirmacion"),
+        (AJUSTE, "Ajuste manual"),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="stock_movements")
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="stock_movements")
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    cantidad = models.IntegerField()
+    # Variantes descontadas ({"Color": "Rojo"}); la liberacion devuelve exactamente estas.
+    atributos = models.JSONField(default=dict, blank=True)
+    nota = models.CharField(max_length=255, blank=True, default="")
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-creado_en", "-id"]
+        verbose_name = "Movimiento de stock"
+        verbose_name_plural = "Movimientos de stock"
+        indexes = [
+            models.Index(fields=["order", "tipo"], name="orders_stockmov_order_tipo"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.product_id}: {self.cantidad:+d}"
+
+
+class OrderIdempotencyKey(models.Model):
+    """Resultado de un ``POST /api/orders`` por ``Idempotency-Key`` para repetirlo en reintentos."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="order_idempotency_keys")
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="idempotency_keys")
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Clave de idempotencia"
+        verbose_name_plural = "Claves de idempotencia"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="orders_idempotency_user_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
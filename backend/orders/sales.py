@@ -0,0 +1,165 @@
+"""Resumenes de ventas por dia (``DailySales``) y por producto (``ProductSales``).
+
+Los paneles de ventas leen estas tablas en lugar de recorrer pedidos. Cada cambio de
+estado, fecha, total o items de un pedido recalcula los dias afectados dentro de la
+misma transaccion; ``rebuild_sales_rollups`` los reconstruye desde cero.
+
+Los recalculos se serializan con un lock de la transaccion: dos pedidos del mismo dia
+confirmados a la vez no pisan sus totales ni chocan en el unique (fecha, status).
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySales, Order, OrderItem, ProductSales
+
+
+SALES_STATUSES = ("paid", "shipped", "delivered")
+REBUILD_WINDOW_DAYS = 31
+# Clave del pg_advisory_xact_lock de los resumenes (cualquier entero fijo sirve).
+SALES_ROLLUP_LOCK_ID = 4206037
+
+
+def sales_day(value):
+    return timezone.localtime(value).date()
+
+
+def local_day_range(start_day, end_day=None):
+    """Rango semiabierto [inicio, fin) en hora local, de ``start_day`` a ``end_day`` inclusive."""
+    end_day = end_day or start_day
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _lock_sales_rollups():
+    """Espera a que termine cualquier otro recalculo y lo bloquea hasta el fin de la transaccion.
+
+    En PostgreSQL es un advisory lock global (no hay filas que bloquear para un dia sin
+    ventas todavia). SQLite ya serializa las escrituras.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SALES_ROLLUP_LOCK_ID])
+
+
+def day_ranges(days):
+    """Agrupa ``days`` en rangos (inicio, fin) de dias consecutivos de hasta ``REBUILD_WINDOW_DAYS``."""
+    ranges = []
+    for day in sorted({day for day in days if day}):
+        if ranges:
+            first_day, last_day = ranges[-1]
+            if day == last_day + timedelta(days=1) and (day - first_day).days < REBUILD_WINDOW_DAYS:
+                ranges[-1] = (first_day, day)
+                continue
+        ranges.append((day, day))
+    return ranges
+
+
+def refresh_sales_rollups(days):
+    """Recalcula los resumenes solo de los dias de ``days``, no de los que quedan en el medio."""
+    ranges = day_ranges(days)
+    if not ranges:
+        return
+    with transaction.atomic():
+        # El lock va antes de leer: asi se suman tambien los pedidos que otro recien confirmo.
+        _lock_sales_rollups()
+        for first_day, last_day in ranges:
+            _refresh_sales_rollups(first_day, last_day)
+
+
+def _refresh_sales_rollups(first_day, last_day):
+    start, end = local_day_range(first_day, last_day)
+    tz = timezone.get_current_timezone()
+
+    orders = (
+        Order.objects.filter(creado_en__gte=start, creado_en__lt=end, status__in=SALES_STATUSES)
+        .annotate(fecha=TruncDate("creado_en", tzinfo=tz))
+        .values("fecha", "status")
+        .annotate(order_count=Count("id"), revenue_total=Sum("total"))
+        .order_by()
+    )
+    products = (
+        OrderItem.objects.filter(
+            order__creado_en__gte=start,
+            order__creado_en__lt=end,
+            order__status__in=SALES_STATUSES,
+        )
+        .annotate(fecha=TruncDate("order__creado_en", tzinfo=tz))
+        .values("fecha", "order__status", "product_id")
+        .annotate(
+            qty=Sum("cantidad"),
+            revenue_total=Sum(
+                F("precio_unitario") * F("cantidad"),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+        .order_by()
+    )
+
+    product_rows = [
+        ProductSales(
+            fecha=row["fecha"],
+            status=row["order__status"],
+            product_id=row["product_id"],
+            cantidad=row["qty"] or 0,
+            revenue=row["revenue_total"] or 0,
+        )
+        for row in products
+    ]
+    items_by_day = {}
+    for row in product_rows:
+        key = (row.fecha, row.status)
+        items_by_day[key] = items_by_day.get(key, 0) + row.cantidad
+    daily_rows = [
+        DailySales(
+            fecha=row["fecha"],
+            status=row["status"],
+            orders=row["order_count"],
+            items=items_by_day.get((row["fecha"], row["status"]), 0),
+            revenue=row["revenue_total"] or 0,
+        )
+        for row in orders
+    ]
+
+    DailySales.objects.filter(fecha__gte=first_day, fecha__lte=last_day).delete()
+    ProductSales.objects.filter(fecha__gte=first_day, fecha__lte=last_day).delete()
+    DailySales.objects.bulk_create(daily_rows)
+    ProductSales.objects.bulk_create(product_rows, batch_size=500)
+
+
+def rebuild_sales_rollups(since=None):
+    """Reconstruye los resumenes por ventanas de un mes; devuelve la cantidad de dias con ventas."""
+    orders = Order.objects.filter(status__in=SALES_STATUSES)
+    if since:
+        orders = orders.filter(creado_en__gte=local_day_range(since)[0])
+    bounds = orders.aggregate(first=models.Min("creado_en"), last=models.Max("creado_en"))
+
+    with transaction.atomic():
+        _lock_sales_rollups()
+        stale_daily = DailySales.objects.all()
+        stale_products = ProductSales.objects.all()
+        if since:
+            stale_daily = stale_daily.filter(fecha__gte=since)
+            stale_products = stale_products.filter(fecha__gte=since)
+        stale_daily.delete()
+        stale_products.delete()
+        if bounds["first"] is None:
+            return 0
+
+        day = sales_day(bounds["first"])
+        last_day = sales_day(bounds["last"])
+        while day <= last_day:
+            window_end = min(day + timedelta(days=REBUILD_WINDOW_DAYS - 1), last_day)
+            _refresh_sales_rollups(day, window_end)
+            day = window_end + timedelta(days=1)
+
+    queryset = DailySales.objects.all()
+    if since:
+        queryset = queryset.filter(fecha__gte=since)
+    return queryset.values("fecha").distinct().count()
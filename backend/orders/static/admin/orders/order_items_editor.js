@@ -0,0 +1,217 @@
+(function () {
+  const root = document.querySelector('.items-editor');
+  if (!root) {
+    return;
+  }
+
+  const itemsUrl = root.dataset.itemsUrl;
+  const productsUrl = root.dataset.productsUrl;
+  const pageSize = Number(root.dataset.pageSize) || 50;
+  const canChange = root.dataset.canChange === '1';
+  const csrfToken = root.querySelector('[name=csrfmiddlewaretoken]')?.value || '';
+
+  const rowsBody = document.getElementById('items-editor-rows');
+  const pageLabel = document.getElementById('items-editor-page');
+  const summary = document.getElementById('items-editor-summary');
+  const statusLabel = document.getElementById('items-editor-status');
+  const searchInput = document.getElementById('items-editor-search');
+  const productInput = document.getElementById('items-editor-product');
+  const productResults = document.getElementById('items-editor-results');
+
+  // Los cambios se guardan en memoria entre paginas y se mandan juntos al guardar.
+  const pendingUpdates = new Map();
+  const pendingDeletes = new Set();
+  const pendingCreates = [];
+  let page = 1;
+  let pages = 1;
+  let query = '';
+  let searchTimer = null;
+
+  function formatMoney(value) {
+    return new Intl.NumberFormat('es-AR', {
+      minimumFractionDigits: 2,
+      maximumFractionDigits: 2,
+    }).format(Number(value) || 0);
+  }
+
+  function setStatus(text) {
+    if (statusLabel) {
+      statusLabel.textContent = text;
+    }
+  }
+
+  function pendingCount() {
+    return pendingUpdates.size + pendingDeletes.size + pendingCreates.length;
+  }
+
+  function renderSummary(order) {
+    summary.textContent = `${order.lines} items · ${order.units} unidades · Total $ ${formatMoney(order.total)}`;
+  }
+
+  function cell(content) {
+    const td = document.createElement('td');
+    if (content instanceof Node) {
+      td.appendChild(content);
+    } else {
+      td.textContent = content;
+    }
+    return td;
+  }
+
+  function renderRow(item) {
+    const pending = pendingUpdates.get(item.id) || {};
+    const qty = pending.qty ?? item.qty;
+    const price = pending.price ?? item.price;
+    const tr = document.createElement('tr');
+    tr.classList.toggle('is-dirty', pendingUpdates.has(item.id));
+    tr.classList.toggle('is-deleted', pendingDeletes.has(item.id));
+
+    const qtyInput = document.createElement('input');
+    qtyInput.type = 'number';
+    qtyInput.min = '1';
+    qtyInput.value = qty;
+    qtyInput.disabled = !canChange;
+    const priceInput = document.createElement('input');
+    priceInput.type = 'text';
+    priceInput.className = 'items-editor__price';
+    priceInput.value = price;
+    priceInput.disabled = !canChange;
+    const subtotal = cell(formatMoney(Number(qty) * Number(String(price).replace(',', '.'))));
+
+    function onChange() {
+      pendingUpdates.set(item.id, { id: item.id, qty: qtyInput.value, price: priceInput.value });
+      tr.classList.add('is-dirty');
+      subtotal.textContent = formatMoney(Number(qtyInput.value) * Number(priceInput.value.replace(',', '.')));
+      setStatus(`${pendingCount()} cambios sin guardar`);
+    }
+    qtyInput.addEventListener('change', onChange);
+    priceInput.addEventListener('change', onChange);
+
+    const removeButton = document.createElement('button');
+    removeButton.type = 'button';
+    removeButton.className = 'button';
+    removeButton.textContent = pendingDeletes.has(item.id) ? 'Restaurar' : 'Quitar';
+    removeButton.disabled = !canChange;
+    removeButton.addEventListener('click', function () {
+      if (pendingDeletes.has(item.id)) {
+        pendingDeletes.delete(item.id);
+      } else {
+        pendingDeletes.add(item.id);
+      }
+      tr.classList.toggle('is-deleted', pendingDeletes.has(item.id));
+      removeButton.textContent = pendingDeletes.has(item.id) ? 'Restaurar' : 'Quitar';
+      setStatus(`${pendingCount()} cambios sin guardar`);
+    });
+
+    tr.append(
+      cell(item.sku || '-'),
+      cell(item.name),
+      cell(qtyInput),
+      cell(priceInput),
+      subtotal,
+      cell(removeButton),
+    );
+    return tr;
+  }
+
+  async function loadPage(targetPage) {
+    const params = new URLSearchParams({ page: targetPage, limit: pageSize });
+    if (query) {
+      params.set('q', query);
+    }
+    const response = await fetch(`${itemsUrl}?${params}`, { credentials: 'same-origin' });
+    const data = await response.json();
+    if (!response.ok) {
+      setStatus(data.error || 'No se pudieron cargar los productos.');
+      return;
+    }
+    page = data.page;
+    pages = data.pages;
+    rowsBody.replaceChildren(...data.items.map(renderRow));
+    pageLabel.textContent = `Página ${page} de ${pages} (${data.total} items)`;
+    renderSummary(data.order);
+  }
+
+  async function save() {
+    if (!pendingCount()) {
+      setStatus('No hay cambios para guardar.');
+      return;
+    }
+    setStatus('Guardando...');
+    const response = await fetch(itemsUrl, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+      body: JSON.stringify({
+        update: Array.from(pendingUpdates.values()).filter((row) => !pendingDeletes.has(row.id)),
+        delete: Array.from(pendingDeletes),
+        create: pendingCreates,
+      }),
+    });
+    const data = await response.json();
+    if (!response.ok) {
+      setStatus(data.error || 'No se pudieron guardar los cambios.');
+      return;
+    }
+    pendingUpdates.clear();
+    pendingDeletes.clear();
+    pendingCreates.length = 0;
+    setStatus('Cambios guardados.');
+    renderSummary(data.order);
+    await loadPage(page);
+  }
+
+  async function searchProducts(term) {
+    if (term.length < 2) {
+      productResults.replaceChildren();
+      return;
+    }
+    const response = await fetch(`${productsUrl}?${new URLSearchParams({ q: term })}`, { credentials: 'same-origin' });
+    const data = await response.json();
+    productResults.replaceChildren(...(data.items || []).map(function (product) {
+      const li = document.createElement('li');
+      li.textContent = `${product.sku || '-'} · ${product.name} · $ ${formatMoney(product.price)}`;
+      li.addEventListener('click', function () {
+        pendingCreates.push({ productId: product.id, qty: 1 });
+        productResults.replaceChildren();
+        productInput.value = '';
+        setStatus(`${pendingCount()} cambios sin guardar (se agrega ${product.name})`);
+      });
+      return li;
+    }));
+  }
+
+  document.getElementById('items-editor-prev').addEventListener('click', function () {
+    if (page > 1) {
+      loadPage(page - 1);
+    }
+  });
+  document.getElementById('items-editor-next').addEventListener('click', function () {
+    if (page < pages) {
+      loadPage(page + 1);
+    }
+  });
+  searchInput.addEventListener('input', function () {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(function () {
+      query = searchInput.value.trim();
+      loadPage(1);
+    }, 300);
+  });
+  if (canChange) {
+    document.getElementById('items-editor-save').addEventListener('click', save);
+    productInput.addEventListener('input', function () {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(function () {
+        searchProducts(productInput.value.trim());
+      }, 300);
+    });
+  }
+  window.addEventListener('beforeunload', function (event) {
+    if (pendingCount()) {
+      event.preventDefault();
+    }
+  });
+
+  loadPage(1);
+})();
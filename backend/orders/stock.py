@@ -0,0 +1,288 @@
+"""Reservas de stock de pedidos y libro de movimientos (``StockMovement``).
+
+Al crear un pedido se descuenta el stock de los productos que lo controlan
+(``Product.controla_stock``), incluido el de cada ``ProductVariant`` con stock propio.
+Cancelar el pedido devuelve lo reservado y sacarlo de cancelado lo vuelve a reservar;
+pasarlo a pagado o enviado deja la reserva confirmada y ya no se devuelve sola. Editar
+los items de un pedido con reserva registra la diferencia como ajuste. Los descuentos
+son UPDATE condicionales con F() sobre cada fila, sin bloquear la tabla.
+"""
+
+import json
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import Product, ProductVariant
+
+from .models import Order, StockMovement
+
+
+STOCK_COMMIT_STATUSES = ("paid", "shipped", "delivered")
+# El ultimo de estos movimientos dice si el pedido tiene la reserva tomada, devuelta o vendida.
+LIFECYCLE_TIPOS = (StockMovement.RESERVA, StockMovement.LIBERACION, StockMovement.CONFIRMACION)
+# Los que mueven stock del pedido: su suma (con signo invertido) es lo que tiene tomado hoy.
+HOLDING_TIPOS = (StockMovement.RESERVA, StockMovement.LIBERACION, StockMovement.AJUSTE)
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, product_name, attrs=None):
+        self.product_name = product_name
+        self.attrs = attrs or {}
+        label = ", ".join(f"{key}: {value}" for key, value in self.attrs.items())
+        super().__init__(f"Sin stock suficiente para {product_name}" + (f" ({label})" if label else ""))
+
+
+def _item_variants(product, attrs):
+    """Atributos del item que tienen stock propio en el producto."""
+    if not isinstance(attrs, dict):
+        return {}
+    stocked = {(variant.atributo, variant.valor) for variant in product.variants.all() if variant.stock is not None}
+    return {
+        key: value
+        for key, value in attrs.items()
+        if isinstance(value, str) and (key, value) in stocked
+    }
+
+
+def _take_stock(product_id, name, qty, variants):
+    taken = Product.objects.filter(pk=product_id, stock__gte=qty).update(
+        stock=F("stock") - qty, actualizado_en=timezone.now(),
+    )
+    if not taken:
+        raise StockInsuficiente(name)
+    for (key, value), wanted in sorted(variants.items()):
+        taken = ProductVariant.objects.filter(
+            product_id=product_id, atributo=key, valor=value, stock__gte=wanted,
+        ).update(stock=F("stock") - wanted)
+        if not taken:
+            raise StockInsuficiente(name, {key: value})
+
+
+def _give_stock(product_id, qty, variants):
+    Product.objects.filter(pk=product_id).update(stock=F("stock") + qty, actualizado_en=timezone.now())
+    for (key, value), returned in sorted(variants.items()):
+        # Si el importador quito la variante mientras tanto, solo vuelve al total.
+        ProductVariant.objects.filter(
+            product_id=product_id, atributo=key, valor=value, stock__isnull=False,
+        ).update(stock=F("stock") + returned)
+
+
+def _demand(rows):
+    """Agrupa (product_id, cantidad, variantes) por producto: {id: [total, {(clave, valor): n}]}."""
+    demand = {}
+    for product_id, qty, variants in rows:
+        entry = demand.setdefault(product_id, [0, {}])
+        entry[0] += qty
+        for key, value in variants.items():
+            entry[1][(key, value)] = entry[1].get((key, value), 0) + qty
+    return demand
+
+
+def reserve_order_stock(order, items=None):
+    """Descuenta el stock de los items del pedido; lanza ``StockInsuficiente`` si no alcanza.
+
+    Debe llamarse dentro de la transaccion que crea el pedido para que un faltante
+    deshaga todo.
+    """
+    if items is None:
+        items = order.items.select_related("product").prefetch_related("product__variants")
+    items = list(items)
+    items = [item for item in items if item.product.controla_stock]
+    if not items:
+        return 0
+
+    movements = []
+    rows = []
+    names = {}
+    for item in items:
+        variants = _item_variants(item.product, item.atributos)
+        rows.append((item.product_id, item.cantidad, variants))
+        names[item.product_id] = item.product.nombre
+        movements.append(StockMovement(
+            product_id=item.product_id,
+            order=order,
+            tipo=StockMovement.RESERVA,
+            cantidad=-item.cantidad,
+            atributos=variants,
+        ))
+
+    with transaction.atomic():
+        # Siempre en el mismo orden de filas para que dos compras no se bloqueen entre si.
+        for product_id, (qty, variants) in sorted(_demand(rows).items()):
+            _take_stock(product_id, names[product_id], qty, variants)
+        StockMovement.objects.bulk_create(movements)
+    return len(movements)
+
+
+def _order_stock_states(order_ids):
+    """Ultimo movimiento de ciclo de vida de cada pedido, con los pedidos bloqueados hasta el commit."""
+    order_ids = list(Order.objects.select_for_update().filter(pk__in=order_ids).values_list("pk", flat=True))
+    states = {}
+    movements = (
+        StockMovement.objects.filter(order_id__in=order_ids, tipo__in=LIFECYCLE_TIPOS)
+        .order_by("order_id", "id")
+        .values_list("order_id", "tipo")
+    )
+    for order_id, tipo in movements:
+        states[order_id] = tipo
+    return states
+
+
+def _orders_in_state(order_ids, tipo):
+    return sorted(order_id for order_id, state in _order_stock_states(order_ids).items() if state == tipo)
+
+
+def _variants_key(variants):
+    return json.dumps(variants or {}, sort_keys=True)
+
+
+def _held_stock(order_ids):
+    """Lo que cada pedido tiene tomado hoy: {(order_id, product_id, variantes json): unidades}."""
+    held = {}
+    movements = StockMovement.objects.filter(order_id__in=order_ids, tipo__in=HOLDING_TIPOS).values_list(
+        "order_id", "product_id", "atributos", "cantidad",
+    )
+    for order_id, product_id, atributos, cantidad in movements:
+        key = (order_id, product_id, _variants_key(atributos))
+        held[key] = held.get(key, 0) - cantidad
+    return {key: qty for key, qty in held.items() if qty}
+
+
+def _lifecycle_markers(order_ids, covered, tipo, nota=""):
+    """Movimientos en cero para los pedidos sin nada tomado, asi igual cambian de estado."""
+    missing = set(order_ids) - set(covered)
+    if not missing:
+        return []
+    products = dict(
+        StockMovement.objects.filter(order_id__in=missing).order_by("order_id", "id").values_list("order_id", "product_id")
+    )
+    return [
+        StockMovement(product_id=products[order_id], order_id=order_id, tipo=tipo, cantidad=0, nota=nota)
+        for order_id in sorted(missing)
+    ]
+
+
+def release_order_stock(order_ids, nota=""):
+    """Devuelve el stock reservado de los pedidos; los ya confirmados no se tocan."""
+    with transaction.atomic():
+        held = _orders_in_state(order_ids, StockMovement.RESERVA)
+        if not held:
+            return 0
+        holdings = _held_stock(held)
+        demand = _demand((product_id, qty, json.loads(key)) for (_order_id, product_id, key), qty in holdings.items())
+        for product_id, (qty, variants) in sorted(demand.items()):
+            _give_stock(product_id, qty, variants)
+        movements = [
+            StockMovement(
+                product_id=product_id,
+                order_id=order_id,
+                tipo=StockMovement.LIBERACION,
+                cantidad=qty,
+                atributos=json.loads(key),
+                nota=nota,
+            )
+            for (order_id, product_id, key), qty in sorted(holdings.items())
+        ]
+        movements += _lifecycle_markers(held, {key[0] for key in holdings}, StockMovement.LIBERACION, nota)
+        StockMovement.objects.bulk_create(movements)
+    return len(held)
+
+
+def commit_order_stock(order_ids):
+    """Marca como vendida la reserva de los pedidos; el stock ya estaba descontado."""
+    with transaction.atomic():
+        held = _orders_in_state(order_ids, StockMovement.RESERVA)
+        if not held:
+            return 0
+        holdings = _held_stock(held)
+        movements = [
+            StockMovement(
+                product_id=product_id,
+                order_id=order_id,
+                tipo=StockMovement.CONFIRMACION,
+                cantidad=0,
+                atributos=json.loads(key),
+                nota=f"{qty} unidades vendidas",
+            )
+            for (order_id, product_id, key), qty in sorted(holdings.items())
+        ]
+        movements += _lifecycle_markers(held, {key[0] for key in holdings}, StockMovement.CONFIRMACION)
+        StockMovement.objects.bulk_create(movements)
+    return len(held)
+
+
+def reserve_released_orders(order_ids):
+    """Vuelve a reservar los pedidos que tenian la reserva devuelta (salen de cancelado)."""
+    with transaction.atomic():
+        released = _orders_in_state(order_ids, StockMovement.LIBERACION)
+        for order in Order.objects.filter(pk__in=released).order_by("pk"):
+            reserve_order_stock(order)
+    return len(released)
+
+
+def sync_order_stock(order_ids, status):
+    """Libera, vuelve a reservar o confirma las reservas segun el nuevo estado de los pedidos."""
+    if status == "cancelled":
+        return release_order_stock(order_ids, nota="Pedido cancelado")
+    with transaction.atomic():
+        reserved = reserve_released_orders(order_ids)
+        if status in STOCK_COMMIT_STATUSES:
+            return commit_order_stock(order_ids)
+    return reserved
+
+
+def reconcile_order_stock(order):
+    """Lleva lo que el pedido tiene tomado a lo que piden sus items despues de editarlos.
+
+    Solo para pedidos con la reserva tomada o confirmada; la diferencia queda como
+    ajuste del pedido. Lanza ``StockInsuficiente`` si un aumento no alcanza.
+    """
+    with transaction.atomic():
+        state = _order_stock_states([order.pk]).get(order.pk)
+        if state not in (StockMovement.RESERVA, StockMovement.CONFIRMACION):
+            return 0
+        wanted = {}
+        names = {}
+        items = order.items.select_related("product").prefetch_related("product__variants")
+        for item in items:
+            if not item.product.controla_stock:
+                continue
+            variants = _item_variants(item.product, item.atributos)
+            key = (item.product_id, _variants_key(variants))
+            wanted[key] = wanted.get(key, 0) + item.cantidad
+            names[item.product_id] = item.product.nombre
+        held = {(product_id, key): qty for (_order_id, product_id, key), qty in _held_stock([order.pk]).items()}
+
+        diffs = {key: wanted.get(key, 0) - held.get(key, 0) for key in {*wanted, *held}}
+        diffs = {key: diff for key, diff in sorted(diffs.items()) if diff}
+        if not diffs:
+            return 0
+        # Primero se devuelve: cambiar de variante no necesita stock extra del producto.
+        returned = _demand((product_id, -diff, json.loads(key)) for (product_id, key), diff in diffs.items() if diff < 0)
+        for product_id, (qty, variants) in sorted(returned.items()):
+            _give_stock(product_id, qty, variants)
+        taken = _demand((product_id, diff, json.loads(key)) for (product_id, key), diff in diffs.items() if diff > 0)
+        for product_id, (qty, variants) in sorted(taken.items()):
+            _take_stock(product_id, names[product_id], qty, variants)
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                order=order,
+                tipo=StockMovement.AJUSTE,
+                cantidad=-diff,
+                atributos=json.loads(key),
+                nota="Items del pedido editados",
+            )
+            for (product_id, key), diff in diffs.items()
+        ])
+    return len(diffs)
+
+
+def record_stock_adjustment(product, previous_stock, nota=""):
+    """Registra un cambio manual de ``Product.stock`` hecho desde el admin."""
+    delta = int(product.stock or 0) - int(previous_stock or 0)
+    if not delta:
+        return None
+    return StockMovement.objects.create(product=product, tipo=StockMovement.AJUSTE, cantidad=delta, nota=nota)
@@ -1,3 +1,883 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders.models import (
+    DailySales,
+    Order,
+    OrderIdempotencyKey,
+    OrderItem,
+    ProductSales,
+    SortKeyOrder,
+    StockMovement,
+    order_item_sort_key,
+)
+from orders.sales import day_ranges, local_day_range, refresh_sales_rollups, sales_day
+from products.models import Category, Product, StoreSettings
+from users.models import CustomUser
+
+
+class OrderItemSortSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="cliente",
+            email="cliente@example.com",
+            password="secret123",
+            approval_status="approved",
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            nombre="Cliente",
+            email="cliente@example.com",
+            direccion="Calle 1",
+            ciudad="Rosario",
+        )
+        self.velas = Category.objects.create(nombre="Velas")
+        self.globos = Category.objects.create(nombre="Globos")
+
+    def _item(self, nombre, categoria, sku=""):
+        product = Product.objects.create(
+            user=self.user,
+            categoria=categoria,
+            nombre=nombre,
+            slug=nombre.lower().replace(" ", "-"),
+            precio="10.00",
+            sku=sku,
+        )
+        return OrderItem.objects.create(order=self.order, product=product, cantidad=1, precio_unitario="10.00")
+
+    def test_sort_key_orders_by_sku_presence_category_and_natural_sku(self):
+        self.assertLess(order_item_sort_key("A2", "Velas", "x"), order_item_sort_key("A10", "Velas", "x"))
+        self.assertLess(order_item_sort_key("Z1", "Velas", "x"), order_item_sort_key("", "Aaa", "x"))
+        self.assertLess(order_item_sort_key("B1", "Globos", "x"), order_item_sort_key("A1", "Velas", "x"))
+        # Codigos de mas de 12 digitos (EAN-13) siguen en orden numerico.
+        self.assertLess(
+            order_item_sort_key("999999999999", "Velas", "x"), order_item_sort_key("1234567890123", "Velas", "x")
+        )
+
+    def test_items_keep_creation_snapshot_and_order_without_product_join(self):
+        vela = self._item("Vela 10", self.velas, sku="V10")
+        vela_2 = self._item("Vela 2", self.velas, sku="V2")
+        globo = self._item("Globo", self.globos)
+
+        vela.product.nombre = "Aaa renombrada"
+        vela.product.categoria = self.globos
+        vela.product.save()
+
+        with self.assertNumQueries(1) as queries:
+            items = list(self.order.items.all())
+        self.assertNotIn("products_", queries.captured_queries[0]["sql"])
+        self.assertEqual([item.pk for item in items], [vela_2.pk, vela.pk, globo.pk])
+        self.assertEqual((items[1].product_sku, items[1].categoria_nombre), ("V10", "Velas"))
+
+    def test_database_order_matches_python_sort_with_accents_and_case(self):
+        arboles = Category.objects.create(nombre="Árboles")
+        for nombre, categoria in [
+            ("Zapato", None),
+            ("Nube", self.velas),
+            ("BOLSA", self.globos),
+            ("ñandú", self.velas),
+            ("Ábaco", arboles),
+            ("Éter", self.velas),
+            ("abanico", self.globos),
+        ]:
+            self._item(nombre, categoria)
+
+        items = list(self.order.items.all())
+
+        self.assertEqual(items, sorted(items, key=lambda item: (item.sort_key, item.pk)))
+        self.assertEqual(
+            [item.product_name or item.product.nombre for item in items],
+            ["Ábaco", "abanico", "BOLSA", "Éter", "ñandú", "Nube", "Zapato"],
+        )
+
+    def test_sort_key_order_compares_bytes_on_postgresql_and_mysql(self):
+        query = OrderItem.objects.all().query
+        compiler = query.get_compiler("default")
+        expression = SortKeyOrder().resolve_expression(query)
+
+        postgres_sql, _params = expression.as_postgresql(compiler, compiler.connection)
+        mysql_sql, _params = expression.as_mysql(compiler, compiler.connection)
+
+        self.assertTrue(postgres_sql.endswith('COLLATE "C"'))
+        self.assertTrue(mysql_sql.endswith("COLLATE utf8mb4_bin"))
+
+    def test_changing_item_product_refreshes_snapshot(self):
+        item = self._item("Vela Roja", self.velas, sku="V1")
+        other = Product.objects.create(
+            user=self.user, categoria=self.globos, nombre="Globo Azul", slug="globo-azul", precio="5.00", sku="G1",
+        )
+
+        item = OrderItem.objects.get(pk=item.pk)
+        item.product = other
+        item.save(update_fields=["product"])
+
+        item.refresh_from_db()
+        self.assertEqual((item.product_sku, item.categoria_nombre), ("G1", "Globos"))
+
+    def test_sort_key_uses_item_name_like_the_migrations(self):
+        product = Product.objects.create(
+            user=self.user, categoria=self.velas, nombre="Vela", slug="vela", precio="10.00", sku="V1",
+        )
+        item = OrderItem.objects.create(
+            order=self.order, product=product, product_name="Vela (Color: Rojo)", cantidad=1, precio_unitario="10.00",
+        )
+
+        self.assertEqual(item.sort_key, order_item_sort_key("V1", "Velas", "Vela (Color: Rojo)"))
+
+
+class OrderListSummaryTests(TestCase):
+    def setUp(self):
+        self.customer = CustomUser.objects.create_user(
+            username="compradora",
+            email="compradora@example.com",
+            password="secret123",
+            first_name="Ana",
+            last_name="Paz",
+            approval_status="approved",
+        )
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        category = Category.objects.create(nombre="Velas")
+        product = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Vela", slug="vela", precio="10.00",
+        )
+        for index in range(3):
+            order = Order.objects.create(
+                user=self.customer,
+                nombre=f"Envio {index}",
+                email="compradora@example.com",
+                direccion="Calle 1",
+                ciudad="Rosario",
+                total="30.00",
+            )
+            OrderItem.objects.create(order=order, product=product, cantidad=2, precio_unitario="10.00")
+            OrderItem.objects.create(order=order, product=product, cantidad=1, precio_unitario="10.00")
+
+    def test_my_orders_are_paginated_summaries(self):
+        self.client.force_login(self.customer)
+
+        response = self.client.get("/api/orders/mine", {"page": 2, "limit": 2})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["total"], data["page"], data["pages"]), (3, 2, 2))
+        self.assertEqual(len(data["items"]), 1)
+        summary = data["items"][0]
+        self.assertEqual(summary["totals"]["items"], 3)
+        self.assertEqual(summary["totals"]["lines"], 2)
+        self.assertEqual(summary["customer"]["name"], "Ana Paz")
+        self.assertNotIn("items", summary)
+
+    def test_my_orders_without_pagination_keep_full_orders(self):
+        self.client.force_login(self.customer)
+
+        data = self.client.get("/api/orders/mine").json()
+
+        self.assertEqual(set(data), {"orders"})
+        self.assertEqual(len(data["orders"]), 3)
+        self.assertEqual(len(data["orders"][0]["items"]), 2)
+
+    def test_invalid_pagination_falls_back_to_defaults(self):
+        self.client.force_login(self.customer)
+
+        response = self.client.get("/api/orders/mine", {"page": "dos", "limit": "x"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["page"], len(response.json()["items"])), (1, 3))
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get("/api/admin/orders", {"page": "[]"}).status_code, 200)
+
+    def test_admin_orders_list_uses_constant_queries(self):
+        self.client.force_login(self.admin)
+
+        # Sesion y usuario, count y la pagina anotada, sin consultas por pedido.
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/admin/orders", {"limit": 100})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["items"]), 3)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.vela = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Vela", slug="vela", precio="10.00",
+        )
+        self.globo = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Globo", slug="globo", precio="5.00",
+        )
+        # 23:30 en Buenos Aires ya es el dia siguiente en UTC.
+        self.when = timezone.make_aware(datetime(2026, 3, 10, 23, 30))
+
+    def _order(self, status="created", items=((2, "10.00"),)):
+        order = Order.objects.create(
+            user=self.admin,
+            nombre="Cliente",
+            email="cliente@example.com",
+            direccion="Calle 1",
+            ciudad="Rosario",
+            status=status,
+            creado_en=self.when,
+        )
+        for cantidad, precio in items:
+            OrderItem.objects.create(order=order, product=self.vela, cantidad=cantidad, precio_unitario=precio)
+        order.recalc_total()
+        return order
+
+    def test_rollups_follow_status_and_item_changes(self):
+        order = self._order()
+        self.assertFalse(DailySales.objects.exists())
+
+        order.status = "paid"
+        order.save()
+        day = DailySales.objects.get()
+        self.assertEqual((str(day.fecha), day.status, day.orders, day.items, day.revenue), ("2026-03-10", "paid", 1, 2, 20))
+
+        OrderItem.objects.create(order=order, product=self.globo, cantidad=3, precio_unitario="5.00")
+        order.recalc_total()
+        day = DailySales.objects.get()
+        self.assertEqual((day.items, day.revenue), (5, 35))
+        self.assertEqual(
+            sorted(ProductSales.objects.values_list("product__nombre", "cantidad")),
+            [("Globo", 3), ("Vela", 2)],
+        )
+
+        order.status = "cancelled"
+        order.save(update_fields=["status"])
+        self.assertFalse(DailySales.objects.exists())
+        self.assertFalse(ProductSales.objects.exists())
+
+    def test_admin_bulk_actions_and_delete_refresh_rollups(self):
+        order = self._order()
+        self.client.force_login(self.admin)
+        changelist = reverse("admin:orders_order_changelist")
+
+        self.client.post(changelist, {"action": "marcar_pagado", "_selected_action": [order.pk]})
+        self.assertEqual(DailySales.objects.get().orders, 1)
+
+        self.client.post(changelist, {"action": "delete_selected", "_selected_action": [order.pk], "post": "yes"})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_rebuild_command_and_endpoints_read_rollups(self):
+        self._order(status="paid", items=((1, "10.00"),))
+        self._order(status="shipped", items=((4, "10.00"),))
+        DailySales.objects.all().delete()
+        ProductSales.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_sales_rollups", stdout=out)
+        self.assertIn("Dias con ventas: 1", out.getvalue())
+        self.assertEqual(DailySales.objects.count(), 2)
+
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/admin/sales-calendar", {"year": 2026, "month": 3})
+        self.assertEqual(response.json(), {"2026-03-10": {"total": 10.0, "orders": 1}})
+
+        response = self.client.get("/api/admin/sales-calendar/2026-03-10")
+        data = response.json()
+        self.assertEqual(data["total"], 10.0)
+        self.assertEqual(data["products"], [{"id": self.vela.id, "name": "Vela", "qty": 1, "total": 10.0}])
+
+
+    def test_refresh_takes_the_rollup_lock_before_reading_orders(self):
+        order = self._order(status="paid")
+        lock_at = []
+
+        with CaptureQueriesContext(connection) as queries, mock.patch(
+            "orders.sales._lock_sales_rollups",
+            side_effect=lambda: lock_at.append(len(queries.captured_queries)),
+        ):
+            refresh_sales_rollups([sales_day(order.creado_en)])
+
+        self.assertEqual(len(lock_at), 1)
+        self.assertFalse(any("orders_order" in query["sql"] for query in queries.captured_queries[:lock_at[0]]))
+        self.assertEqual(DailySales.objects.get().orders, 1)
+
+    def test_refresh_only_touches_the_given_days(self):
+        first = self._order(status="paid")
+        self.when = self.when + timedelta(days=400)
+        last = self._order(status="paid")
+        untouched = DailySales.objects.create(fecha=sales_day(first.creado_en) + timedelta(days=30), status="paid", orders=7)
+        DailySales.objects.exclude(pk=untouched.pk).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_sales_rollups([sales_day(first.creado_en), sales_day(last.creado_en)])
+
+        self.assertEqual(DailySales.objects.filter(orders=1).count(), 2)
+        self.assertEqual(DailySales.objects.get(pk=untouched.pk).orders, 7)
+        self.assertLessEqual(sum("orders_order" in query["sql"] for query in queries.captured_queries), 4)
+
+    def test_day_ranges_join_consecutive_days_up_to_the_window(self):
+        start = datetime(2026, 1, 1).date()
+        days = [start + timedelta(days=offset) for offset in (*range(40), 45, 46, 90)]
+
+        self.assertEqual(
+            [(first.isoformat(), last.isoformat()) for first, last in day_ranges(days + [None, start])],
+            [
+                ("2026-01-01", "2026-01-31"),
+                ("2026-02-01", "2026-02-09"),
+                ("2026-02-15", "2026-02-16"),
+                ("2026-04-01", "2026-04-01"),
+            ],
+        )
+
+    def test_daily_detail_totals_match_the_listed_orders(self):
+        self._order(status="paid", items=((1, "10.00"), (2, "5.00")))
+        DailySales.objects.update(revenue=999, items=99)
+
+        self.client.force_login(self.admin)
+        data = self.client.get("/api/admin/sales-calendar/2026-03-10").json()
+
+        self.assertEqual(data["total"], sum(order["total"] for order in data["orders"]))
+        self.assertEqual((data["total"], data["items"]), (20.0, 3))
+        self.assertEqual(data["products"], [{"id": self.vela.id, "name": "Vela", "qty": 3, "total": 20.0}])
+
+class DailySalesRangeTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        for hour, minute, status in ((0, 5, "paid"), (23, 55, "paid"), (12, 0, "created")):
+            Order.objects.create(
+                user=self.admin,
+                nombre=f"Pedido {hour}",
+                email="root@example.com",
+                direccion="Calle 1",
+                ciudad="Rosario",
+                status=status,
+                total="10.00",
+                creado_en=timezone.make_aware(datetime(2026, 3, 10, hour, minute)),
+            )
+        Order.objects.create(
+            user=self.admin,
+            nombre="Dia siguiente",
+            email="root@example.com",
+            direccion="Calle 1",
+            ciudad="Rosario",
+            status="paid",
+            total="99.00",
+            creado_en=timezone.make_aware(datetime(2026, 3, 11, 0, 0)),
+        )
+
+    def test_daily_sales_use_local_day_boundaries(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get("/api/admin/sales-calendar/2026-03-10")
+
+        data = response.json()
+        self.assertEqual([order["time"] for order in data["orders"]], ["00:05", "23:55"])
+        self.assertEqual(data["total"], 20.0)
+        response = self.client.get("/api/admin/sales-calendar/2026-03-10/pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+    @skipUnless(connection.vendor == "postgresql", "El plan de consulta se verifica en PostgreSQL.")
+    def test_daily_range_query_uses_status_created_index(self):
+        start, end = local_day_range(datetime(2026, 3, 10).date())
+        queryset = Order.objects.filter(status="paid", creado_en__gte=start, creado_en__lt=end)
+
+        with connection.cursor() as cursor:
+            # Con tan pocas filas el planner prefiere un seq scan; se lo desalienta para ver el indice elegible.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+
+        self.assertIn("orders_order_status_created", plan)
+
+
+class AdminOverviewCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.product = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Vela", slug="vela", precio="10.00",
+        )
+        StoreSettings.objects.update_or_create(pk=1, defaults={"min_order_amount": 0})
+        self.client.force_login(self.admin)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_overview_is_served_from_cache_and_invalidated_by_new_orders(self):
+        first = self.client.get("/api/admin/overview").json()
+        self.assertEqual(first["counts"]["orders"], 0)
+
+        # Solo sesion y usuario: el resumen sale del cache.
+        with self.assertNumQueries(2):
+            self.client.get("/api/admin/overview")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/orders",
+                {
+                    "items": [{"productId": self.product.id, "qty": 1}],
+                    "shipping": {
+                        "name": "Root",
+                        "email": "root@example.com",
+                        "phone": "123",
+                        "address": "Calle 1",
+                        "city": "Rosario",
+                        "zip": "2000",
+                    },
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.client.get("/api/admin/overview").json()["counts"]["orders"], 1)
+
+    @override_settings(ADMIN_OVERVIEW_CACHE_SECONDS=0)
+    def test_stale_overview_is_returned_while_one_refresh_runs(self):
+        self.client.get("/api/admin/overview")
+        Order.objects.create(
+            user=self.admin, nombre="Nuevo", email="root@example.com", direccion="Calle 1", ciudad="Rosario",
+        )
+
+        with mock.patch("cotidjango.api_overview.start_admin_overview_refresh") as start_refresh:
+            stale = self.client.get("/api/admin/overview").json()
+            self.client.get("/api/admin/overview")
+
+        self.assertEqual(stale["counts"]["orders"], 0)
+        self.assertEqual(start_refresh.call_count, 1)
+
+        start_refresh.assert_called_once_with()
+
+    @override_settings(ALLOWED_HOSTS=["primero.test", "segundo.test"])
+    def test_cached_overview_uses_the_host_of_each_request(self):
+        CustomUser.objects.filter(pk=self.admin.pk).update(avatar="avatars/root.png")
+
+        self.client.get("/api/admin/overview", HTTP_HOST="primero.test")
+        data = self.client.get("/api/admin/overview", HTTP_HOST="segundo.test").json()
+
+        self.assertEqual(data["recentUsers"][0]["profile"]["avatar"], "http://segundo.test/media/avatars/root.png")
+        cached = cache.get("api:admin-overview")["payload"]
+        self.assertEqual(cached["recentUsers"][0]["profile"]["avatar"], "/media/avatars/root.png")
+
+
+class AdminOrderItemDiffTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.products = [
+            Product.objects.create(
+                user=self.admin, categoria=category, nombre=f"Vela {index}", slug=f"vela-{index}", precio="10.00",
+            )
+            for index in range(4)
+        ]
+        self.order = Order.objects.create(
+            user=self.admin, nombre="Cliente", email="root@example.com", direccion="Calle 1", ciudad="Rosario",
+        )
+        self.items = [
+            OrderItem.objects.create(
+                order=self.order,
+                product=product,
+                product_name=product.nombre,
+                cantidad=1,
+                precio_unitario="10.00",
+            )
+            for product in self.products[:3]
+        ]
+        self.order.recalc_total()
+        self.client.force_login(self.admin)
+
+    def _patch(self, items):
+        return self.client.patch(
+            f"/api/admin/orders/{self.order.pk}",
+            {"status": "approved", "items": items},
+            content_type="application/json",
+        )
+
+    def test_patch_updates_inserts_and_deletes_only_what_changed(self):
+        first, second, _third = self.items
+        response = self._patch([
+            {"itemId": first.pk, "productId": first.product_id, "name": "Vela 0", "qty": 5, "price": "10.00"},
+            {"productId": second.product_id, "name": "Vela 1", "qty": 1, "price": "10.00"},
+            {"productId": self.products[3].slug, "qty": 2},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        items = {item.product_id: item for item in self.order.items.all()}
+        self.assertEqual(set(items), {first.product_id, second.product_id, self.products[3].pk})
+        self.assertEqual(items[first.product_id].pk, first.pk)
+        self.assertEqual(items[first.product_id].cantidad, 5)
+        self.assertEqual(items[second.product_id].pk, second.pk)
+        self.assertEqual(items[self.products[3].pk].sort_key[:1], "1")
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.total), ("approved", 80))
+        self.assertEqual(
+            sorted(row["itemId"] for row in response.json()["items"]),
+            sorted(item.pk for item in items.values()),
+        )
+
+    def test_patch_with_same_items_does_not_rewrite_them(self):
+        payload = [
+            {"itemId": item.pk, "productId": item.product_id, "name": item.product_name, "qty": 1, "price": "10.00"}
+            for item in self.items
+        ]
+
+        with mock.patch.object(OrderItem.objects, "bulk_update") as bulk_update, mock.patch.object(
+            OrderItem.objects, "bulk_create"
+        ) as bulk_create:
+            response = self._patch(payload)
+
+        self.assertEqual(response.status_code, 200)
+        bulk_update.assert_not_called()
+        bulk_create.assert_not_called()
+        self.assertEqual(sorted(self.order.items.values_list("pk", flat=True)), sorted(item.pk for item in self.items))
+
+
+class OrderItemsEditorAdminTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.product = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Vela", slug="vela", precio="10.00", sku="V-1",
+        )
+        self.other = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Globo", slug="globo", precio="4.00", sku="G-1",
+        )
+        self.order = Order.objects.create(
+            user=self.admin, nombre="Mayorista", email="root@example.com", direccion="Calle 1", ciudad="Rosario",
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=self.order,
+                product=self.product,
+                product_name=f"Vela {index}",
+                cantidad=1,
+                precio_unitario="10.00",
+                sort_key=f"{index:04d}",
+            )
+            for index in range(70)
+        ])
+        self.order.recalc_total()
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:orders_order_items_json", args=[self.order.pk])
+
+    def test_large_order_change_form_skips_inline(self):
+        response = self.client.get(reverse("admin:orders_order_change", args=[self.order.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "items-TOTAL_FORMS")
+        self.assertContains(response, reverse("admin:orders_order_items_editor", args=[self.order.pk]))
+
+        response = self.client.get(reverse("admin:orders_order_items_editor", args=[self.order.pk]))
+        self.assertContains(response, f'data-items-url="{self.url}"')
+
+    def test_items_are_paginated_and_batch_saved_with_server_total(self):
+        response = self.client.get(self.url, {"page": 2, "limit": 50})
+        data = response.json()
+        self.assertEqual((data["total"], data["pages"], len(data["items"])), (70, 2, 20))
+        self.assertEqual(data["order"]["total"], "700.00")
+
+        first_page = self.client.get(self.url, {"limit": 2}).json()["items"]
+        response = self.client.post(
+            self.url,
+            {
+                "update": [{"id": first_page[0]["id"], "qty": 3, "price": "12,50"}],
+                "delete": [first_page[1]["id"]],
+                "create": [{"productId": self.other.id, "qty": 2}],
+            },
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        order = response.json()["order"]
+        # 68 velas a 10 + 3 x 12,50 + 2 globos a 4.
+        self.assertEqual((order["total"], order["lines"], order["units"]), ("725.50", 70, 73))
+        self.order.refresh_from_db()
+        self.assertEqual(str(self.order.total), "725.50")
+        created = self.order.items.get(product=self.other)
+        self.assertEqual((created.product_sku, created.categoria_nombre), ("G-1", "Velas"))
+
+    def test_batch_rejects_items_from_other_orders(self):
+        other_order = Order.objects.create(
+            user=self.admin, nombre="Otro", email="root@example.com", direccion="Calle 2", ciudad="Rosario",
+        )
+        foreign = OrderItem.objects.create(order=other_order, product=self.product, cantidad=1, precio_unitario="1.00")
+
+        response = self.client.post(
+            self.url,
+            {"update": [{"id": foreign.pk, "qty": 9}]},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.cantidad, 1)
+
+    def test_batch_rejects_prices_that_do_not_fit_the_column(self):
+        item_id = self.client.get(self.url, {"limit": 1}).json()["items"][0]["id"]
+        for price in ("NaN", "Infinity", "-Infinity", "100000000"):
+            response = self.client.post(
+                self.url,
+                {"update": [{"id": item_id, "price": price}]},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400, price)
+        self.assertEqual(str(OrderItem.objects.get(pk=item_id).precio_unitario), "10.00")
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.product = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Vela", slug="vela", precio="10.00",
+            stock=5, controla_stock=True,
+        )
+        self.variant = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Globo", slug="globo", precio="4.00",
+            stock=10, controla_stock=True,
+            atributos={"Color": ["Rojo", "Azul"]},
+            atributos_stock={"Color": {"Rojo": 3, "Azul": 7}},
+        )
+        self.untracked = Product.objects.create(
+            user=self.admin, categoria=category, nombre="Moño", slug="mono", precio="2.00",
+        )
+        StoreSettings.objects.update_or_create(pk=1, defaults={"min_order_amount": 0})
+        self.client.force_login(self.admin)
+
+    def _checkout(self, items):
+        return self.client.post(
+            "/api/orders",
+            {
+                "items": items,
+                "shipping": {
+                    "name": "Root",
+                    "email": "root@example.com",
+                    "phone": "123",
+                    "address": "Calle 1",
+                    "city": "Rosario",
+                    "zip": "2000",
+                },
+            },
+            content_type="application/json",
+        )
+
+    def test_checkout_reserves_stock_and_rejects_oversell(self):
+        response = self._checkout([
+            {"productId": self.product.id, "qty": 3},
+            {"productId": self.variant.id, "qty": 2, "attributes": {"Color": "Rojo"}},
+            {"productId": self.untracked.id, "qty": 50},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.variant.refresh_from_db()
+        self.untracked.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual((self.variant.stock, self.variant.atributos_stock["Color"]), (8, {"Rojo": 1, "Azul": 7}))
+        self.assertEqual(self.untracked.stock, 0)
+        self.assertEqual(StockMovement.objects.filter(tipo=StockMovement.RESERVA).count(), 2)
+
+        response = self._checkout([
+            {"productId": self.product.id, "qty": 1},
+            {"productId": self.variant.id, "qty": 2, "attributes": {"Color": "Rojo"}},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Globo (Color: Rojo)", response.json()["error"])
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+    def test_cancel_releases_and_paid_commits(self):
+        items = [{"productId": self.variant.id, "qty": 2, "attributes": {"Color": "Azul"}}]
+        cancelled = self._checkout(items).json()["order"]["id"]
+        paid = self._checkout(items).json()["order"]["id"]
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.atributos_stock["Color"]["Azul"], 3)
+
+        self.client.patch(f"/api/admin/orders/{cancelled}", {"status": "cancelled"}, content_type="application/json")
+        self.client.patch(f"/api/admin/orders/{paid}", {"status": "paid"}, content_type="application/json")
+        # Cancelar de nuevo no devuelve dos veces; un pedido pagado ya no libera solo.
+        self.client.patch(f"/api/admin/orders/{cancelled}", {"status": "cancelled"}, content_type="application/json")
+        self.client.patch(f"/api/admin/orders/{paid}", {"status": "cancelled"}, content_type="application/json")
+
+        self.variant.refresh_from_db()
+        self.assertEqual((self.variant.stock, self.variant.atributos_stock["Color"]["Azul"]), (8, 5))
+        tipos = list(StockMovement.objects.filter(order_id=paid).order_by("id").values_list("tipo", flat=True))
+        self.assertEqual(tipos, [StockMovement.RESERVA, StockMovement.CONFIRMACION])
+
+    def test_admin_cancel_action_releases_stock(self):
+        order_id = self._checkout([{"productId": self.product.id, "qty": 4}]).json()["order"]["id"]
+
+        self.client.post(
+            reverse("admin:orders_order_changelist"),
+            {"action": "cancelar", "_selected_action": [order_id]},
+        )
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertTrue(StockMovement.objects.filter(order_id=order_id, tipo=StockMovement.LIBERACION).exists())
+
+        self.client.post(
+            reverse("admin:orders_order_changelist"),
+            {"action": "aprobar", "_selected_action": [order_id]},
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+
+    def _patch(self, order_id, status, items=None):
+        payload = {"status": status}
+        if items is not None:
+            payload["items"] = items
+        return self.client.patch(f"/api/admin/orders/{order_id}", payload, content_type="application/json")
+
+    def test_leaving_cancelled_reserves_stock_again(self):
+        order_id = self._checkout([{"productId": self.product.id, "qty": 3}]).json()["order"]["id"]
+
+        self._patch(order_id, "cancelled")
+        self.assertEqual(self._patch(order_id, "approved").status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+        self._patch(order_id, "cancelled")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        tipos = list(StockMovement.objects.filter(order_id=order_id).order_by("id").values_list("tipo", flat=True))
+        self.assertEqual(tipos, [StockMovement.RESERVA, StockMovement.LIBERACION] * 2)
+
+        # Mientras estaba cancelado otro pedido se llevo el stock: no se puede reactivar.
+        self._checkout([{"productId": self.product.id, "qty": 4}])
+        response = self._patch(order_id, "paid")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.get(pk=order_id).status, "cancelled")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def test_item_edits_reconcile_the_reservation(self):
+        order_id = self._checkout([
+            {"productId": self.product.id, "qty": 2},
+            {"productId": self.variant.id, "qty": 2, "attributes": {"Color": "Rojo"}},
+        ]).json()["order"]["id"]
+        items = {item.product_id: item.pk for item in OrderItem.objects.filter(order_id=order_id)}
+
+        response = self._patch(order_id, "approved", [
+            {"itemId": items[self.product.id], "productId": self.product.id, "qty": 4, "price": "10.00"},
+            {"itemId": items[self.variant.id], "productId": self.variant.id, "qty": 2, "price": "4.00", "attributes": {"Color": "Azul"}},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.variant.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual((self.variant.stock, self.variant.atributos_stock["Color"]), (8, {"Rojo": 3, "Azul": 5}))
+        self.assertEqual(StockMovement.objects.filter(order_id=order_id, tipo=StockMovement.AJUSTE).count(), 3)
+
+        response = self._patch(order_id, "approved", [
+            {"itemId": items[self.product.id], "productId": self.product.id, "qty": 9, "price": "10.00"},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+        # Un pedido cancelado ya devolvio todo: editarlo no toma stock.
+        self._patch(order_id, "cancelled")
+        self._patch(order_id, "cancelled", [
+            {"itemId": items[self.product.id], "productId": self.product.id, "qty": 5, "price": "10.00"},
+        ])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+class OrderIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="cliente",
+            email="cliente@example.com",
+            password="secret123",
+            approval_status="approved",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.product = Product.objects.create(
+            user=self.user, categoria=category, nombre="Vela", slug="vela", precio="10.00",
+        )
+        StoreSettings.objects.update_or_create(pk=1, defaults={"min_order_amount": 0})
+        self.client.force_login(self.user)
+
+    def _checkout(self, qty=1, key="retry-1"):
+        return self.client.post(
+            "/api/orders",
+            {
+                "items": [{"productId": self.product.id, "qty": qty}],
+                "shipping": {
+                    "name": "Cliente",
+                    "email": "cliente@example.com",
+                    "phone": "123",
+                    "address": "Calle 1",
+                    "city": "Rosario",
+                    "zip": "2000",
+                },
+            },
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_retry_returns_original_order_without_emails(self):
+        with mock.patch("cotidjango.api_orders.send_invoice_email") as invoice_email:
+            first = self._checkout()
+            retry = self._checkout()
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(invoice_email.call_count, 1)
+
+    def test_same_key_with_other_payload_is_rejected(self):
+        self._checkout(qty=1)
+
+        response = self._checkout(qty=2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(ORDER_IDEMPOTENCY_WINDOW_SECONDS=60)
+    def test_expired_key_creates_a_new_order(self):
+        self._checkout()
+        OrderIdempotencyKey.objects.update(creado_en=timezone.now() - timedelta(minutes=5))
+
+        response = self._checkout()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderIdempotencyKey.objects.count(), 1)
 
-# Create your tests here.
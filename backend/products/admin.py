@@ -2,12 +2,17 @@ from pathlib import Path
 import re
 
 from django.contrib import admin, messages
+from django.core.cache import cache
 from django.shortcuts import redirect
 from django.template.response import TemplateResponse
 from django.urls import path, reverse
+from django.utils import timezone
 
+
+from .changes import touch_offer_products
 from .forms import HomeMarqueeAdminForm, ProductAdminForm
 from .models import Category, HomeImage, HomeMarquee, Offer, Product, ProductImage, StoreSettings
+from .near_duplicates import apply_merge_proposals, find_near_duplicates
 from .product_importer import EXPORT_HEADERS, PRODUCT_HEADERS, SAMPLE_ROWS, ProductXlsxImporter
 
 admin.site.site_header = "Admin Coti"
@@ -15,6 +20,9 @@ admin.site.site_title = "Admin Coti"
 admin.site.index_title = "Panel de administracion"
 
 
+NEAR_DUPLICATES_CACHE_KEY = "admin:products:near-duplicates"
+NEAR_DUPLICATES_CACHE_TIMEOUT = 10 * 60
+
 MISSING_IDPRODUCT_RE = re.compile(r"^Fila (?P<row>\d+): IDProduct (?P<id>\d+) no existe\.")
 
 
@@ -56,6 +64,28 @@ def summarize_import_errors(errors):
     return summary
 
 
+def summarize_preview(report, limit=50):
+    return {
+        "rows": report["rows"],
+        "unchanged": report["unchanged"],
+        "counts": {
+            "created": len(report["created"]),
+            "updated": len(report["updated"]),
+            "merges": len(report["merges"]),
+            "offers": len(report["offers"]),
+            "new_categories": len(report["new_categories"]),
+            "missing": report["missing_total"],
+        },
+        "created": report["created"][:limit],
+        "updated": report["updated"][:limit],
+        "merges": report["merges"][:limit],
+        "offers": report["offers"][:limit],
+        "new_categories": report["new_categories"][:limit],
+        "missing": report["missing"][:limit],
+        "limit": limit,
+    }
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ("nombre", "slug", "parent")
@@ -76,7 +106,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ("sku", "nombre", "precio", "stock", "sin_stock", "activo", "categoria", "creado_en")
     list_display_links = ("nombre",)
     search_fields = ("sku", "nombre", "descripcion", "slug", "categoria__nombre")
-    list_filter = ("creado_en", "activo", "sin_stock", "categoria")
+    list_filter = ("creado_en", "activo", "sin_stock", "controla_stock", "categoria")
     list_editable = ("precio", "stock", "sin_stock", "activo")
     search_help_text = "Buscar producto por SKU, nombre, slug o descripcion"
     change_list_template = "admin/products/product/change_list.html"
@@ -86,14 +116,21 @@ class ProductAdmin(admin.ModelAdmin):
     class Media:
         js = ("admin/js/product_attributes.js",)
 
+    def save_model(self, request, obj, form, change):
+        from orders.stock import record_stock_adjustment
+
+        super().save_model(request, obj, form, change)
+        if change and "stock" in form.changed_data:
+            record_stock_adjustment(obj, form.initial.get("stock"), nota=f"Admin: {request.user}")
+
     @admin.action(description="Marcar productos seleccionados como Sin Stock")
     def marcar_sin_stock(self, request, queryset):
-        queryset.update(sin_stock=True)
+        queryset.update(sin_stock=True, actualizado_en=timezone.now())
         self.message_user(request, "Productos marcados como Sin Stock.")
 
     @admin.action(description="Marcar productos seleccionados con Stock")
     def marcar_con_stock(self, request, queryset):
-        queryset.update(sin_stock=False)
+        queryset.update(sin_stock=False, actualizado_en=timezone.now())
         self.message_user(request, "Productos marcados con Stock.")
 
     template_xlsx_path = str(Path(__file__).resolve().parent / "resources" / "ProductosCoti_base.xlsx")
@@ -116,9 +153,52 @@ class ProductAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.import_xlsx_view),
                 name="products_product_import_xlsx",
             ),
+            path(
+                "duplicados-cercanos/",
+                self.admin_site.admin_view(self.near_duplicates_view),
+                name="products_product_near_duplicates",
+            ),
         ]
         return custom + urls
 
+    def near_duplicates_view(self, request):
+        url = reverse("admin:products_product_near_duplicates")
+        if request.method == "POST":
+            if not self.has_delete_permission(request):
+                messages.error(request, "No tenes permiso para fusionar productos.")
+                return redirect(url)
+            try:
+                survivor = int(request.POST.get("survivor") or 0)
+                duplicates = [int(pk) for pk in request.POST.getlist("duplicates")]
+            except ValueError:
+                duplicates = []
+            if not survivor or not duplicates:
+                messages.error(request, "Selecciona al menos un producto para fusionar.")
+                return redirect(url)
+            merged = apply_merge_proposals(
+                [{"survivor": survivor, "duplicates": duplicates}],
+                request_user=request.user,
+            )
+            cache.delete(NEAR_DUPLICATES_CACHE_KEY)
+            messages.success(request, f"Productos fusionados en {survivor}: {merged}")
+            return redirect(url)
+
+        # El calculo recorre todo el catalogo; se guarda un rato para no repetirlo en cada visita.
+        proposals = None if request.GET.get("refresh") else cache.get(NEAR_DUPLICATES_CACHE_KEY)
+        if proposals is None:
+            proposals = find_near_duplicates()
+            cache.set(NEAR_DUPLICATES_CACHE_KEY, proposals, NEAR_DUPLICATES_CACHE_TIMEOUT)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Productos casi duplicados",
+            "proposals": proposals[:200],
+            "proposal_count": len(proposals),
+            "refresh_url": f"{url}?refresh=1",
+        }
+        return TemplateResponse(request, "admin/products/product/near_duplicates.html", context)
+
     def import_xlsx_view(self, request):
         importer = ProductXlsxImporter(
             request_user=request.user,
@@ -131,6 +211,9 @@ class ProductAdmin(admin.ModelAdmin):
         if request.method == "GET" and request.GET.get("template"):
             return importer.export_template_response()
 
+        if request.method == "GET" and request.GET.get("export") == "csv":
+            return importer.export_products_csv_response()
+
         if request.method == "GET" and request.GET.get("export"):
             return importer.export_products_response()
 
@@ -138,12 +221,23 @@ class ProductAdmin(admin.ModelAdmin):
         updated = 0
         errors = []
         error_summary = []
+        preview = None
 
         if request.method == "POST":
             upload = request.FILES.get("file")
             if not upload:
-                messages.error(request, "Selecciona un archivo XLSX.")
+                messages.error(request, "Selecciona un archivo XLSX o CSV.")
                 return redirect(reverse("admin:products_product_import_xlsx"))
+            if request.POST.get("preview"):
+                try:
+                    preview = importer.preview_upload(upload)
+                except Exception as exc:  # pragma: no cover
+                    messages.error(request, f"No se pudo procesar el archivo: {exc}")
+                    return redirect(reverse("admin:products_product_import_xlsx"))
+                messages.info(request, "Vista previa generada. No se guardo ningun cambio.")
+                errors = preview["errors"]
+                error_summary = summarize_import_errors(errors)
+        if request.method == "POST" and preview is None:
             try:
                 created, updated, errors = importer.import_upload(upload)
                 if created or updated:
@@ -163,7 +257,7 @@ class ProductAdmin(admin.ModelAdmin):
                         "Podes ver el detalle completo en el resumen de esta pantalla.",
                     )
             except Exception as exc:  # pragma: no cover
-                messages.error(request, f"No se pudo procesar el XLSX: {exc}")
+                messages.error(request, f"No se pudo procesar el archivo: {exc}")
                 return redirect(reverse("admin:products_product_import_xlsx"))
 
         context = {
@@ -173,12 +267,14 @@ class ProductAdmin(admin.ModelAdmin):
             "headers": self.product_headers,
             "export_headers": self.export_headers,
             "export_url": f"{reverse('admin:products_product_import_xlsx')}?export=1",
+            "export_csv_url": f"{reverse('admin:products_product_import_xlsx')}?export=csv",
             "created": created,
             "updated": updated,
             "errors": errors,
             "error_summary": error_summary,
             "visible_errors": errors[:20],
             "hidden_error_count": max(len(errors) - 20, 0),
+            "preview": summarize_preview(preview) if preview else None,
         }
         return TemplateResponse(request, "admin/products/product/import_xlsx.html", context)
 
@@ -195,10 +291,12 @@ class OfferAdmin(admin.ModelAdmin):
     @admin.action(description="Activar ofertas seleccionadas")
     def activar_ofertas(self, request, queryset):
         queryset.update(activo=True)
+        touch_offer_products(queryset)
 
     @admin.action(description="Desactivar ofertas seleccionadas")
     def desactivar_ofertas(self, request, queryset):
         queryset.update(activo=False)
+        touch_offer_products(queryset)
 
 
 @admin.register(HomeImage)
@@ -0,0 +1,470 @@
+"""Motor de planes de categorias: mover productos, fusionar y renombrar.
+
+El plan se resuelve entero en memoria a partir de una sola carga de categorias y
+conteos; recien al final se aplican unas pocas UPDATE por conjunto dentro de una
+transaccion. Sin ``apply_changes`` no se escribe nada en la DB.
+
+Formato (JSON o YAML)::
+
+    {
+      "operations": [
+        {"move": "Velas > Bengalas", "to": "Bengalas", "delete_source_if_empty": true},
+        {"merge": ["Libreria", "Manualidades"], "into": "Articulos Para Manualidades"},
+        {"rename": "Cotillon", "to": "Cotillon y Fiesta", "parent": null}
+      ],
+      "dedupe": true
+    }
+
+Las categorias se indican por id o por ruta ``"Padre > Hija"``. ``move`` lleva solo
+los productos; ``merge`` lleva productos, ofertas e hijas y elimina el origen;
+``rename`` cambia el nombre y, si trae ``parent``, cuelga la categoria de otro padre
+(``null`` la deja en la raiz). ``dedupe`` fusiona al final las hermanas con el mismo
+nombre en la de menor id, en cascada.
+"""
+
+import json
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .changes import touch_category_products
+from .models import Category, Offer, Product
+
+
+UPDATE_CASE_CHUNK_SIZE = 500
+
+
+class CategoryPlanError(ValueError):
+    pass
+
+
+def load_category_plan(path):
+    path = Path(path)
+    text = path.read_text(encoding="utf-8-sig")
+    if path.suffix.lower() in {".yml", ".yaml"}:
+        try:
+            import yaml
+        except ImportError as exc:
+            raise CategoryPlanError("Para planes YAML hace falta PyYAML; tambien se puede usar JSON.") from exc
+        data = yaml.safe_load(text)
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as exc:
+            raise CategoryPlanError(f"El plan no es un JSON valido: {exc}") from exc
+    if isinstance(data, list):
+        data = {"operations": data}
+    if not isinstance(data, dict):
+        raise CategoryPlanError("El plan debe ser una lista de operaciones o un objeto con 'operations'.")
+    return data
+
+
+class _Buckets:
+    """Union-find con re-etiquetado.
+
+    Cada categoria apunta a un balde; mover el contenido de A a B une el balde de A
+    con el de B y le da a A un balde nuevo y vacio. Asi una secuencia de movimientos
+    se resuelve sin recorrer los productos: el destino final de lo que habia en una
+    categoria es la etiqueta de la raiz de su balde original.
+    """
+
+    def __init__(self, category_ids, counts):
+        self.parent = []
+        self.label = {}
+        self.count = {}
+        self.node = {}
+        self.origin = {}
+        for category_id in category_ids:
+            self.origin[category_id] = self._new(category_id, counts.get(category_id, 0))
+
+    def _new(self, category_id, count):
+        node = len(self.parent)
+        self.parent.append(node)
+        self.label[node] = category_id
+        self.count[node] = count
+        self.node[category_id] = node
+        return node
+
+    def _find(self, node):
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def count_of(self, category_id):
+        return self.count[self.node[category_id]]
+
+    def move(self, source_id, target_id):
+        source = self.node[source_id]
+        target = self.node[target_id]
+        moved = self.count[source]
+        if source == target or not moved:
+            return 0
+        self.parent[source] = target
+        self.count[target] += moved
+        self._new(source_id, 0)
+        return moved
+
+    def final(self, category_id):
+        return self.label[self._find(self.origin[category_id])]
+
+
+class CategoryPlan:
+    def __init__(self, operations=(), *, dedupe=False):
+        self.operations = list(operations or [])
+        self.dedupe = bool(dedupe)
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data.get("operations") or [], dedupe=data.get("dedupe", False))
+
+    def run(self, *, apply_changes=False):
+        """Resuelve el plan y, con ``apply_changes``, lo aplica en una transaccion.
+
+        Devuelve ``{"operations": [...], "dedupe": [...], "deleted": n, "status": ...}``
+        con un reporte por operacion y por grupo de duplicadas fusionado.
+        """
+        self._load()
+        status = "applied" if apply_changes else "simulated"
+        reports = [self._run_operation(index, operation, status) for index, operation in enumerate(self.operations, 1)]
+        dedupe_reports = self._dedupe(status) if self.dedupe else []
+        self._check_cycles()
+        if apply_changes:
+            self._write()
+        return {
+            "operations": reports,
+            "dedupe": dedupe_reports,
+            "deleted": len(self.deleted),
+            "status": status,
+        }
+
+    def _load(self):
+        rows = list(Category.objects.order_by("id").values("id", "nombre", "parent_id"))
+        self.original = {row["id"]: (row["nombre"], row["parent_id"]) for row in rows}
+        self.name = {row["id"]: row["nombre"] for row in rows}
+        self.parent = {row["id"]: row["parent_id"] for row in rows}
+        self.children = {None: set()}
+        for row in rows:
+            self.children.setdefault(row["id"], set())
+        for row in rows:
+            parent_id = row["parent_id"] if row["parent_id"] in self.original else None
+            self.parent[row["id"]] = parent_id
+            self.children[parent_id].add(row["id"])
+        self.alive = set(self.original)
+        self.deleted = set()
+        self.merged_into = {}
+
+        product_counts = dict(
+            Product.objects.filter(categoria__isnull=False)
+            .values("categoria_id")
+            .annotate(total=Count("id"))
+            .values_list("categoria_id", "total")
+        )
+        offer_counts = dict(
+            Offer.objects.filter(categoria__isnull=False)
+            .values("categoria_id")
+            .annotate(total=Count("id"))
+            .values_list("categoria_id", "total")
+        )
+        self.products = _Buckets(self.original, product_counts)
+        self.offers = _Buckets(self.original, offer_counts)
+
+    # Resolucion de referencias -------------------------------------------------
+
+    def path(self, category_id):
+        parts = []
+        seen = set()
+        while category_id is not None and category_id not in seen:
+            seen.add(category_id)
+            parts.append(self.name[category_id])
+            category_id = self.parent[category_id]
+        return " > ".join(reversed(parts))
+
+    def label(self, category_id):
+        if category_id is None:
+            return "-"
+        parent_id = self.parent.get(category_id)
+        parent_name = self.name[parent_id] if parent_id else "-"
+        return f"{category_id} / {self.name[category_id]} / parent={parent_name}"
+
+    def _resolve(self, reference, *, required=True):
+        """Id o ruta de una categoria viva. Si es destino (``required``), un id ya
+        fusionado se sigue hasta la categoria que lo absorbio."""
+        if isinstance(reference, bool) or reference in (None, ""):
+            raise CategoryPlanError(f"Referencia de categoria invalida: {reference!r}")
+        if isinstance(reference, int) or str(reference).strip().isdigit():
+            category_id = int(reference)
+            while required and category_id in self.merged_into:
+                category_id = self.merged_into[category_id]
+            if category_id in self.alive:
+                return category_id
+            if required:
+                raise CategoryPlanError(f"No existe la categoria {reference}.")
+            return None
+
+        parts = [part.strip() for part in str(reference).split(">") if part.strip()]
+        candidates = {None}
+        for part in parts:
+            candidates = {
+                child
+                for parent_id in candidates
+                for child in self.children.get(parent_id, ())
+                if self.name[child] == part
+            }
+            if not candidates:
+                break
+        if len(candidates) > 1:
+            raise CategoryPlanError(f"Se encontraron multiples categorias '{reference}'.")
+        if not candidates or candidates == {None}:
+            if required:
+                raise CategoryPlanError(f"No se encontro la categoria '{reference}'.")
+            return None
+        return next(iter(candidates))
+
+    def _is_descendant(self, category_id, ancestor_id):
+        while category_id is not None:
+            if category_id == ancestor_id:
+                return True
+            category_id = self.parent[category_id]
+        return False
+
+    # Operaciones ---------------------------------------------------------------
+
+    def _run_operation(self, index, operation, status):
+        if not isinstance(operation, dict):
+            raise CategoryPlanError(f"Operacion {index}: debe ser un objeto.")
+        if "move" in operation:
+            return self._move(operation, status)
+        if "merge" in operation:
+            return self._merge_operation(operation, status)
+        if "rename" in operation:
+            return self._rename(operation, status)
+        raise CategoryPlanError(f"Operacion {index}: se esperaba 'move', 'merge' o 'rename'.")
+
+    def _report(self, operation, default_label, status, **values):
+        report = {
+            "label": operation.get("label") or default_label,
+            "status": status,
+            "moved": 0,
+            "offers": 0,
+            "children": 0,
+            "deleted": 0,
+            "source_products_after": 0,
+            "source_label": "-",
+            "target_label": "-",
+        }
+        report.update(values)
+        return report
+
+    def _move(self, operation, status):
+        default_label = f"Mover productos de {operation['move']} a {operation.get('to')}"
+        target = self._resolve(operation.get("to"))
+        source = self._resolve(operation["move"], required=False)
+        if source is None:
+            return self._report(
+                operation, default_label, "already_applied_or_missing_source", target_label=self.label(target)
+            )
+        source_label = self.label(source)
+        moved = self.products.move(source, target)
+        deleted = 0
+        if (
+            operation.get("delete_source_if_empty", False)
+            and source != target
+            and self.products.count_of(source) == 0
+            and self.offers.count_of(source) == 0
+            and not self.children[source]
+        ):
+            self._delete(source)
+            deleted = 1
+        return self._report(
+            operation,
+            default_label,
+            status,
+            moved=moved,
+            deleted=deleted,
+            source_products_after=0 if deleted else self.products.count_of(source),
+            source_label=source_label,
+            target_label=self.label(target),
+        )
+
+    def _merge_operation(self, operation, status):
+        sources = operation["merge"]
+        if not isinstance(sources, list):
+            sources = [sources]
+        default_label = f"Fusionar {', '.join(str(item) for item in sources)} en {operation.get('into')}"
+        target = self._resolve(operation.get("into"))
+        resolved = [self._resolve(source, required=False) for source in sources]
+        resolved = [source for source in resolved if source is not None and source != target]
+        if not resolved:
+            return self._report(
+                operation, default_label, "already_applied_or_missing_source", target_label=self.label(target)
+            )
+        totals = {"moved": 0, "offers": 0, "children": 0, "deleted": 0}
+        labels = []
+        for source in resolved:
+            labels.append(self.label(source))
+            for key, value in self._merge(source, target).items():
+                totals[key] += value
+        return self._report(
+            operation,
+            default_label,
+            status,
+            source_label=", ".join(labels),
+            target_label=self.label(target),
+            **totals,
+        )
+
+    def _merge(self, source, target):
+        if self._is_descendant(target, source):
+            raise CategoryPlanError(
+                f"No se puede fusionar '{self.path(source)}' en su descendiente '{self.path(target)}'."
+            )
+        children = sorted(self.children[source])
+        for child in children:
+            self.parent[child] = target
+            self.children[target].add(child)
+        self.children[source] = set()
+        result = {
+            "moved": self.products.move(source, target),
+            "offers": self.offers.move(source, target),
+            "children": len(children),
+            "deleted": 1,
+        }
+        self._delete(source)
+        self.merged_into[source] = target
+        return result
+
+    def _delete(self, category_id):
+        self.children[self.parent[category_id]].discard(category_id)
+        self.alive.discard(category_id)
+        self.deleted.add(category_id)
+
+    def _rename(self, operation, status):
+        default_label = f"Renombrar {operation['rename']}"
+        category = self._resolve(operation["rename"])
+        source_label = self.label(category)
+        new_name = str(operation.get("to") or self.name[category]).strip()
+        if "parent" in operation:
+            parent_ref = operation["parent"]
+            new_parent = None if parent_ref in (None, "") else self._resolve(parent_ref)
+            if new_parent is not None and self._is_descendant(new_parent, category):
+                raise CategoryPlanError(
+                    f"'{self.path(category)}' no puede quedar dentro de su descendiente '{self.path(new_parent)}'."
+                )
+            self.children[self.parent[category]].discard(category)
+            self.parent[category] = new_parent
+            self.children[new_parent].add(category)
+        self.name[category] = new_name
+        return self._report(
+            operation,
+            f"{default_label} a {new_name}",
+            status,
+            source_label=source_label,
+            target_label=self.label(category),
+        )
+
+    def _dedupe(self, status):
+        reports = []
+        while True:
+            groups = {}
+            for category_id in sorted(self.alive):
+                groups.setdefault((self.parent[category_id], self.name[category_id]), []).append(category_id)
+            duplicates = [ids for ids in groups.values() if len(ids) > 1]
+            if not duplicates:
+                return reports
+            # Fusionar puede juntar hijas con el mismo nombre bajo la canonica: se repite
+            # en memoria hasta que no quede ninguna, sin volver a consultar la DB.
+            for ids in sorted(duplicates, key=lambda ids: (self.parent[ids[0]] or 0, self.name[ids[0]])):
+                canonical, others = ids[0], ids[1:]
+                report = {
+                    "label": f"{self.name[canonical]} / parent={self.parent[canonical] or '-'}",
+                    "status": status,
+                    "canonical_label": self.label(canonical),
+                    "duplicates": [],
+                    "products_moved": 0,
+                    "offers_moved": 0,
+                    "children_moved": 0,
+                    "deleted": 0,
+                }
+                for duplicate in others:
+                    duplicate_label = self.label(duplicate)
+                    result = self._merge(duplicate, canonical)
+                    report["duplicates"].append({
+                        "label": duplicate_label,
+                        "products": result["moved"],
+                        "offers": result["offers"],
+                        "children": result["children"],
+                    })
+                    report["products_moved"] += result["moved"]
+                    report["offers_moved"] += result["offers"]
+                    report["children_moved"] += result["children"]
+                    report["deleted"] += 1
+                reports.append(report)
+
+    def _check_cycles(self):
+        for category_id in self.alive:
+            seen = set()
+            current = category_id
+            while current is not None:
+                if current in seen:
+                    raise CategoryPlanError(f"El plan deja un ciclo en '{self.name[category_id]}'.")
+                seen.add(current)
+                current = self.parent[current]
+
+    # Escritura -----------------------------------------------------------------
+
+    def _write(self):
+        changed = [
+            category_id
+            for category_id in sorted(self.alive)
+            if (self.name[category_id], self.parent[category_id]) != self.original[category_id]
+        ]
+        product_moves = {
+            category_id: self.products.final(category_id)
+            for category_id in self.original
+            if self.products.final(category_id) != category_id
+        }
+        offer_moves = {
+            category_id: self.offers.final(category_id)
+            for category_id in self.original
+            if self.offers.final(category_id) != category_id
+        }
+        with transaction.atomic():
+            if changed:
+                categories = list(Category.objects.filter(pk__in=changed))
+                for category in categories:
+                    category.nombre = self.name[category.pk]
+                    category.parent_id = self.parent[category.pk]
+                Category.objects.bulk_update(categories, ["nombre", "parent"], batch_size=UPDATE_CASE_CHUNK_SIZE)
+            self._update_by_case(Product.objects, "categoria_id", product_moves)
+            self._update_by_case(Offer.objects, "categoria_id", offer_moves)
+            touch_category_products({*changed, *product_moves.values(), *offer_moves.values()})
+            if self.deleted:
+                Category.objects.filter(pk__in=self.deleted).delete()
+
+    def _update_by_case(self, manager, field, mapping):
+        """Reasigna ``field`` segun ``mapping`` {origen: destino} con un CASE por tanda.
+
+        Las filas se eligen por pk antes de escribir: con cadenas A -> B y B -> X en
+        tandas distintas, lo que ya llego de A a B no vuelve a moverse a X.
+        """
+        sources = sorted(mapping)
+        rows = []
+        for start in range(0, len(sources), UPDATE_CASE_CHUNK_SIZE):
+            chunk = sources[start:start + UPDATE_CASE_CHUNK_SIZE]
+            rows.extend(manager.filter(**{f"{field}__in": chunk}).values_list("pk", field))
+        rows.sort()
+        for start in range(0, len(rows), UPDATE_CASE_CHUNK_SIZE):
+            chunk = rows[start:start + UPDATE_CASE_CHUNK_SIZE]
+            chunk_sources = sorted({source for _pk, source in chunk})
+            manager.filter(pk__in=[pk for pk, _source in chunk]).update(
+                **{
+                    field: Case(
+                        *[When(**{field: source}, then=Value(mapping[source])) for source in chunk_sources],
+                        output_field=IntegerField(),
+                    )
+                }
+            )
@@ -0,0 +1,149 @@
+"""Marcas de modificacion de productos para la sincronizacion incremental.
+
+``Product.actualizado_en`` se actualiza solo en ``save()``. Los cambios que pasan por
+``update()``/``bulk_update()`` o que tocan datos que el producto muestra (ofertas,
+imagenes, categorias) lo marcan con estas funciones. Los borrados quedan en
+``ProductDeletion``. ``product_changes`` recorre ambos por (fecha, id) con un cursor.
+Marcar un producto tambien reprograma su documento JSON (``documents``). La importacion
+junta las marcas con ``deferred_product_touches`` y las aplica de una vez al terminar.
+"""
+
+import base64
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .documents import schedule_product_documents
+from .models import Category, Product, ProductDeletion
+
+
+PRODUCT_CHANGES_DEFAULT_LIMIT = 500
+PRODUCT_CHANGES_MAX_LIMIT = 1000
+
+_deferred = threading.local()
+
+
+def touch_products(product_ids):
+    product_ids = {pk for pk in product_ids if pk}
+    if not product_ids:
+        return 0
+    pending = getattr(_deferred, "products", None)
+    if pending is not None:
+        pending.update(product_ids)
+        return 0
+    schedule_product_documents(product_ids)
+    return Product.objects.filter(pk__in=product_ids).update(actualizado_en=timezone.now())
+
+
+def _category_subtree(category_ids):
+    """Las categorias y todas sus subcategorias, bajando un nivel por consulta."""
+    seen = set()
+    level = {pk for pk in category_ids if pk}
+    while level:
+        seen |= level
+        level = set(Category.objects.filter(parent_id__in=level).values_list("id", flat=True)) - seen
+    return seen
+
+
+def touch_category_products(category_ids):
+    """Marca los productos de las categorias y de todas sus subcategorias."""
+    category_ids = {pk for pk in category_ids if pk}
+    if not category_ids:
+        return 0
+    pending = getattr(_deferred, "categories", None)
+    if pending is not None:
+        pending.update(category_ids)
+        return 0
+    products = Product.objects.filter(categoria_id__in=_category_subtree(category_ids))
+    schedule_product_documents(products.values_list("id", flat=True))
+    return products.update(actualizado_en=timezone.now())
+
+
+@contextmanager
+def deferred_product_touches():
+    """Junta las marcas de un proceso masivo (la importacion) y las aplica en bloque al final."""
+    if getattr(_deferred, "products", None) is not None:
+        yield
+        return
+    _deferred.products, _deferred.categories = set(), set()
+    try:
+        yield
+        product_ids, category_ids = _deferred.products, _deferred.categories
+    finally:
+        _deferred.products = _deferred.categories = None
+    touch_products(product_ids)
+    touch_category_products(category_ids)
+
+
+def touch_offer_products(offers):
+    """Marca los productos cuyo precio final depende de estas ofertas."""
+    offers = list(offers)
+    touch_products({offer.producto_id for offer in offers})
+    touch_category_products({offer.categoria_id for offer in offers})
+
+
+def encode_changes_cursor(moment, pk):
+    raw = f"{moment.isoformat()}|{pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_changes_cursor(token):
+    """Acepta el cursor devuelto antes o una fecha ISO; lanza ``ValueError`` si no es ninguno."""
+    token = (token or "").strip()
+    if not token:
+        return None, 0
+    try:
+        moment = datetime.fromisoformat(token.replace("Z", "+00:00"))
+        pk = 0
+    except ValueError:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        moment_text, _, pk_text = raw.partition("|")
+        moment, pk = datetime.fromisoformat(moment_text), int(pk_text)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, pk
+
+
+def _after(moment_field, pk_field, moment, pk):
+    return Q(**{f"{moment_field}__gt": moment}) | Q(**{moment_field: moment, f"{pk_field}__gt": pk})
+
+
+def product_changes(token="", limit=PRODUCT_CHANGES_DEFAULT_LIMIT):
+    """Ids modificados y borrados despues del cursor, en orden (fecha, id).
+
+    Solo se informan marcas con al menos ``PRODUCT_CHANGES_SAFETY_SECONDS`` de antiguedad:
+    una transaccion que todavia no confirmo no puede quedar detras de un cursor ya entregado.
+    Los borrados se informan hasta el (fecha, id) del ultimo producto devuelto, asi una
+    pagina nunca adelanta borrados que la siguiente vuelve a mandar.
+    """
+    since, since_pk = decode_changes_cursor(token)
+    limit = max(1, min(PRODUCT_CHANGES_MAX_LIMIT, int(limit)))
+    horizon = timezone.now() - timedelta(seconds=settings.PRODUCT_CHANGES_SAFETY_SECONDS)
+
+    changed = Product.objects.filter(actualizado_en__lte=horizon).order_by("actualizado_en", "id")
+    deleted = ProductDeletion.objects.filter(eliminado_en__lte=horizon).order_by("eliminado_en", "product_id")
+    if since is not None:
+        changed = changed.filter(_after("actualizado_en", "id", since, since_pk))
+        deleted = deleted.filter(_after("eliminado_en", "product_id", since, since_pk))
+    rows = list(changed.values_list("id", "actualizado_en")[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        deleted = deleted.exclude(_after("eliminado_en", "product_id", rows[-1][1], rows[-1][0]))
+    deletions = list(deleted.values_list("product_id", "eliminado_en"))
+
+    cursor = (since, since_pk) if since is not None else None
+    if rows:
+        cursor = (rows[-1][1], rows[-1][0])
+    if deletions and (cursor is None or (deletions[-1][1], deletions[-1][0]) > cursor):
+        cursor = (deletions[-1][1], deletions[-1][0])
+    return {
+        "changed": [pk for pk, _moment in rows],
+        "deleted": list(dict.fromkeys(pk for pk, _moment in deletions)),
+        "next": encode_changes_cursor(*cursor) if cursor else "",
+        "hasMore": has_more,
+    }
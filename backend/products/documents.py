@@ -0,0 +1,166 @@
+"""Documentos JSON precalculados de cada producto (``ProductDocument``).
+
+Guardan lo que devuelve ``serialize_product`` salvo el host de las imagenes subidas, asi el
+detalle y el listado publico no vuelven a recorrer categorias, imagenes, variantes y
+ofertas en cada pedido. Se regeneran al guardar el producto y cuando ``changes.touch_*``
+lo marca (imagenes, ofertas, categorias); la importacion los junta y los arma al final.
+
+Al leerlos se descartan los que quedaron viejos: otra ``PRODUCT_DOCUMENT_VERSION``, otro
+``Product.actualizado_en`` (cambios por ``update()`` que no pasaron por aca) o una oferta
+que empezo o termino despues de armarlos (``valido_hasta``).
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from cotidjango.api_common import build_product_document, discount_from_offer, get_ancestor_ids, render_product_document
+
+from .models import Category, Offer, Product, ProductDocument
+
+
+# Subirla cuando cambie la forma del documento: los viejos se rearman al leerlos.
+PRODUCT_DOCUMENT_VERSION = 1
+PRODUCT_DOCUMENT_CHUNK_SIZE = 500
+
+_deferred = threading.local()
+
+
+def _category_tree():
+    """Todas las categorias con ``parent`` ya enlazado, para armar rutas sin mas consultas."""
+    categories = {cat.pk: cat for cat in Category.objects.all()}
+    for cat in categories.values():
+        if cat.parent_id in categories:
+            cat.parent = categories[cat.parent_id]
+    return categories
+
+
+class _OfferIndex:
+    """Misma eleccion de oferta que ``resolve_discount_for_product``, con una sola consulta."""
+
+    def __init__(self, now):
+        self.now = now
+        self.offers = list(Offer.objects.filter(activo=True))
+
+    def _is_active(self, offer):
+        return (offer.empieza is None or offer.empieza <= self.now) and (offer.termina is None or offer.termina >= self.now)
+
+    def resolve(self, product):
+        """Devuelve (descuento, valido_hasta) del producto."""
+        xlsx_slug = f"xlsx-offer-product-{product.pk}"
+        category_ids = set(get_ancestor_ids(product.categoria))
+        relevant = [
+            offer
+            for offer in self.offers
+            if (offer.producto_id == product.pk and offer.slug == xlsx_slug) or offer.categoria_id in category_ids
+        ]
+        active = [offer for offer in relevant if self._is_active(offer)]
+        # Las ofertas vienen de la mas nueva a la mas vieja, como el .first() de la API.
+        offer = next((offer for offer in active if offer.producto_id == product.pk and offer.slug == xlsx_slug), None)
+        if offer is None:
+            category_offers = [offer for offer in active if offer.categoria_id in category_ids]
+            offer = max(category_offers, key=lambda item: item.porcentaje) if category_offers else None
+        bounds = [
+            moment
+            for offer in relevant
+            for moment in (offer.empieza, offer.termina)
+            if moment is not None and moment >= self.now
+        ]
+        return discount_from_offer(product, offer), min(bounds, default=None)
+
+
+def refresh_product_documents(product_ids):
+    """Arma y guarda los documentos de estos productos; devuelve {product_id: ProductDocument}."""
+    ids = sorted({pk for pk in product_ids if pk})
+    if not ids:
+        return {}
+    categories = _category_tree()
+    offers = _OfferIndex(timezone.now())
+    documents = {}
+    for start in range(0, len(ids), PRODUCT_DOCUMENT_CHUNK_SIZE):
+        rows = []
+        products = Product.objects.filter(pk__in=ids[start:start + PRODUCT_DOCUMENT_CHUNK_SIZE]).prefetch_related(
+            "extra_images", "variants"
+        )
+        for product in products:
+            product.categoria = categories.get(product.categoria_id)
+            discount, valid_until = offers.resolve(product)
+            rows.append(ProductDocument(
+                product=product,
+                version=PRODUCT_DOCUMENT_VERSION,
+                producto_actualizado_en=product.actualizado_en,
+                valido_hasta=valid_until,
+                data=build_product_document(product, discount),
+                generado_en=timezone.now(),
+            ))
+        ProductDocument.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=["version", "producto_actualizado_en", "valido_hasta", "data", "generado_en"],
+        )
+        documents.update((row.product_id, row) for row in rows)
+    return documents
+
+
+def _is_fresh(document, product, now):
+    return (
+        document is not None
+        and document.version == PRODUCT_DOCUMENT_VERSION
+        and document.producto_actualizado_en == product.actualizado_en
+        and (document.valido_hasta is None or document.valido_hasta > now)
+    )
+
+
+def _loaded_document(product):
+    try:
+        return product.document
+    except ProductDocument.DoesNotExist:
+        return None
+
+
+def product_documents(products, request=None):
+    """Serializa los productos desde sus documentos, rearmando en bloque los que falten o esten viejos.
+
+    Conviene traer los productos con ``select_related("document")``.
+    """
+    products = list(products)
+    now = timezone.now()
+    documents = {product.pk: _loaded_document(product) for product in products}
+    stale = [product.pk for product in products if not _is_fresh(documents[product.pk], product, now)]
+    if stale:
+        documents.update(refresh_product_documents(stale))
+    return [
+        render_product_document(documents[product.pk].data, request)
+        for product in products
+        if documents.get(product.pk) is not None
+    ]
+
+
+def schedule_product_documents(product_ids):
+    """Rearma los documentos cuando se confirma la transaccion (o al salir de ``deferred_product_documents``)."""
+    ids = {pk for pk in product_ids if pk}
+    if not ids:
+        return
+    pending = getattr(_deferred, "ids", None)
+    if pending is not None:
+        pending.update(ids)
+        return
+    transaction.on_commit(lambda: refresh_product_documents(ids))
+
+
+@contextmanager
+def deferred_product_documents():
+    """Junta los refrescos de un proceso masivo (la importacion) y los hace en bloque al final."""
+    if getattr(_deferred, "ids", None) is not None:
+        yield
+        return
+    _deferred.ids = set()
+    try:
+        yield
+        ids = _deferred.ids
+    finally:
+        _deferred.ids = None
+    transaction.on_commit(lambda: refresh_product_documents(ids))
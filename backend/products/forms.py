@@ -1,7 +1,7 @@
 from django import forms
 import re
 
-from .models import Product, ProductImage, HomeMarquee
+from .models import VARIANT_MAP_NAMES, Product, ProductImage, HomeMarquee, variant_rows_from_maps
 
 
 class ProductForm(forms.ModelForm):
@@ -36,6 +36,12 @@ class ProductAdminForm(forms.ModelForm):
         help_text="La primera URL se guarda en image_url. El resto se guarda como imagenes extra del producto.",
     )
 
+    # Las variantes se editan como JSON (lo arma product_attributes.js) y se guardan en ProductVariant.
+    atributos = forms.JSONField(required=False, initial=dict)
+    atributos_stock = forms.JSONField(required=False, initial=dict)
+    atributos_precio = forms.JSONField(required=False, initial=dict)
+    atributos_sin_stock = forms.JSONField(required=False, initial=dict)
+
     class Meta:
         model = Product
         fields = "__all__"
@@ -43,6 +49,8 @@ class ProductAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
+            for name in VARIANT_MAP_NAMES:
+                self.fields[name].initial = getattr(self.instance, name)
             urls = []
             if self.instance.image_url:
                 urls.append(self.instance.image_url)
@@ -75,7 +83,28 @@ class ProductAdminForm(forms.ModelForm):
             urls.append(url)
         return urls
 
+    def _submitted_variant_maps(self):
+        # La lista editable del admin usa este form sin mandar las variantes: no tocarlas.
+        return [name for name in VARIANT_MAP_NAMES if self.add_prefix(name) in self.data and name in self.changed_data]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        submitted = self._submitted_variant_maps()
+        if submitted:
+            # Los mapas que no vienen se completan con los guardados, como hace Product.save().
+            maps = {
+                name: (cleaned_data.get(name) or {}) if name in submitted else getattr(self.instance, name)
+                for name in VARIANT_MAP_NAMES
+            }
+            try:
+                variant_rows_from_maps(*(maps[name] for name in VARIANT_MAP_NAMES))
+            except (TypeError, ValueError, ArithmeticError):
+                self.add_error("atributos_stock", "Stock o precio de variante invalido.")
+        return cleaned_data
+
     def save(self, commit=True):
+        for name in self._submitted_variant_maps():
+            setattr(self.instance, name, self.cleaned_data.get(name) or {})
         product = super().save(commit=commit)
         if not commit:
             return product
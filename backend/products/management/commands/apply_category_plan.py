@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cotidjango.catalog_snapshot import build_catalog_snapshot, catalog_snapshot_enabled
+from products.category_plan import CategoryPlan, CategoryPlanError, load_category_plan
+from products.management.commands.dedupe_categories import write_dedupe_reports
+from products.management.commands.sanitize_category_moves import write_operation_reports
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica un plan de categorias en JSON o YAML (move, merge, rename y dedupe) "
+        "resolviendo todo en memoria y escribiendo en una sola transaccion. "
+        "Sin --apply solo informa lo que haria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("plan_path", help="Ruta al plan (.json, .yml o .yaml).")
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help="Ejecuta los cambios. Sin este flag solo informa lo que haria.",
+        )
+
+    def handle(self, *args, **options):
+        plan_path = Path(options["plan_path"]).expanduser()
+        apply_changes = bool(options.get("apply"))
+        if not plan_path.is_file():
+            raise CommandError(f"No existe el archivo: {plan_path}")
+
+        self.stdout.write(
+            self.style.WARNING("MODO APLICACION" if apply_changes else "MODO SIMULACION")
+        )
+        try:
+            plan = CategoryPlan.from_data(load_category_plan(plan_path))
+            result = plan.run(apply_changes=apply_changes)
+        except CategoryPlanError as exc:
+            raise CommandError(str(exc)) from exc
+
+        if result["operations"]:
+            write_operation_reports(self, result["operations"])
+        if plan.dedupe:
+            write_dedupe_reports(self, result["dedupe"])
+        self.stdout.write("")
+        self.stdout.write(f"Categorias a eliminar/eliminadas en total: {result['deleted']}")
+        if apply_changes and catalog_snapshot_enabled():
+            _manifest, files = build_catalog_snapshot()
+            self.stdout.write(f"Snapshot del catalogo regenerado ({files} archivos).")
+
+        if not apply_changes:
+            self.stdout.write(
+                self.style.WARNING("Simulacion finalizada. No se guardaron cambios.")
+            )
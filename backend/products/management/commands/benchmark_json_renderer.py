@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from cotidjango import renderers
+from cotidjango.api_common import serialize_order, serialize_product
+from orders.models import Order
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el JSONRenderer de DRF con FastJSONRenderer sobre paginas reales de 100 productos "
+        "y 100 pedidos. Solo lee la DB."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=200,
+            help="Veces que se renderiza cada pagina. Por defecto 200.",
+        )
+
+    def handle(self, *args, **options):
+        iterations = int(options["iterations"])
+        if iterations < 1:
+            raise CommandError("--iterations debe ser mayor a 0.")
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING("orjson no esta instalado: FastJSONRenderer usa el renderer de DRF."))
+
+        products = (
+            Product.objects.filter(activo=True)
+            .select_related("categoria__parent")
+            .prefetch_related("extra_images", "variants")
+            .order_by("-creado_en")[:100]
+        )
+        orders = Order.objects.select_related("user").prefetch_related("items__product").order_by("-creado_en")[:100]
+        pages = [
+            ("productos", {"items": [serialize_product(p) for p in products]}),
+            ("pedidos", {"items": [serialize_order(o) for o in orders]}),
+        ]
+
+        for label, page in pages:
+            if not page["items"]:
+                self.stdout.write(f"- {label}: sin datos, se omite")
+                continue
+            drf_body = JSONRenderer().render(page)
+            fast_body = renderers.FastJSONRenderer().render(page)
+            if drf_body != fast_body:
+                raise CommandError(f"Los renderers no producen el mismo JSON para {label}.")
+            drf_ms = self._time(JSONRenderer(), page, iterations)
+            fast_ms = self._time(renderers.FastJSONRenderer(), page, iterations)
+            self.stdout.write(
+                f"- {label} ({len(page['items'])} items, {len(drf_body) // 1024} KB): "
+                f"DRF {drf_ms:.2f} ms | rapido {fast_ms:.2f} ms | {drf_ms / fast_ms:.1f}x"
+            )
+
+    def _time(self, renderer, page, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            renderer.render(page)
+        return (time.perf_counter() - start) * 1000 / iterations
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cotidjango.catalog_snapshot import build_catalog_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera el snapshot estatico del catalogo (categorias, home, ofertas y primeras paginas "
+        "de productos por categoria) en JSON comprimido para servirlo sin pasar por la DB. "
+        "Despues de la primera vez, cada importacion de XLSX lo regenera sola."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=None,
+            help=f"Paginas de productos por categoria (0 = todas). Por defecto {settings.CATALOG_SNAPSHOT_PAGES}.",
+        )
+        parser.add_argument(
+            "--base-url",
+            default="",
+            help="URL publica del backend para armar las URLs de imagenes subidas.",
+        )
+
+    def handle(self, *args, **options):
+        if options["pages"] is not None and options["pages"] < 0:
+            raise CommandError("--pages no puede ser negativo.")
+
+        manifest, files = build_catalog_snapshot(pages=options["pages"], base_url=options["base_url"] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot del catalogo publicado en {settings.CATALOG_SNAPSHOT_ROOT}. "
+            f"Categorias: {len(manifest['categories']) - 1} | Archivos: {files}"
+        ))
+        self.stdout.write(f"- version: {manifest['version']}")
+        self.stdout.write(f"- URL: {settings.CATALOG_SNAPSHOT_URL}manifest.json")
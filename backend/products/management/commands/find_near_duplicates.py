@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.near_duplicates import DEFAULT_MIN_SCORE, apply_merge_proposals, find_near_duplicates
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca productos casi duplicados (nombre parecido, misma categoria/SKU/imagen) "
+        "y propone fusiones. Sin --apply solo informa lo que haria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-score",
+            type=float,
+            default=DEFAULT_MIN_SCORE,
+            help=f"Puntaje minimo (0 a 1) para proponer una fusion. Por defecto {DEFAULT_MIN_SCORE}.",
+        )
+        parser.add_argument(
+            "--output",
+            default="",
+            help="Guarda las propuestas en un JSON para revisarlas antes de aplicar.",
+        )
+        parser.add_argument(
+            "--proposals",
+            default="",
+            help="Usa las propuestas de un JSON (por ejemplo uno revisado a mano) en lugar de recalcularlas.",
+        )
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help="Fusiona las propuestas. Sin este flag solo informa lo que haria.",
+        )
+        parser.add_argument(
+            "--preview-limit",
+            type=int,
+            default=20,
+            help="Cantidad maxima de propuestas a listar en la salida.",
+        )
+
+    def handle(self, *args, **options):
+        apply_changes = bool(options.get("apply"))
+        preview_limit = max(1, int(options.get("preview_limit") or 20))
+        min_score = float(options["min_score"])
+        if not 0 < min_score <= 1:
+            raise CommandError("--min-score debe estar entre 0 y 1.")
+
+        self.stdout.write(self.style.WARNING("MODO APLICACION" if apply_changes else "MODO SIMULACION"))
+        if options.get("proposals"):
+            proposals = self._read_proposals(Path(options["proposals"]).expanduser())
+            self.stdout.write(f"Propuestas leidas de: {options['proposals']}")
+        else:
+            proposals = find_near_duplicates(min_score=min_score)
+
+        duplicates_total = sum(len(proposal.get("duplicates") or []) for proposal in proposals)
+        self.stdout.write(f"- propuestas de fusion: {len(proposals)}")
+        self.stdout.write(f"- productos que se absorberian: {duplicates_total}")
+
+        if proposals:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Propuestas:"))
+            for proposal in proposals[:preview_limit]:
+                names = {item["id"]: item["nombre"] for item in proposal.get("products") or []}
+                duplicates = ", ".join(
+                    f"{pk} {names.get(pk, '')}".strip() for pk in proposal.get("duplicates") or []
+                )
+                self.stdout.write(
+                    f"  - puntaje={proposal.get('score', '-')} | queda={proposal['survivor']} "
+                    f"{names.get(proposal['survivor'], '')} | absorbe={duplicates}"
+                )
+            hidden_count = max(len(proposals) - preview_limit, 0)
+            if hidden_count:
+                self.stdout.write(f"  - ... y {hidden_count} mas")
+
+        if options.get("output"):
+            output = Path(options["output"]).expanduser()
+            output.write_text(json.dumps(proposals, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"Propuestas guardadas en: {output}")
+
+        if not apply_changes:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Simulacion finalizada. No se guardaron cambios."))
+            return
+
+        merged = apply_merge_proposals(proposals)
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(f"Productos fusionados: {merged}"))
+
+    def _read_proposals(self, path):
+        if not path.is_file():
+            raise CommandError(f"No existe el archivo: {path}")
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError as exc:
+            raise CommandError(f"JSON invalido en {path}: {exc}")
+        if not isinstance(data, list) or not all(
+            isinstance(item, dict) and "survivor" in item and isinstance(item.get("duplicates"), list)
+            for item in data
+        ):
+            raise CommandError("Cada propuesta debe tener 'survivor' y una lista 'duplicates'.")
+        return data
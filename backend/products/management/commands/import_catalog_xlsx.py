@@ -0,0 +1,150 @@
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from cotidjango.catalog_snapshot import deferred_catalog_snapshot
+from products.product_importer import ProductXlsxImporter, parse_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa un XLSX o CSV de catalogo con las mismas reglas que el admin. "
+        "Con --dry-run solo muestra que cambiaria, sin escribir en la DB."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("xlsx_path", help="Ruta al archivo XLSX o CSV (UTF-8, ';' o ',') a importar.")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Calcula altas, cambios, fusiones y ofertas sin guardar nada.",
+        )
+        parser.add_argument(
+            "--user",
+            default="",
+            help="Email o usuario que queda como creador de los productos nuevos (por defecto el primer superusuario).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Procesos para normalizar las filas de archivos grandes (por defecto segun CPUs, 1 = sin paralelismo).",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=20,
+            help="Cantidad maxima de filas a mostrar por seccion en --dry-run.",
+        )
+
+    def handle(self, *args, **options):
+        xlsx_path = Path(options["xlsx_path"]).expanduser()
+        sample = max(1, int(options.get("sample") or 20))
+        if not xlsx_path.is_file():
+            raise CommandError(f"No existe el archivo: {xlsx_path}")
+
+        # El pool se abre antes de la primera consulta: los procesos no heredan conexiones.
+        with parse_pool(options.get("workers")) as pool, xlsx_path.open("rb") as upload:
+            importer = ProductXlsxImporter(
+                request_user=self._resolve_user(options.get("user")),
+                template_xlsx_path="",
+                parse_pool=pool,
+            )
+            if options["dry_run"]:
+                report = importer.preview_upload(upload)
+                self._write_report(xlsx_path, report, sample)
+                return
+            with deferred_catalog_snapshot(wait=True) as snapshot:
+                created, updated, errors = importer.import_upload(upload)
+
+        self.stdout.write(self.style.SUCCESS(f"Importacion completada. Nuevos: {created} | Actualizados: {updated}"))
+        for error in errors[:sample]:
+            self.stdout.write(self.style.WARNING(f"  - {error}"))
+        if len(errors) > sample:
+            self.stdout.write(f"  ... y {len(errors) - sample} errores mas")
+        if snapshot.files:
+            self.stdout.write(f"Snapshot del catalogo regenerado ({snapshot.files} archivos).")
+
+    def _resolve_user(self, identifier):
+        User = get_user_model()
+        identifier = str(identifier or "").strip()
+        if identifier:
+            user = (
+                User.objects.filter(email__iexact=identifier).first()
+                or User.objects.filter(username=identifier).first()
+            )
+            if not user:
+                raise CommandError(f"No existe el usuario: {identifier}")
+            return user
+        user = User.objects.filter(is_superuser=True).order_by("id").first()
+        if not user:
+            raise CommandError("No hay superusuarios; indica uno con --user.")
+        return user
+
+    def _write_report(self, xlsx_path, report, sample):
+        self.stdout.write(self.style.WARNING("MODO SIMULACION (--dry-run): no se guardo ningun cambio."))
+        self.stdout.write(self.style.SUCCESS(f"Archivo simulado: {xlsx_path}"))
+        self.stdout.write(f"- filas utiles: {report['rows']}")
+        self.stdout.write(f"- productos nuevos: {len(report['created'])}")
+        self.stdout.write(f"- productos con cambios: {len(report['updated'])}")
+        self.stdout.write(f"- productos sin cambios: {report['unchanged']}")
+        self.stdout.write(f"- fusiones por nombre: {len(report['merges'])}")
+        self.stdout.write(f"- cambios de oferta: {len(report['offers'])}")
+        self.stdout.write(f"- categorias nuevas: {len(report['new_categories'])}")
+        self.stdout.write(f"- productos de DB ausentes en el archivo: {report['missing_total']}")
+        self.stdout.write(f"- errores: {len(report['errors'])}")
+
+        if report["created"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Productos nuevos:"))
+            for item in report["created"][:sample]:
+                self.stdout.write(
+                    f"  - fila {item['rows'][0]} | {item['nombre']} | sku={item['sku'] or '-'} | "
+                    f"categoria={item['categoria'] or 'Sin categoria'} | precio={item['precio']}"
+                )
+
+        if report["updated"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Cambios por producto:"))
+            for item in report["updated"][:sample]:
+                self.stdout.write(f"  - {item['id']} | {item['nombre']} (fila {item['rows'][0]})")
+                for change in item["changes"]:
+                    self.stdout.write(f"      {change['field']}: {change['before']!r} -> {change['after']!r}")
+
+        if report["merges"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Fusiones de duplicados por nombre:"))
+            for item in report["merges"][:sample]:
+                survivor = item["survivor"] or "nuevo"
+                duplicates = ", ".join(str(pk) for pk in item["duplicates"])
+                self.stdout.write(f"  - fila {item['row']} | {item['nombre']} | queda={survivor} | absorbe={duplicates}")
+
+        if report["offers"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Cambios de oferta:"))
+            for item in report["offers"][:sample]:
+                self.stdout.write(
+                    f"  - fila {item['row']} | {item['id'] or 'nuevo'} | {item['nombre']} | {item['action']} | {item['detail']}"
+                )
+
+        if report["new_categories"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Categorias que se crearian:"))
+            for path in report["new_categories"][:sample]:
+                self.stdout.write(f"  - {path}")
+
+        if report["missing"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Productos de DB que no aparecen en el archivo:"))
+            for item in report["missing"][:sample]:
+                self.stdout.write(
+                    f"  - {item['id']} | {item['nombre']} | categoria={item['categoria'] or 'Sin categoria'} | "
+                    f"activo={item['activo']} | pedidos={'si' if item['has_orders'] else 'no'}"
+                )
+
+        if report["errors"]:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Errores:"))
+            for error in report["errors"][:sample]:
+                self.stdout.write(f"  - {error}")
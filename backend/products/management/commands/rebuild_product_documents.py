@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from products.documents import PRODUCT_DOCUMENT_VERSION, refresh_product_documents
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Rearma los documentos JSON precalculados de todos los productos. No hace falta para "
+        "que la API ande (los viejos se rearman al leerlos), pero evita ese costo en los "
+        "primeros pedidos despues de un deploy que cambie PRODUCT_DOCUMENT_VERSION."
+    )
+
+    def handle(self, *args, **options):
+        ids = list(Product.objects.values_list("id", flat=True))
+        documents = refresh_product_documents(ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Documentos rearmados: {len(documents)} (version {PRODUCT_DOCUMENT_VERSION})."
+        ))
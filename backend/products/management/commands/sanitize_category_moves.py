@@ -1,9 +1,27 @@
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
 
+from products.category_plan import CategoryPlan, CategoryPlanError
 from products.models import Category, Product
 
 
+SANITIZE_OPERATIONS = [
+    {
+        "source_name": "Bengalas",
+        "source_parent_name": "Velas",
+        "to": "Bengalas",
+        "delete_source_if_empty": True,
+        "label": "Mover productos de Velas > Bengalas a Bengalas",
+    },
+    {
+        "source_name": "Librería y Manualidades",
+        "source_parent_name": None,
+        "to": "Artículos Para Manualidades",
+        "delete_source_if_empty": True,
+        "label": "Mover productos de Librería y Manualidades a Artículos Para Manualidades",
+    },
+]
+
+
 class Command(BaseCommand):
     help = (
         "Aplica movimientos seguros de categorias ya validados localmente "
@@ -26,162 +44,98 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         apply_changes = bool(options.get("apply"))
         preview_limit = max(1, int(options.get("preview_limit") or 20))
-        operations = [
-            {
-                "source_name": "Bengalas",
-                "source_parent_name": "Velas",
-                "target_name": "Bengalas",
-                "target_parent_name": None,
-                "delete_source_if_empty": True,
-                "label": "Mover productos de Velas > Bengalas a Bengalas",
-            },
-            {
-                "source_name": "Librería y Manualidades",
-                "source_parent_name": None,
-                "target_name": "Artículos Para Manualidades",
-                "target_parent_name": None,
-                "delete_source_if_empty": True,
-                "label": "Mover productos de Librería y Manualidades a Artículos Para Manualidades",
-            },
-        ]
-
         self.stdout.write(
             self.style.WARNING(
                 "MODO APLICACION" if apply_changes else "MODO SIMULACION"
             )
         )
-
-        with transaction.atomic():
-            total_moved = 0
-            total_deleted_categories = 0
-            reports = []
-
-            for operation in operations:
-                report = self._run_operation(
-                    operation,
-                    apply_changes=apply_changes,
-                    preview_limit=preview_limit,
-                )
-                reports.append(report)
-                total_moved += report["moved"]
-                total_deleted_categories += report["deleted"]
-
-            self.stdout.write("")
+        operations = []
+        previews = []
+        for operation in SANITIZE_OPERATIONS:
+            source = _find_category(name=operation["source_name"], parent_name=operation["source_parent_name"])
+            # El origen se busca como siempre (padre con ese nombre en cualquier nivel) y se
+            # le pasa al plan por id. Si no esta, la ruta tampoco existe y el plan lo informa
+            # como ya aplicado.
+            path = " > ".join(name for name in (operation["source_parent_name"], operation["source_name"]) if name)
+            operations.append({
+                "move": source.pk if source else path,
+                "to": operation["to"],
+                "delete_source_if_empty": operation["delete_source_if_empty"],
+                "label": operation["label"],
+            })
+            previews.append(_product_preview(source, preview_limit))
+        try:
+            result = CategoryPlan(operations).run(apply_changes=apply_changes)
+        except CategoryPlanError as exc:
+            raise CommandError(str(exc)) from exc
+        write_operation_reports(self, result["operations"], previews=previews)
+        if not apply_changes:
             self.stdout.write(
-                self.style.SUCCESS(
-                    f"Resumen: productos a mover/movidos={total_moved}, "
-                    f"categorias a eliminar/eliminadas={total_deleted_categories}"
-                )
+                self.style.WARNING("Simulacion finalizada. No se guardaron cambios.")
             )
-            self.stdout.write("Detalle final por operacion:")
-            for report in reports:
-                self.stdout.write(
-                    f"- {report['label']}: estado={report['status']}, "
-                    f"moved={report['moved']}, deleted={report['deleted']}, "
-                    f"source_after={report['source_products_after']}, "
-                    f"target={report['target_label']}"
-                )
 
-            if not apply_changes:
-                transaction.set_rollback(True)
-                self.stdout.write(
-                    self.style.WARNING("Simulacion finalizada. No se guardaron cambios.")
-                )
 
-    def _category_label(self, category):
-        if category is None:
-            return "-"
-        parent_label = category.parent.nombre if category.parent_id else "-"
-        return f"{category.id} / {category.nombre} / parent={parent_label}"
-
-    def _find_category(self, *, name, parent_name, required=True):
-        queryset = Category.objects.filter(nombre=name)
-        if parent_name is None:
-            queryset = queryset.filter(parent__isnull=True)
-        else:
-            queryset = queryset.filter(parent__nombre=parent_name)
-
-        matches = list(queryset.select_related("parent"))
-        if not matches:
-            if not required:
-                return None
-            parent_label = "sin padre" if parent_name is None else f"con padre {parent_name}"
-            raise CommandError(f"No se encontro la categoria '{name}' {parent_label}.")
-        if len(matches) > 1:
-            parent_label = "sin padre" if parent_name is None else f"con padre {parent_name}"
-            raise CommandError(f"Se encontraron multiples categorias '{name}' {parent_label}.")
-        return matches[0]
-
-    def _run_operation(self, operation, *, apply_changes, preview_limit):
-        source = self._find_category(
-            name=operation["source_name"],
-            parent_name=operation["source_parent_name"],
-            required=False,
-        )
-        target = self._find_category(
-            name=operation["target_name"],
-            parent_name=operation["target_parent_name"],
+def _find_category(*, name, parent_name):
+    queryset = Category.objects.filter(nombre=name)
+    if parent_name is None:
+        queryset = queryset.filter(parent__isnull=True)
+    else:
+        queryset = queryset.filter(parent__nombre=parent_name)
+    matches = list(queryset[:2])
+    if len(matches) > 1:
+        parent_label = "sin padre" if parent_name is None else f"con padre {parent_name}"
+        raise CommandError(f"Se encontraron multiples categorias '{name}' {parent_label}.")
+    return matches[0] if matches else None
+
+
+def _product_preview(category, limit):
+    """(total, primeros ``limit`` productos) de la categoria origen, antes de moverlos."""
+    if category is None:
+        return None
+    products = Product.objects.filter(categoria=category).order_by("nombre", "id")
+    return products.count(), list(products.values_list("id", "nombre")[:limit])
+
+
+def write_operation_reports(command, reports, previews=None):
+    """Salida comun de los comandos que corren un ``CategoryPlan``.
+
+    ``previews`` (opcional, uno por reporte) trae ``(total, [(id, nombre), ...])`` con los
+    productos del origen para listarlos como hacia ``sanitize_category_moves``.
+    """
+    previews = previews or [None] * len(reports)
+    for report, preview in zip(reports, previews):
+        command.stdout.write("")
+        command.stdout.write(report["label"])
+        if report["status"] == "already_applied_or_missing_source":
+            command.stdout.write("- estado: ya aplicado o categoria origen inexistente")
+            command.stdout.write(f"- destino vigente: {report['target_label']}")
+            continue
+        command.stdout.write(f"- origen: {report['source_label']}")
+        command.stdout.write(f"- destino: {report['target_label']}")
+        if preview is not None:
+            total, rows = preview
+            command.stdout.write(f"- productos involucrados: {total}")
+            for product_id, name in rows:
+                command.stdout.write(f"  - {product_id}: {name}")
+            if total > len(rows):
+                command.stdout.write(f"  - ... y {total - len(rows)} mas")
+        command.stdout.write(
+            f"- productos={report['moved']}, ofertas={report['offers']}, "
+            f"hijas={report['children']}, eliminadas={report['deleted']}"
         )
 
-        if source is None:
-            self.stdout.write("")
-            self.stdout.write(operation["label"])
-            self.stdout.write("- estado: ya aplicado o categoria origen inexistente")
-            self.stdout.write(
-                f"- destino vigente: {self._category_label(target)}"
-            )
-            return {
-                "label": operation["label"],
-                "status": "already_applied_or_missing_source",
-                "moved": 0,
-                "deleted": 0,
-                "source_products_after": 0,
-                "target_label": self._category_label(target),
-            }
-
-        products_qs = Product.objects.filter(categoria=source).order_by("nombre", "id")
-        product_rows = list(products_qs.values_list("id", "nombre"))
-
-        self.stdout.write("")
-        self.stdout.write(operation["label"])
-        self.stdout.write(f"- origen: {self._category_label(source)}")
-        self.stdout.write(f"- destino: {self._category_label(target)}")
-        self.stdout.write(f"- productos involucrados: {len(product_rows)}")
-
-        for product_id, name in product_rows[:preview_limit]:
-            self.stdout.write(f"  - {product_id}: {name}")
-        hidden_count = max(len(product_rows) - preview_limit, 0)
-        if hidden_count:
-            self.stdout.write(f"  - ... y {hidden_count} mas")
-
-        moved = len(product_rows)
-        deleted = 0
-
-        if apply_changes and product_rows:
-            products_qs.update(categoria=target)
-
-        source.refresh_from_db()
-        source_products_after = Product.objects.filter(categoria=source).count()
-        can_delete = (
-            operation.get("delete_source_if_empty", False)
-            and source_products_after == 0
-            and source.children.count() == 0
-            and not source.ofertas.exists()
+    command.stdout.write("")
+    command.stdout.write(
+        command.style.SUCCESS(
+            f"Resumen: productos a mover/movidos={sum(report['moved'] for report in reports)}, "
+            f"categorias a eliminar/eliminadas={sum(report['deleted'] for report in reports)}"
+        )
+    )
+    command.stdout.write("Detalle final por operacion:")
+    for report in reports:
+        command.stdout.write(
+            f"- {report['label']}: estado={report['status']}, "
+            f"moved={report['moved']}, deleted={report['deleted']}, "
+            f"source_after={report['source_products_after']}, "
+            f"target={report['target_label']}"
         )
-
-        self.stdout.write(f"- origen luego del movimiento: {source_products_after} productos")
-        self.stdout.write(f"- categoria origen vacia y eliminable: {'si' if can_delete else 'no'}")
-
-        if apply_changes and can_delete:
-            source.delete()
-            deleted = 1
-            self.stdout.write("- categoria origen eliminada")
-
-        return {
-            "label": operation["label"],
-            "status": "applied" if apply_changes else "simulated",
-            "moved": moved,
-            "deleted": deleted,
-            "source_products_after": source_products_after,
-            "target_label": self._category_label(target),
-        }
@@ -0,0 +1,213 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from products.models import Product
+from products.product_importer import HEADER_ALIAS, ProductXlsxImporter
+
+
+SYNC_CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincroniza el SKU de los productos desde un XLSX o CSV con columnas "
+        "IDProduct, SKU y Nombre. Sin --apply solo informa lo que haria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file_path", help="Ruta al XLSX o CSV con IDProduct, SKU y Nombre.")
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help="Ejecuta los cambios. Sin este flag solo informa lo que haria.",
+        )
+        parser.add_argument(
+            "--preview-limit",
+            type=int,
+            default=20,
+            help="Cantidad maxima de filas a listar por seccion en la salida.",
+        )
+
+    def handle(self, *args, **options):
+        file_path = Path(options["file_path"]).expanduser()
+        apply_changes = bool(options.get("apply"))
+        preview_limit = max(1, int(options.get("preview_limit") or 20))
+        if not file_path.is_file():
+            raise CommandError(f"No existe el archivo: {file_path}")
+
+        with file_path.open("rb") as upload:
+            rows = self._read_rows(upload)
+
+        self.stdout.write(self.style.WARNING("MODO APLICACION" if apply_changes else "MODO SIMULACION"))
+        self.stdout.write(f"Archivo: {file_path}")
+
+        by_pk = self._load_by_pk(rows)
+        by_name = self._load_by_name(rows, by_pk)
+
+        changes = {}
+        assigned_rows = {}
+        not_found = []
+        ambiguous = []
+        repeated = []
+        unchanged = 0
+        for row_number, pk, sku, nombre in rows:
+            product = by_pk.get(pk) if pk else None
+            if product is None and nombre:
+                matches = by_name.get(nombre.lower(), [])
+                if len(matches) > 1:
+                    ambiguous.append((row_number, nombre, [item.pk for item in matches]))
+                    continue
+                product = matches[0] if matches else None
+            if product is None:
+                not_found.append((row_number, pk, nombre))
+                continue
+
+            previous = assigned_rows.get(product.pk)
+            if previous is not None:
+                if previous[1] != sku:
+                    repeated.append((row_number, product.pk, sku, previous))
+                continue
+            assigned_rows[product.pk] = (row_number, sku)
+            if product.sku == sku:
+                unchanged += 1
+                continue
+            changes[product.pk] = (row_number, product, product.sku, sku)
+
+        shared = {}
+        for product_pk, (row_number, sku) in assigned_rows.items():
+            if sku:
+                shared.setdefault(sku.upper(), []).append(product_pk)
+        shared = {sku: pks for sku, pks in shared.items() if len(pks) > 1}
+
+        self.stdout.write(f"- filas leidas: {len(rows)}")
+        self.stdout.write(f"- SKU a actualizar: {len(changes)}")
+        self.stdout.write(f"- sin cambios: {unchanged}")
+        self.stdout.write(f"- no encontrados en la DB: {len(not_found)}")
+        self.stdout.write(f"- conflictos: {len(ambiguous) + len(repeated)}")
+
+        self._write_section(
+            "Cambios de SKU:",
+            [
+                f"fila {row_number} | {product.pk} | {product.nombre} | {before or '-'} -> {after or '-'}"
+                for row_number, product, before, after in changes.values()
+            ],
+            preview_limit,
+        )
+        self._write_section(
+            "Nombre ambiguo (no se toca):",
+            [
+                f"fila {row_number} | {nombre} | productos={', '.join(str(pk) for pk in pks)}"
+                for row_number, nombre, pks in ambiguous
+            ],
+            preview_limit,
+        )
+        self._write_section(
+            "Producto con otro SKU en una fila anterior (queda el primero):",
+            [
+                f"fila {row_number} | {product_pk} | sku={sku or '-'} | fila {previous[0]} sku={previous[1] or '-'}"
+                for row_number, product_pk, sku, previous in repeated
+            ],
+            preview_limit,
+        )
+        self._write_section(
+            "SKU compartido por varios productos (se aplica igual):",
+            [f"{sku} | productos={', '.join(str(pk) for pk in pks)}" for sku, pks in shared.items()],
+            preview_limit,
+        )
+        self._write_section(
+            "No encontrados:",
+            [f"fila {row_number} | IDProduct={pk or '-'} | {nombre or '-'}" for row_number, pk, nombre in not_found],
+            preview_limit,
+        )
+
+        if not apply_changes:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Simulacion finalizada. No se guardaron cambios."))
+            return
+
+        products = []
+        now = timezone.now()
+        for _row_number, product, _before, after in changes.values():
+            product.sku = after
+            product.actualizado_en = now
+            products.append(product)
+        with transaction.atomic():
+            Product.objects.bulk_update(products, ["sku", "actualizado_en"], batch_size=SYNC_CHUNK_SIZE)
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(f"SKU actualizados: {len(products)}"))
+
+    def _read_rows(self, upload):
+        importer = ProductXlsxImporter(request_user=None, template_xlsx_path="")
+        raw_rows = importer._iter_raw_rows(upload)
+        header = next(raw_rows, None)
+        columns = {}
+        for idx, cell in enumerate(header or []):
+            header_key = importer._norm_header(cell)
+            canonical = HEADER_ALIAS.get(header_key, header_key)
+            if canonical in {"idproduct", "sku", "nombre"}:
+                columns.setdefault(canonical, idx)
+        missing = {"idproduct", "sku", "nombre"} - set(columns)
+        if missing:
+            raw_rows.close()
+            raise CommandError(f"Faltan columnas obligatorias: {', '.join(sorted(missing))}")
+
+        def cell(raw, key):
+            column = columns[key]
+            value = raw[column] if column < len(raw) else None
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            return "" if value is None else str(value).strip()
+
+        rows = []
+        for row_number, raw in enumerate(raw_rows, start=2):
+            pk = importer._parse_int(cell(raw, "idproduct"))
+            sku = cell(raw, "sku")
+            nombre = cell(raw, "nombre")
+            if not pk and not nombre:
+                continue
+            rows.append((row_number, pk, sku, nombre))
+        return rows
+
+    def _load_by_pk(self, rows):
+        pks = sorted({pk for _row_number, pk, _sku, _nombre in rows if pk})
+        by_pk = {}
+        for start in range(0, len(pks), SYNC_CHUNK_SIZE):
+            chunk = pks[start:start + SYNC_CHUNK_SIZE]
+            by_pk.update(Product.objects.only("id", "nombre", "sku").in_bulk(chunk))
+        return by_pk
+
+    def _load_by_name(self, rows, by_pk):
+        names = sorted({
+            nombre
+            for _row_number, pk, _sku, nombre in rows
+            if nombre and not (pk and pk in by_pk)
+        })
+        by_name = {}
+        for start in range(0, len(names), SYNC_CHUNK_SIZE):
+            chunk = names[start:start + SYNC_CHUNK_SIZE]
+            # El nombre exacto cubre acentos en mayuscula, que LOWER() de SQLite no baja.
+            queryset = (
+                Product.objects.annotate(nombre_lower=Lower("nombre"))
+                .filter(Q(nombre__in=chunk) | Q(nombre_lower__in=[name.lower() for name in chunk]))
+                .only("id", "nombre", "sku")
+                .order_by("id")
+            )
+            for product in queryset:
+                by_name.setdefault(product.nombre.lower(), []).append(product)
+        return by_name
+
+    def _write_section(self, title, lines, preview_limit):
+        if not lines:
+            return
+        self.stdout.write("")
+        self.stdout.write(self.style.WARNING(title))
+        for line in lines[:preview_limit]:
+            self.stdout.write(f"  - {line}")
+        hidden_count = max(len(lines) - preview_limit, 0)
+        if hidden_count:
+            self.stdout.write(f"  - ... y {hidden_count} mas")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0030_storesettings_mostrar_precios_invitados'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+    ]
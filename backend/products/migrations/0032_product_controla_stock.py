@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0031_product_sku_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='controla_stock',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,190 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:30
+
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copias congeladas de products.models: la migracion no debe cambiar si esas funciones cambian.
+MAP_NAMES = ("atributos", "atributos_stock", "atributos_precio", "atributos_sin_stock")
+PRICE_LIMIT = Decimal("99999999.99")
+
+
+def _value_list(values):
+    if isinstance(values, (list, tuple)):
+        return [value for value in values if value not in (None, "")]
+    return [values] if values not in (None, "") else []
+
+
+def _as_map(value):
+    return value if isinstance(value, dict) else {}
+
+
+def _to_stock(value):
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        return None
+    if not number.is_finite():
+        return None
+    return max(0, min(int(number), 2147483647))
+
+
+def _to_price(value):
+    try:
+        number = Decimal(str(value).strip().replace(",", "."))
+    except (InvalidOperation, ValueError):
+        return None
+    if not number.is_finite() or abs(number) > PRICE_LIMIT:
+        return None
+    return number.quantize(Decimal("0.01"))
+
+
+def _variant_rows(atributos, stock_map, price_map, sin_stock_map):
+    """Filas {(atributo, valor): campos} de los mapas, con la misma regla que ``variant_rows_from_maps``.
+
+    Solo cuentan los valores listados en ``atributos``. Lo que no entra (stock o precio de
+    valores que ya no se listan, numeros invalidos, textos largos) queda en ``atributos_legacy``.
+    """
+    stock_map, price_map, sin_stock_map = _as_map(stock_map), _as_map(price_map), _as_map(sin_stock_map)
+    rows = {}
+    for key, values in _as_map(atributos).items():
+        key = str(key).strip()[:100]
+        key_stock = _as_map(stock_map.get(key))
+        key_prices = _as_map(price_map.get(key))
+        unavailable = {str(value) for value in _value_list(sin_stock_map.get(key))}
+        for value in _value_list(values):
+            value = str(value)[:150]
+            if not key or (key, value) in rows:
+                continue
+            stock = key_stock.get(value)
+            price = key_prices.get(value)
+            rows[(key, value)] = {
+                "stock": _to_stock(stock) if stock not in (None, "") else None,
+                "precio": _to_price(price) if price not in (None, "") else None,
+                "disponible": value not in unavailable,
+                "orden": len(rows),
+            }
+    return rows
+
+
+def _maps_from_variants(variants):
+    maps = {name: {} for name in MAP_NAMES}
+    for variant in variants:
+        maps["atributos"].setdefault(variant.atributo, []).append(variant.valor)
+        if variant.stock is not None:
+            maps["atributos_stock"].setdefault(variant.atributo, {})[variant.valor] = variant.stock
+        if variant.precio is not None:
+            maps["atributos_precio"].setdefault(variant.atributo, {})[variant.valor] = float(variant.precio)
+        if not variant.disponible:
+            maps["atributos_sin_stock"].setdefault(variant.atributo, []).append(variant.valor)
+    return maps
+
+
+def copy_attribute_maps(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+    variants = []
+    legacy = []
+    products = Product.objects.only("id", *MAP_NAMES).order_by("id")
+    for product in products.iterator(chunk_size=500):
+        maps = {name: getattr(product, name) for name in MAP_NAMES}
+        if any(maps.values()):
+            product.atributos_legacy = maps
+            legacy.append(product)
+        rows = _variant_rows(*(maps[name] for name in MAP_NAMES))
+        variants.extend(
+            ProductVariant(product_id=product.pk, atributo=key[0], valor=key[1], **fields)
+            for key, fields in rows.items()
+        )
+        if len(variants) >= 1000:
+            ProductVariant.objects.bulk_create(variants)
+            variants = []
+        if len(legacy) >= 500:
+            Product.objects.bulk_update(legacy, ["atributos_legacy"])
+            legacy = []
+    if variants:
+        ProductVariant.objects.bulk_create(variants)
+    if legacy:
+        Product.objects.bulk_update(legacy, ["atributos_legacy"])
+
+
+def restore_attribute_maps(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+    by_product = {}
+    for variant in ProductVariant.objects.order_by("product_id", "orden", "id").iterator(chunk_size=2000):
+        by_product.setdefault(variant.product_id, []).append(variant)
+    batch = []
+    products = Product.objects.only("id", "atributos_legacy").order_by("id")
+    for product in products.iterator(chunk_size=500):
+        # Las variantes tienen lo editado despues de migrar; sin variantes vuelve la copia cruda.
+        variants = by_product.get(product.pk)
+        legacy = _as_map(product.atributos_legacy)
+        maps = _maps_from_variants(variants) if variants else legacy
+        if variants:
+            # El stock y precio de valores que no se migraron vuelven desde la copia cruda.
+            for name in ("atributos_stock", "atributos_precio"):
+                for key, values in _as_map(legacy.get(name)).items():
+                    if isinstance(values, dict):
+                        maps[name][key] = {**values, **maps[name].get(key, {})}
+        if not any(maps.get(name) for name in MAP_NAMES):
+            continue
+        for name in MAP_NAMES:
+            setattr(product, name, maps.get(name) or {})
+        batch.append(product)
+    Product.objects.bulk_update(batch, list(MAP_NAMES), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0032_product_controla_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('atributo', models.CharField(max_length=100)),
+                ('valor', models.CharField(max_length=150)),
+                ('sku', models.CharField(blank=True, db_index=True, default='', max_length=100)),
+                ('precio', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('stock', models.PositiveIntegerField(blank=True, null=True)),
+                ('disponible', models.BooleanField(default=True)),
+                ('orden', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Variante de producto',
+                'verbose_name_plural': 'Variantes de producto',
+                'ordering': ['product_id', 'orden', 'id'],
+                'indexes': [models.Index(fields=['atributo', 'valor'], name='products_variant_attr_valor')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'atributo', 'valor'), name='products_variant_product_attr_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='atributos_legacy',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(copy_attribute_maps, restore_attribute_maps),
+        migrations.RemoveField(
+            model_name='product',
+            name='atributos',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='atributos_precio',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='atributos_sin_stock',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='atributos_stock',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:36
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_from_creation_date(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Product.objects.update(actualizado_en=F("creado_en"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0033_productvariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('slug', models.CharField(blank=True, default='', max_length=120)),
+                ('eliminado_en', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Producto eliminado',
+                'verbose_name_plural': 'Productos eliminados',
+                'ordering': ['eliminado_en', 'product_id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(start_from_creation_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['actualizado_en', 'id'], name='products_product_updated_id'),
+        ),
+        migrations.AddIndex(
+            model_name='productdeletion',
+            index=models.Index(fields=['eliminado_en', 'product_id'], name='products_deletion_time_id'),
+        ),
+    ]
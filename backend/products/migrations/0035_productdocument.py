@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0034_product_actualizado_en'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='products.product')),
+                ('version', models.PositiveSmallIntegerField(default=0)),
+                ('producto_actualizado_en', models.DateTimeField(null=True)),
+                ('valido_hasta', models.DateTimeField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Documento de producto',
+                'verbose_name_plural': 'Documentos de productos',
+            },
+        ),
+    ]
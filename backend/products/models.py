@@ -1,6 +1,8 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.text import slugify
 
@@ -36,20 +38,103 @@ class Category(models.Model):
                 raise ValidationError({"parent": "Una categoria no puede ser hija de una descendiente propia."})
             ancestor = ancestor.parent
 
+    # Campos que viajan dentro de cada producto (nombre y ruta de su categoria).
+    PATH_FIELDS = ("nombre", "parent_id", "slug")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_path = instance._path_values()
+        return instance
+
+    def _path_values(self):
+        # __dict__ y no getattr: un campo diferido no dispara otra consulta y cuenta como cambiado.
+        return tuple(self.__dict__.get(name) for name in self.PATH_FIELDS)
+
+    def path_changed(self):
+        """Si cambio algo de lo que muestran sus productos desde que se leyo o guardo."""
+        return getattr(self, "_loaded_path", None) != self._path_values()
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.nombre)
         self.full_clean()
         super().save(*args, **kwargs)
+        self._loaded_path = self._path_values()
 
     def __str__(self):
         return self.nombre
 
 
+VARIANT_MAP_NAMES = ("atributos", "atributos_stock", "atributos_precio", "atributos_sin_stock")
+
+
+def _as_value_list(values):
+    if isinstance(values, (list, tuple)):
+        return [value for value in values if value not in (None, "")]
+    return [values] if values not in (None, "") else []
+
+
+def variant_rows_from_maps(atributos, stock_map=None, price_map=None, sin_stock_map=None):
+    """Convierte los mapas de atributos en filas {(atributo, valor): campos} de ``ProductVariant``.
+
+    Solo cuentan los valores listados en ``atributos``; stock y precio sin dato quedan en None.
+    """
+    stock_map = stock_map if isinstance(stock_map, dict) else {}
+    price_map = price_map if isinstance(price_map, dict) else {}
+    sin_stock_map = sin_stock_map if isinstance(sin_stock_map, dict) else {}
+    rows = {}
+    for key, values in (atributos if isinstance(atributos, dict) else {}).items():
+        key = str(key).strip()[:100]
+        key_stock = stock_map.get(key) if isinstance(stock_map.get(key), dict) else {}
+        key_prices = price_map.get(key) if isinstance(price_map.get(key), dict) else {}
+        unavailable = {str(value) for value in _as_value_list(sin_stock_map.get(key))}
+        for value in _as_value_list(values):
+            value = str(value)[:150]
+            if not key or (key, value) in rows:
+                continue
+            stock = key_stock.get(value)
+            price = key_prices.get(value)
+            rows[(key, value)] = {
+                "stock": max(0, int(stock)) if stock not in (None, "") else None,
+                "precio": Decimal(str(price)) if price not in (None, "") else None,
+                "disponible": value not in unavailable,
+                "orden": len(rows),
+            }
+    return rows
+
+
+def variant_maps(variants):
+    """Inversa de ``variant_rows_from_maps``: arma los mapas JSON que espera el frontend."""
+    maps = {name: {} for name in VARIANT_MAP_NAMES}
+    for variant in sorted(variants, key=lambda item: (item.orden, item.pk or 0)):
+        maps["atributos"].setdefault(variant.atributo, []).append(variant.valor)
+        if variant.stock is not None:
+            maps["atributos_stock"].setdefault(variant.atributo, {})[variant.valor] = variant.stock
+        if variant.precio is not None:
+            maps["atributos_precio"].setdefault(variant.atributo, {})[variant.valor] = float(variant.precio)
+        if not variant.disponible:
+            maps["atributos_sin_stock"].setdefault(variant.atributo, []).append(variant.valor)
+    return maps
+
+
+def _variant_map_property(name):
+    def getter(self):
+        pending = self.__dict__.get("_pending_variant_maps") or {}
+        if name in pending:
+            return pending[name]
+        return variant_maps(self._loaded_variants())[name]
+
+    def setter(self, value):
+        self.__dict__.setdefault("_pending_variant_maps", {})[name] = value if isinstance(value, dict) else {}
+
+    return property(getter, setter)
+
+
 class Product(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="products")
     categoria = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="products")
-    sku = models.CharField(max_length=100, blank=True, default="")
+    sku = models.CharField(max_length=100, blank=True, default="", db_index=True)
     nombre = models.CharField(max_length=255)
     slug = models.SlugField(max_length=120, unique=True, blank=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
@@ -57,19 +142,31 @@ class Product(models.Model):
     imagen = models.ImageField(upload_to="products/", blank=True, null=True)
     image_url = models.URLField(max_length=500, blank=True, default="")
     video_url = models.URLField(max_length=500, blank=True, default="")
-    atributos = models.JSONField(default=dict, blank=True)
-    atributos_stock = models.JSONField(default=dict, blank=True)
-    atributos_precio = models.JSONField(default=dict, blank=True)
-    atributos_sin_stock = models.JSONField(default=dict, blank=True)
     stock = models.PositiveIntegerField(default=0)
     sin_stock = models.BooleanField(default=False)
+    # Solo los productos que controlan stock se reservan y descuentan al crear pedidos.
+    controla_stock = models.BooleanField(default=False)
     activo = models.BooleanField(default=True)
     creado_en = models.DateTimeField(auto_now_add=True)
+    # Lo lee /api/products/changes; los update() masivos lo ponen a mano con touch_products().
+    actualizado_en = models.DateTimeField(auto_now=True)
+    # Copia cruda de los mapas JSON que habia antes de ProductVariant (migracion 0033), para
+    # revisar lo que no entro en las variantes; se borra en una migracion posterior.
+    atributos_legacy = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Vista de las variantes con la forma JSON de siempre; asignarlas se guarda en save().
+    atributos = _variant_map_property("atributos")
+    atributos_stock = _variant_map_property("atributos_stock")
+    atributos_precio = _variant_map_property("atributos_precio")
+    atributos_sin_stock = _variant_map_property("atributos_sin_stock")
 
     class Meta:
         ordering = ["-creado_en"]
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
+        indexes = [
+            models.Index(fields=["actualizado_en", "id"], name="products_product_updated_id"),
+        ]
 
     def __str__(self) -> str:
         details = []
@@ -88,7 +185,144 @@ class Product(models.Model):
                 counter += 1
                 candidate = f"{base}-{counter}"
             self.slug = candidate
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "actualizado_en"}
+        pending = self.__dict__.pop("_pending_variant_maps", None)
+        plan = self._plan_variant_maps(pending) if pending else None
+        if not plan:
+            # Sin variantes que escribir no hace falta abrir un savepoint por producto.
+            super().save(*args, **kwargs)
+            return
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self._apply_variant_plan(*plan)
+        finally:
+            # El plan ya toco las filas cacheadas; se releen en el proximo acceso.
+            self.__dict__.pop("_variant_rows", None)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop("_variant_rows", None)
+        self.__dict__.pop("_pending_variant_maps", None)
+
+    def _loaded_variants(self):
+        if self.pk is None or self._state.adding:
+            return []
+        if "_variant_rows" not in self.__dict__:
+            self.__dict__["_variant_rows"] = list(self.variants.all())
+        return self.__dict__["_variant_rows"]
+
+    def _plan_variant_maps(self, pending):
+        """Que filas de ``ProductVariant`` cambian respecto de lo leido: (cambiadas, nuevas, borradas).
+
+        Solo se escribe la diferencia, asi un importador que reescribe el mapa entero no
+        pisa el stock que otro proceso desconto mientras tanto en variantes que no toco.
+        Devuelve None si los mapas asignados son los mismos que ya estaban.
+        """
+        variants = self._loaded_variants()
+        loaded = variant_maps(variants)
+        merged = {**loaded, **pending}
+        before = variant_rows_from_maps(*(loaded[name] for name in VARIANT_MAP_NAMES))
+        after = variant_rows_from_maps(*(merged[name] for name in VARIANT_MAP_NAMES))
+        if before == after:
+            return None
+
+        current = {(variant.atributo, variant.valor): variant for variant in variants}
+        changed = []
+        for key, fields in after.items():
+            variant = current.get(key)
+            if variant is None:
+                continue
+            previous = before.get(key) or {}
+            updates = {name: value for name, value in fields.items() if previous.get(name) != value}
+            if updates:
+                for name, value in updates.items():
+                    setattr(variant, name, value)
+                changed.append(variant)
+        added = {key: fields for key, fields in after.items() if key not in current}
+        removed = [variant.pk for key, variant in current.items() if key not in after]
+        return changed, added, removed
+
+    def _apply_variant_plan(self, changed, added, removed):
+        if changed:
+            ProductVariant.objects.bulk_update(changed, ["stock", "precio", "disponible", "orden"])
+        if added:
+            ProductVariant.objects.bulk_create([
+                ProductVariant(product=self, atributo=key[0], valor=key[1], **fields)
+                for key, fields in added.items()
+            ])
+        if removed:
+            ProductVariant.objects.filter(pk__in=removed).delete()
+        getattr(self, "_prefetched_objects_cache", {}).pop("variants", None)
+
+
+class ProductVariant(models.Model):
+    """Un valor de atributo de un producto (Color: Rojo) con su SKU, precio, stock y disponibilidad."""
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="variants")
+    atributo = models.CharField(max_length=100)
+    valor = models.CharField(max_length=150)
+    sku = models.CharField(max_length=100, blank=True, default="", db_index=True)
+    # None: la variante no lleva stock ni precio propio y se usa el del producto.
+    precio = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    disponible = models.BooleanField(default=True)
+    orden = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["product_id", "orden", "id"]
+        verbose_name = "Variante de producto"
+        verbose_name_plural = "Variantes de producto"
+        constraints = [
+            models.UniqueConstraint(fields=["product", "atributo", "valor"], name="products_variant_product_attr_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["atributo", "valor"], name="products_variant_attr_valor"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.atributo}: {self.valor}"
+
+
+class ProductDeletion(models.Model):
+    """Producto borrado, para que /api/products/changes pueda informarlo."""
+
+    product_id = models.BigIntegerField()
+    slug = models.CharField(max_length=120, blank=True, default="")
+    eliminado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["eliminado_en", "product_id"]
+        verbose_name = "Producto eliminado"
+        verbose_name_plural = "Productos eliminados"
+        indexes = [
+            models.Index(fields=["eliminado_en", "product_id"], name="products_deletion_time_id"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} ({self.eliminado_en:%Y-%m-%d %H:%M})"
+
+
+class ProductDocument(models.Model):
+    """JSON ya armado del producto para la API publica (ver products.documents)."""
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="document")
+    version = models.PositiveSmallIntegerField(default=0)
+    # ``actualizado_en`` del producto con el que se armo; si no coincide, el documento esta viejo.
+    producto_actualizado_en = models.DateTimeField(null=True)
+    # Proximo inicio o fin de una oferta que le aplica: ahi cambia el precio final.
+    valido_hasta = models.DateTimeField(null=True, blank=True)
+    data = models.JSONField(default=dict)
+    generado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Documento de producto"
+        verbose_name_plural = "Documentos de productos"
+
+    def __str__(self):
+        return f"{self.product_id} v{self.version}"
 
 
 class ProductImage(models.Model):
@@ -0,0 +1,267 @@
+"""Deteccion de productos casi duplicados ("Globo 12 pulgadas rojo" / "Globos 12'' Rojo").
+
+Comparar todos contra todos es O(n^2); en cambio cada producto se indexa por sus
+tokens normalizados mas raros (blocking) y solo se puntuan los pares que comparten
+alguno. El puntaje combina nombre (tokens + trigramas), categoria, SKU e imagen; medidas
+distintas descartan el par. Los pares aceptados forman propuestas de fusion alrededor de
+un ancla, con todos sus miembros por encima del umbral contra ella, que
+``ProductXlsxImporter._merge_products`` puede aplicar tal cual.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Product
+
+
+DEFAULT_MIN_SCORE = 0.8
+SCORE_DIGITS = 4
+BLOCKING_KEYS_PER_PRODUCT = 3
+MAX_BLOCK_SIZE = 200
+FLAGS_CHUNK_SIZE = 500
+
+INCH_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:''|\"|”|″|pulgadas?\b|pulg\b\.?)")
+NUMBER_RE = re.compile(r"^\d+(?:[.,]\d+)?$")
+STOPWORDS = {"de", "del", "la", "el", "los", "las", "con", "para", "por", "y", "en", "x", "un", "una"}
+
+
+def normalize_name(value):
+    text = INCH_RE.sub(r"\1 pulgada ", str(value or "").lower())
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = "".join(char if char.isalnum() or char in ".," else " " for char in text)
+    return " ".join(part.strip(".,") for part in text.split() if part.strip(".,"))
+
+
+def name_tokens(normalized):
+    tokens = set()
+    for token in normalized.split():
+        if token in STOPWORDS:
+            continue
+        if not NUMBER_RE.match(token) and len(token) > 3:
+            # Plural simple: "globos" -> "globo", "luces" -> "luc", "velas" -> "vela".
+            if token.endswith("es") and len(token) > 4:
+                token = token[:-2]
+            elif token.endswith("s"):
+                token = token[:-1]
+        tokens.add(token)
+    return frozenset(tokens)
+
+
+def _trigrams(normalized):
+    text = f"  {normalized} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _jaccard(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class _Entry:
+    __slots__ = ("pk", "nombre", "categoria_id", "sku", "image", "tokens", "numbers", "_trigrams")
+
+    def __init__(self, pk, nombre, categoria_id, sku, image_url, imagen):
+        self.pk = pk
+        self.nombre = nombre
+        self.categoria_id = categoria_id
+        self.sku = str(sku or "").strip().upper()
+        self.image = str(image_url or "").strip() or str(imagen or "").strip()
+        self.tokens = name_tokens(normalize_name(nombre))
+        self.numbers = frozenset(token for token in self.tokens if NUMBER_RE.match(token))
+        self._trigrams = None
+
+    @property
+    def trigrams(self):
+        if self._trigrams is None:
+            # Sobre los tokens ya normalizados y ordenados: tolera typos pero no el orden.
+            self._trigrams = _trigrams(" ".join(sorted(self.tokens)))
+        return self._trigrams
+
+
+def score_pair(left, right, *, min_score=0.0):
+    """Devuelve (puntaje 0..1, motivos) para dos productos.
+
+    Con ``min_score`` corta antes de calcular trigramas si el par no puede llegar.
+    """
+    reasons = []
+    bonus = 0.0
+    if left.categoria_id and left.categoria_id == right.categoria_id:
+        bonus += 0.15
+        reasons.append("misma categoria")
+    elif left.categoria_id and right.categoria_id:
+        bonus -= 0.05
+    if left.sku and right.sku:
+        if left.sku == right.sku:
+            bonus += 0.25
+            reasons.append("mismo SKU")
+        else:
+            bonus -= 0.3
+            reasons.append("SKU distinto")
+    if left.image and left.image == right.image:
+        bonus += 0.15
+        reasons.append("misma imagen")
+
+    # Medidas o cantidades distintas ("Globo 10" / "Globo 12") no son el mismo producto,
+    # por mas que coincidan categoria, SKU o imagen.
+    if left.numbers != right.numbers:
+        return 0.0, ["numeros distintos"]
+    factor = 0.85
+    token_score = _jaccard(left.tokens, right.tokens)
+    # Redondeado: 0.85 * 1.0 - 0.05 da 0.7999999999999999 y quedaria bajo un umbral de 0.8.
+    if round(factor * (0.5 * token_score + 0.5) + bonus, SCORE_DIGITS) < min_score:
+        return 0.0, reasons
+
+    name_score = 0.5 * token_score + 0.5 * _jaccard(left.trigrams, right.trigrams)
+    reasons.insert(0, f"nombre={name_score:.2f}")
+    return round(max(0.0, min(1.0, factor * name_score + bonus)), SCORE_DIGITS), reasons
+
+
+def _candidate_pairs(entries, *, max_block_size):
+    frequency = defaultdict(int)
+    for entry in entries:
+        for token in entry.tokens:
+            frequency[token] += 1
+
+    blocks = defaultdict(list)
+    for index, entry in enumerate(entries):
+        # Solo los tokens mas raros: dos casi duplicados comparten casi todos sus
+        # tokens, asi que tambien comparten alguno de los raros.
+        keys = sorted(entry.tokens, key=lambda token: (frequency[token], token))[:BLOCKING_KEYS_PER_PRODUCT]
+        for key in keys:
+            if frequency[key] > 1:
+                blocks[key].append(index)
+        if entry.sku:
+            blocks[("sku", entry.sku)].append(index)
+
+    seen = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > max_block_size:
+            continue
+        for position, left in enumerate(members):
+            for right in members[position + 1:]:
+                pair = (left, right) if left < right else (right, left)
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair
+
+
+def find_near_duplicates(*, min_score=DEFAULT_MIN_SCORE, queryset=None, max_block_size=MAX_BLOCK_SIZE):
+    """Propuestas de fusion ordenadas por puntaje.
+
+    Cada propuesta es ``{"survivor", "duplicates", "score", "products", "pairs"}``;
+    el sobreviviente se elige con las mismas reglas que el importador.
+    """
+    from .product_importer import ProductXlsxImporter
+
+    queryset = Product.objects.all() if queryset is None else queryset
+    entries = [
+        _Entry(*row)
+        for row in queryset.order_by("id").values_list("id", "nombre", "categoria_id", "sku", "image_url", "imagen")
+    ]
+
+    accepted = {}
+    for left, right in _candidate_pairs(entries, max_block_size=max_block_size):
+        score, reasons = score_pair(entries[left], entries[right], min_score=min_score)
+        if score >= min_score:
+            accepted[(left, right)] = (score, reasons)
+
+    # Grupos con ancla: de los pares mas fuertes a los mas debiles, un producto solo entra
+    # al grupo de un ancla con la que paso el umbral. Sin encadenar A~B~C, A y C nunca
+    # quedan juntos si no se compararon entre si.
+    anchor_of = {}
+    clusters = defaultdict(list)
+    for left, right in sorted(accepted, key=lambda pair: (-accepted[pair][0], pair)):
+        if left not in anchor_of and right not in anchor_of:
+            anchor_of[left] = anchor_of[right] = left
+            clusters[left] = [left, right]
+            continue
+        for anchor, other in ((left, right), (right, left)):
+            if anchor_of.get(anchor) == anchor and other not in anchor_of:
+                anchor_of[other] = anchor
+                clusters[anchor].append(other)
+                break
+
+    pairs_by_cluster = defaultdict(list)
+    for (left, right), (score, reasons) in accepted.items():
+        if left in anchor_of and anchor_of[left] == anchor_of.get(right):
+            pairs_by_cluster[anchor_of[left]].append({
+                "left": entries[left].pk,
+                "right": entries[right].pk,
+                "score": round(score, 3),
+                "reasons": reasons,
+            })
+    clusters = {anchor: sorted(entries[index].pk for index in members) for anchor, members in clusters.items()}
+    if not clusters:
+        return []
+
+    importer = ProductXlsxImporter(request_user=None, template_xlsx_path="")
+    member_ids = [pk for members in clusters.values() for pk in members]
+    products = Product.objects.select_related("categoria").in_bulk(member_ids)
+    flags = {}
+    for start in range(0, len(member_ids), FLAGS_CHUNK_SIZE):
+        flags.update(importer._duplicate_flags(member_ids[start:start + FLAGS_CHUNK_SIZE]))
+
+    proposals = []
+    for root, members in clusters.items():
+        survivor = max(
+            (products[pk] for pk in members if pk in products),
+            key=lambda product: importer._duplicate_score(
+                product,
+                preferred_category_id=None,
+                **flags.get(product.pk, {}),
+            ),
+        )
+        pairs = sorted(pairs_by_cluster[root], key=lambda pair: -pair["score"])
+        proposals.append({
+            "survivor": survivor.pk,
+            "duplicates": [pk for pk in members if pk != survivor.pk],
+            "score": pairs[0]["score"],
+            "products": [
+                {
+                    "id": pk,
+                    "nombre": products[pk].nombre,
+                    "sku": products[pk].sku,
+                    "categoria": products[pk].categoria.nombre if products[pk].categoria_id else "",
+                }
+                for pk in members
+                if pk in products
+            ],
+            "pairs": pairs,
+        })
+    proposals.sort(key=lambda proposal: (-proposal["score"], proposal["survivor"]))
+    return proposals
+
+
+def apply_merge_proposals(proposals, *, request_user=None):
+    """Fusiona cada propuesta con ``_merge_products``; ignora ids que ya no existen."""
+    from .product_importer import ProductXlsxImporter, refresh_merged_sales_days
+
+    importer = ProductXlsxImporter(request_user=request_user, template_xlsx_path="")
+    wanted = {int(proposal["survivor"]) for proposal in proposals}
+    for proposal in proposals:
+        wanted.update(int(pk) for pk in proposal.get("duplicates") or [])
+    products = Product.objects.in_bulk(wanted)
+
+    merged = 0
+    sales_days = set()
+    with transaction.atomic():
+        for proposal in proposals:
+            survivor = products.get(int(proposal["survivor"]))
+            duplicates = [
+                products[int(pk)]
+                for pk in proposal.get("duplicates") or []
+                if int(pk) in products and int(pk) != int(proposal["survivor"])
+            ]
+            if survivor is None or not duplicates:
+                continue
+            importer._merge_products(survivor=survivor, duplicates=duplicates, sales_days=sales_days)
+            for duplicate in duplicates:
+                products.pop(duplicate.pk, None)
+            merged += len(duplicates)
+        refresh_merged_sales_days(sales_days)
+    return merged
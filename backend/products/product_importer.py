@@ -1,12 +1,25 @@
 ﻿from decimal import Decimal
+import codecs
+import csv
 import hashlib
+import multiprocessing
 import os
+import tempfile
 import unicodedata
+from collections import deque
+from contextlib import contextmanager
+from itertools import chain, islice
 
 import openpyxl
-from django.http import HttpResponse
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.db.models.functions import Lower
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.text import slugify
 
+from cotidjango.catalog_snapshot import deferred_catalog_snapshot, schedule_catalog_snapshot_refresh
+
+from .changes import deferred_product_touches
+from .documents import deferred_product_documents
 from .models import Category, Offer, Product, ProductImage
 
 
@@ -158,11 +171,68 @@ HEADER_ALIAS = {
 
 XLSX_OFFER_SLUG_PREFIX = "xlsx-offer-product"
 
+EXPORT_QUERY_CHUNK_SIZE = 2000
+EXPORT_STREAM_BLOCK_SIZE = 64 * 1024
+CSV_DELIMITERS = ";,"
+CSV_EXPORT_DELIMITER = ";"
+XLSX_MAGIC = b"PK\x03\x04"
+MERGE_PLAN_NAME_CHUNK_SIZE = 500
+PARSE_BATCH_SIZE = 2000
+PARALLEL_PARSE_MIN_ROWS = 10000
+PARALLEL_PARSE_MAX_WORKERS = 4
+PARSE_IN_FLIGHT_BATCHES = 2 * PARALLEL_PARSE_MAX_WORKERS
+
+
+def refresh_merged_sales_days(days):
+    """Recalcula los resumenes de ventas de los dias que pasaron de un duplicado al sobreviviente."""
+    if not days:
+        return
+    from orders.sales import refresh_sales_rollups
+
+    refresh_sales_rollups(days)
+
+
+@contextmanager
+def parse_pool(workers):
+    """Pool de procesos para normalizar filas, o None si no hay varios CPUs o fork.
+
+    Solo para comandos de management, abierto antes de la primera consulta: hacer fork
+    dentro de un worker de gunicorn (con hilos y una conexion abierta) puede colgarse.
+    """
+    if workers is None:
+        workers = min(os.cpu_count() or 1, PARALLEL_PARSE_MAX_WORKERS)
+    if workers < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        yield None
+        return
+    pool = multiprocessing.get_context("fork").Pool(workers)
+    try:
+        yield pool
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _iter_batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _parse_row_batch(batch, options):
+    """Tarea del pool de parseo: solo normaliza, nunca toca la DB."""
+    parser = ProductXlsxImporter(request_user=None, template_xlsx_path="")
+    return [(idx, parser._parse_row(row_data, **options)) for idx, row_data in batch]
+
 
 class ProductXlsxImporter:
-    def __init__(self, *, request_user, template_xlsx_path):
+    def __init__(self, *, request_user, template_xlsx_path, parse_pool=None):
         self.request_user = request_user
         self.template_xlsx_path = template_xlsx_path
+        # Solo lo pasa ``import_catalog_xlsx``; el admin parsea siempre en serie.
+        self.parse_pool = parse_pool
 
     def export_workbook(self, rows, filename):
         wb = openpyxl.Workbook()
@@ -191,125 +261,114 @@ class ProductXlsxImporter:
         return self.export_workbook([empty_row], "plantilla_productos.xlsx")
 
     def export_products_response(self):
-        products = (
-            Product.objects.all()
-            .select_related("categoria", "categoria__parent")
-            .prefetch_related("extra_images")
-            .order_by("id")
-        )
         # Exportar siempre desde cero evita omisiones provocadas por plantillas base
         # o deduplicaciones heurísticas. La planilla debe reflejar exactamente la DB.
-        workbook = self._build_export_workbook()
-        ws = workbook.active
-
-        for product in products:
-            row = self._serialize_product_for_export(product)
-            ws.append([row.get(header, "") for header in EXPORT_HEADERS])
-
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # El libro es write-only: las filas se vuelcan a disco a medida que se agregan
+        # y los productos se leen por tandas, asi la memoria no crece con el catalogo.
+        workbook, ws = self._build_export_workbook()
+        for row in self._iter_export_rows():
+            ws.append(row)
+
+        buffer = tempfile.TemporaryFile()
+        workbook.save(buffer)
+        size = buffer.tell()
+        buffer.seek(0)
+        response = StreamingHttpResponse(
+            self._stream_file(buffer),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
+        response["Content-Length"] = str(size)
         response["Content-Disposition"] = 'attachment; filename="productos_existentes.xlsx"'
-        workbook.save(response)
         return response
 
+    def export_products_csv_response(self):
+        """Misma exportacion que ``export_products_response`` pero en CSV (UTF-8, ``;``)."""
+        response = StreamingHttpResponse(self._stream_export_csv(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="productos_existentes.csv"'
+        return response
+
+    def _stream_export_csv(self):
+        buffer = _CsvLineBuffer()
+        writer = csv.writer(buffer, delimiter=CSV_EXPORT_DELIMITER)
+        # BOM para que Excel abra los acentos correctamente; el importador lo descarta.
+        chunk = ["\ufeff", writer.writerow(EXPORT_HEADERS)]
+        for row in self._iter_export_rows():
+            chunk.append(writer.writerow(row))
+            if len(chunk) >= EXPORT_QUERY_CHUNK_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+
+    def _iter_export_rows(self):
+        products = (
+            Product.objects.all()
+            .prefetch_related(
+                Prefetch("extra_images", queryset=ProductImage.objects.order_by("order", "id")),
+                "variants",
+                Prefetch(
+                    "ofertas",
+                    queryset=Offer.objects.filter(activo=True, slug__startswith=f"{XLSX_OFFER_SLUG_PREFIX}-"),
+                    to_attr="export_offers",
+                ),
+            )
+            .order_by("id")
+        )
+        category_paths = self._build_export_category_paths()
+        for product in products.iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE):
+            row = self._serialize_product_for_export(product, category_paths=category_paths)
+            yield [row.get(header, "") for header in EXPORT_HEADERS]
+
+    def _stream_file(self, fh):
+        try:
+            while True:
+                block = fh.read(EXPORT_STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            fh.close()
+
     def import_upload(self, upload):
+        # Las marcas de cambios, los documentos JSON de los productos tocados y el snapshot
+        # del catalogo se aplican todos juntos al terminar. Fuera de la importacion el
+        # snapshot solo se regenera a mano o al vencer su ``validUntil``.
+        with deferred_catalog_snapshot(), deferred_product_documents(), deferred_product_touches():
+            return self._import_upload(upload)
+
+    def _import_upload(self, upload):
         created = 0
         updated = 0
         errors = []
         seen_idproducts = {}
+        # pk -> (producto, fusion acotada a la categoria), en orden de importacion.
+        touched = {}
 
-        def open_sheet():
-            upload.seek(0)
-            wb_local = openpyxl.load_workbook(upload, data_only=True, read_only=True)
-            return wb_local, wb_local.active
-
-        wb, sheet = open_sheet()
-        header_idx = None
-        header_row = None
-        for i, row in enumerate(sheet.iter_rows(values_only=True)):
-            if not row:
-                continue
-            normalized = [self._norm_header(cell) for cell in row]
-            if {"sku", "nombre", "precio"}.issubset(set(normalized)):
-                header_idx = i
-                header_row = row
-                break
-        wb.close()
-
-        if header_row is None:
-            errors.append("Faltan columnas obligatorias: precio, sku")
+        header_idx, header_map, header_error = self._read_upload_header(upload)
+        if header_error:
+            errors.append(header_error)
             return created, updated, errors
 
-        headers = [self._norm_header(cell) for cell in header_row]
-        header_map = {}
-        for idx, header in enumerate(headers):
-            key = HEADER_ALIAS.get(header, header)
-            if key:
-                header_map[key] = idx
-
-        missing = {"sku", "nombre", "precio"} - set(header_map.keys())
-        if missing:
-            errors.append(f"Faltan columnas obligatorias: {', '.join(sorted(missing))}")
-            return created, updated, errors
         offer_column_present = "oferta" in header_map
         offer_price_column_present = "precio_oferta" in header_map
+        multi_name_skus = self._collect_multi_name_skus(
+            self._iter_upload_rows(upload, header_idx, header_map)
+        )
 
-        sku_name_sets = {}
-        wb, sheet = open_sheet()
-        for row_idx, raw in enumerate(sheet.iter_rows(values_only=True), start=1):
-            if header_idx is not None and row_idx - 1 == header_idx:
-                continue
-            row_data = {
-                key: raw[header_map[key]] if key in header_map and header_map[key] < len(raw) else ""
-                for key in header_map
-            }
-            nombre_row = str(row_data.get("nombre") or "").strip()
-            sku_row = str(row_data.get("sku") or "").strip().upper()
-            if not nombre_row or not sku_row:
-                continue
-            sku_name_sets.setdefault(sku_row, set()).add(self._norm_header(nombre_row))
-        wb.close()
-        multi_name_skus = {sku for sku, names in sku_name_sets.items() if len(names) > 1}
-
-        wb, sheet = open_sheet()
-        for idx, raw in enumerate(sheet.iter_rows(values_only=True), start=1):
-            if header_idx is not None and idx - 1 == header_idx:
-                continue
-            data = {
-                key: raw[header_map[key]] if key in header_map and header_map[key] < len(raw) else ""
-                for key in header_map
-            }
-            row_data = {key: data.get(key) for key in header_map}
-            if all(value in ("", None) for value in row_data.values()):
+        records = self._iter_parsed_records(
+            self._iter_upload_rows(upload, header_idx, header_map),
+            offer_column_present=offer_column_present,
+            offer_price_column_present=offer_price_column_present,
+        )
+        for idx, record in records:
+            if record is None:
                 continue
-
-            nombre = row_data.get("nombre") or ""
-            precio = self._parse_decimal(row_data.get("precio"))
-            precio_oferta = self._parse_decimal(row_data.get("precio_oferta"))
-            oferta_flag = self._parse_optional_bool(row_data.get("oferta"))
-            if oferta_flag is None:
-                if offer_column_present:
-                    oferta_flag = precio_oferta is not None if offer_price_column_present else False
-                elif precio_oferta is not None:
-                    oferta_flag = True
+            nombre = record["nombre"]
             if not nombre:
                 errors.append(f"Fila {idx}: nombre es obligatorio.")
                 continue
-            if precio is None:
-                precio = Decimal("0")
-
-            attr_pairs = self._collect_attr_pairs(row_data)
-            has_declared_attrs = bool(attr_pairs)
-
-            sku_raw = row_data.get("sku") or ""
-            parent_sku_raw = row_data.get("parent_sku") or ""
-            slug_raw = row_data.get("slug") or ""
-            idproduct_raw = row_data.get("idproduct") or ""
-            categoria_raw = row_data.get("categoria") or ""
-            subcategoria_raw = row_data.get("subcategoria") or ""
 
-            parsed_idproduct = self._parse_int(idproduct_raw)
+            parsed_idproduct = record["idproduct"]
             if parsed_idproduct:
                 previous_row = seen_idproducts.get(parsed_idproduct)
                 if previous_row is not None:
@@ -321,7 +380,7 @@ class ProductXlsxImporter:
                 seen_idproducts[parsed_idproduct] = idx
 
             categoria_obj = None
-            path_parts = self._compose_category_path(categoria_raw, subcategoria_raw)
+            path_parts = record["path_parts"]
             if path_parts:
                 parent = None
                 for part in path_parts:
@@ -329,109 +388,36 @@ class ProductXlsxImporter:
                 categoria_obj = parent
 
             existing, identity_error = self._find_existing_product_identity(
-                idproduct_raw=idproduct_raw,
-                slug_raw=slug_raw,
+                idproduct_raw=record["idproduct_raw"],
+                slug_raw=record["slug_raw"],
                 nombre=nombre,
                 categoria_obj=categoria_obj,
-                grouped=has_declared_attrs,
+                grouped=record["grouped"],
+                touched_ids=touched,
             )
             if identity_error:
                 errors.append(f"Fila {idx}: {identity_error}")
                 continue
 
-            if has_declared_attrs:
-                slug = existing.slug if existing else self._build_group_slug(nombre=nombre, path_parts=path_parts)
-            else:
-                sku_upper = str(sku_raw).strip().upper()
-                effective_sku = "" if (sku_upper and sku_upper in multi_name_skus) else sku_raw
-                slug = (
-                    existing.slug
-                    if existing
-                    else self._build_identity_slug(
-                        sku_raw=effective_sku,
-                        slug_raw=slug_raw,
-                        nombre=nombre,
-                        path_parts=path_parts,
-                        parent_sku_raw=parent_sku_raw or sku_raw,
-                    )
-                )
-
+            slug = existing.slug if existing else self._build_record_slug(record, multi_name_skus)
             existing = existing or Product.objects.filter(slug=slug).first()
             is_new = existing is None
             product = existing or Product(slug=slug, user=self.request_user)
-            product.sku = sku_raw
-            product.nombre = nombre
-            product.descripcion = row_data.get("descripcion") or ""
-            product.precio = precio
-            stock = self._parse_int(row_data.get("stock"))
-            product.stock = stock if stock is not None else 0
-            product.sin_stock = self._parse_bool(row_data.get("sin_stock"), default=False)
-            product.activo = self._parse_bool(row_data.get("activo"), default=True)
+            self._assign_record_fields(product, record)
             product.categoria = categoria_obj
-
-            attrs = {name: values for name, values in attr_pairs}
-
-            has_sku = bool(str(sku_raw).strip())
-            if has_declared_attrs:
-                merged = {}
-                if isinstance(product.atributos, dict):
-                    merged.update(product.atributos)
-                for key, values in attrs.items():
-                    current = merged.get(key, [])
-                    if not isinstance(current, list):
-                        current = [current] if current else []
-                    for value in values:
-                        if value not in current:
-                            current.append(value)
-                    merged[key] = current
-                product.atributos = merged if merged else {}
-
-                stock_map = product.atributos_stock if isinstance(product.atributos_stock, dict) else {}
-                price_map = product.atributos_precio if isinstance(product.atributos_precio, dict) else {}
-                if stock is not None:
-                    for key, values in attrs.items():
-                        existing_map = stock_map.get(key, {}) if isinstance(stock_map.get(key), dict) else {}
-                        for value in values:
-                            existing_map[value] = max(int(existing_map.get(value, 0)), int(stock))
-                        stock_map[key] = existing_map
-                product.atributos_stock = stock_map if stock_map else {}
-                for key, values in attrs.items():
-                    existing_prices = price_map.get(key, {}) if isinstance(price_map.get(key), dict) else {}
-                    for value in values:
-                        existing_prices[value] = float(precio)
-                    price_map[key] = existing_prices
-                product.atributos_precio = price_map if price_map else {}
-                product.precio = self._resolve_base_price(product, fallback=precio)
-            elif has_sku:
-                product.atributos = attrs if attrs else {}
-                if stock is not None and attrs:
-                    stock_map = {}
-                    for key, values in attrs.items():
-                        stock_map[key] = {value: int(stock) for value in values}
-                    product.atributos_stock = stock_map
-                elif not attrs:
-                    product.atributos_stock = {}
-                product.atributos_precio = {}
-            else:
-                product.atributos = {}
-                product.atributos_stock = {}
-                product.atributos_precio = {}
-
-            image_urls = self._extract_image_urls(row_data)
-            if image_urls:
-                product.image_url = image_urls[0]
             if is_new and not product.slug:
                 product.slug = self._build_slug(nombre)
             product.save()
             offer_error = self._sync_xlsx_offer(
                 product=product,
-                base_price=precio,
-                offer_price=precio_oferta,
-                offer_flag=oferta_flag,
+                base_price=record["precio"],
+                offer_price=record["precio_oferta"],
+                offer_flag=record["oferta_flag"],
             )
             if offer_error:
                 errors.append(f"Fila {idx}: {offer_error}")
 
+            image_urls = record["image_urls"]
             if image_urls:
                 gallery_urls = image_urls[1:]
                 existing_qs = ProductImage.objects.filter(product=product)
@@ -463,14 +449,371 @@ class ProductXlsxImporter:
                 created += 1
             else:
                 updated += 1
-            product = self._merge_same_name_duplicates(
-                product=product,
-                category_scoped=bool(categoria_obj),
-            )
+            # Reasignar una clave existente conserva el orden de la primera aparicion.
+            touched[product.pk] = (product, bool(categoria_obj))
 
-        wb.close()
+        self._merge_planned_duplicates(touched.values())
+        if created or updated:
+            schedule_catalog_snapshot_refresh()
         return created, updated, errors
 
+    def preview_upload(self, upload):
+        """Simula la importacion sin escribir en la DB.
+
+        Carga productos, categorias, galerias y ofertas una sola vez y resuelve
+        la identidad de cada fila en memoria con las mismas reglas que
+        ``import_upload``. Devuelve altas, cambios por campo, fusiones por nombre,
+        cambios de oferta y productos de la DB que no aparecen en el archivo.
+        """
+        report = {
+            "rows": 0,
+            "created": [],
+            "updated": [],
+            "unchanged": 0,
+            "merges": [],
+            "offers": [],
+            "missing": [],
+            "missing_total": 0,
+            "new_categories": [],
+            "errors": [],
+        }
+
+        header_idx, header_map, header_error = self._read_upload_header(upload)
+        if header_error:
+            report["errors"].append(header_error)
+            return report
+
+        offer_column_present = "oferta" in header_map
+        offer_price_column_present = "precio_oferta" in header_map
+        multi_name_skus = self._collect_multi_name_skus(
+            self._iter_upload_rows(upload, header_idx, header_map)
+        )
+        index = _CatalogPreviewIndex(self)
+        seen_idproducts = {}
+
+        records = self._iter_parsed_records(
+            self._iter_upload_rows(upload, header_idx, header_map),
+            offer_column_present=offer_column_present,
+            offer_price_column_present=offer_price_column_present,
+        )
+        for idx, record in records:
+            if record is None:
+                continue
+            report["rows"] += 1
+            nombre = record["nombre"]
+            if not nombre:
+                report["errors"].append(f"Fila {idx}: nombre es obligatorio.")
+                continue
+
+            parsed_idproduct = record["idproduct"]
+            if parsed_idproduct:
+                previous_row = seen_idproducts.get(parsed_idproduct)
+                if previous_row is not None:
+                    report["errors"].append(
+                        f"Fila {idx}: IDProduct {parsed_idproduct} repetido en el archivo "
+                        f"(ya apareció en la fila {previous_row})."
+                    )
+                    continue
+                seen_idproducts[parsed_idproduct] = idx
+
+            category_id = index.resolve_category_path(record["path_parts"])
+            existing, identity_error = index.find_identity(record, category_id)
+            if identity_error:
+                report["errors"].append(f"Fila {idx}: {identity_error}")
+                continue
+
+            slug = existing.slug if existing else self._build_record_slug(record, multi_name_skus)
+            existing = existing or index.by_slug.get(slug)
+            product = existing or index.add_new_product(slug)
+            index.touch(product, idx, category_scoped=bool(category_id))
+            self._assign_record_fields(product, record)
+            product.categoria_id = category_id if category_id and category_id > 0 else None
+            index.category_of[id(product)] = category_id
+            index.reindex_name(product)
+            if record["image_urls"]:
+                index.gallery[id(product)] = list(record["image_urls"][1:])
+
+            offer_change, offer_error = index.plan_offer(product, record)
+            if offer_error:
+                report["errors"].append(f"Fila {idx}: {offer_error}")
+            elif offer_change:
+                report["offers"].append({"row": idx, **offer_change})
+
+        report["merges"] = index.plan_merges()
+
+        for product, rows in index.touched():
+            after = index.snapshot(product)
+            if product.pk is None:
+                report["created"].append({
+                    "rows": rows,
+                    "nombre": after["nombre"],
+                    "sku": after["sku"],
+                    "categoria": after["categoria"],
+                    "precio": after["precio"],
+                })
+                continue
+            before = index.originals[product.pk]
+            changes = [
+                {"field": field, "before": before[field], "after": after[field]}
+                for field in before
+                if before[field] != after[field]
+            ]
+            if changes:
+                report["updated"].append({
+                    "rows": rows,
+                    "id": product.pk,
+                    "nombre": after["nombre"],
+                    "changes": changes,
+                })
+            else:
+                report["unchanged"] += 1
+
+        missing = index.untouched_products()
+        report["missing_total"] = len(missing)
+        report["missing"] = [
+            {
+                "id": product.pk,
+                "nombre": product.nombre,
+                "categoria": index.category_path(product.categoria_id),
+                "activo": product.activo,
+                "has_orders": product.pk in index.with_orders,
+            }
+            for product in missing
+        ]
+        report["new_categories"] = index.new_category_paths()
+        return report
+
+    def _is_csv_upload(self, upload):
+        upload.seek(0)
+        magic = upload.read(len(XLSX_MAGIC))
+        upload.seek(0)
+        return magic != XLSX_MAGIC
+
+    def _detect_csv_delimiter(self, upload):
+        upload.seek(0)
+        sample = upload.read(64 * 1024)
+        upload.seek(0)
+        if isinstance(sample, bytes):
+            sample = sample.decode("utf-8-sig", errors="ignore")
+        try:
+            return csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+        except csv.Error:
+            first_line = sample.splitlines()[0] if sample else ""
+            return ";" if first_line.count(";") >= first_line.count(",") else ","
+
+    def _iter_raw_rows(self, upload):
+        """Filas crudas de la planilla, sea XLSX o CSV (UTF-8, separador ``;`` o ``,``)."""
+        if self._is_csv_upload(upload):
+            delimiter = self._detect_csv_delimiter(upload)
+            lines = codecs.iterdecode(upload, "utf-8-sig")
+            for row in csv.reader(lines, delimiter=delimiter):
+                yield tuple(row)
+            return
+
+        upload.seek(0)
+        workbook = openpyxl.load_workbook(upload, data_only=True, read_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    def _read_upload_header(self, upload):
+        """Devuelve (indice de fila, header_map, error) del encabezado de la planilla."""
+        header_idx = None
+        header_row = None
+        rows = self._iter_raw_rows(upload)
+        try:
+            for i, row in enumerate(rows):
+                if not row:
+                    continue
+                normalized = [self._norm_header(cell) for cell in row]
+                if {"sku", "nombre", "precio"}.issubset(set(normalized)):
+                    header_idx = i
+                    header_row = row
+                    break
+        finally:
+            rows.close()
+
+        if header_row is None:
+            return None, None, "Faltan columnas obligatorias: precio, sku"
+
+        header_map = {}
+        for idx, header in enumerate(self._norm_header(cell) for cell in header_row):
+            key = HEADER_ALIAS.get(header, header)
+            if key:
+                header_map[key] = idx
+
+        missing = {"sku", "nombre", "precio"} - set(header_map.keys())
+        if missing:
+            return header_idx, header_map, f"Faltan columnas obligatorias: {', '.join(sorted(missing))}"
+        return header_idx, header_map, None
+
+    def _iter_upload_rows(self, upload, header_idx, header_map):
+        """Recorre la planilla devolviendo (numero de fila, datos por columna normalizada)."""
+        for idx, raw in enumerate(self._iter_raw_rows(upload), start=1):
+            if header_idx is not None and idx - 1 == header_idx:
+                continue
+            yield idx, {
+                key: raw[column] if column < len(raw) else ""
+                for key, column in header_map.items()
+            }
+
+    def _collect_multi_name_skus(self, rows):
+        sku_name_sets = {}
+        for _idx, row_data in rows:
+            nombre_row = str(row_data.get("nombre") or "").strip()
+            sku_row = str(row_data.get("sku") or "").strip().upper()
+            if not nombre_row or not sku_row:
+                continue
+            sku_name_sets.setdefault(sku_row, set()).add(self._norm_header(nombre_row))
+        return {sku for sku, names in sku_name_sets.items() if len(names) > 1}
+
+    def _parse_row(self, row_data, *, offer_column_present, offer_price_column_present):
+        """Normaliza una fila de la planilla sin tocar la DB. Devuelve None si la fila esta vacia."""
+        if all(value in ("", None) for value in row_data.values()):
+            return None
+
+        precio = self._parse_decimal(row_data.get("precio"))
+        precio_oferta = self._parse_decimal(row_data.get("precio_oferta"))
+        oferta_flag = self._parse_optional_bool(row_data.get("oferta"))
+        if oferta_flag is None:
+            if offer_column_present:
+                oferta_flag = precio_oferta is not None if offer_price_column_present else False
+            elif precio_oferta is not None:
+                oferta_flag = True
+        if precio is None:
+            precio = Decimal("0")
+
+        attr_pairs = self._collect_attr_pairs(row_data)
+        idproduct_raw = row_data.get("idproduct") or ""
+        return {
+            "nombre": row_data.get("nombre") or "",
+            "precio": precio,
+            "precio_oferta": precio_oferta,
+            "oferta_flag": oferta_flag,
+            "attr_pairs": attr_pairs,
+            "grouped": bool(attr_pairs),
+            "sku_raw": row_data.get("sku") or "",
+            "parent_sku_raw": row_data.get("parent_sku") or "",
+            "slug_raw": row_data.get("slug") or "",
+            "idproduct_raw": idproduct_raw,
+            "idproduct": self._parse_int(idproduct_raw),
+            "path_parts": self._compose_category_path(
+                row_data.get("categoria") or "",
+                row_data.get("subcategoria") or "",
+            ),
+            "descripcion": row_data.get("descripcion") or "",
+            "stock": self._parse_int(row_data.get("stock")),
+            "sin_stock": self._parse_bool(row_data.get("sin_stock"), default=False),
+            "activo": self._parse_bool(row_data.get("activo"), default=True),
+            "image_urls": self._extract_image_urls(row_data),
+        }
+
+    def _iter_parsed_records(self, rows, *, offer_column_present, offer_price_column_present):
+        """Normaliza las filas en orden devolviendo (numero de fila, registro).
+
+        Con ``parse_pool`` y una planilla grande reparte el parseo por tandas entre los
+        procesos del pool; la DB se sigue escribiendo solo desde este proceso.
+        """
+        options = {
+            "offer_column_present": offer_column_present,
+            "offer_price_column_present": offer_price_column_present,
+        }
+        rows = iter(rows)
+        head = list(islice(rows, PARALLEL_PARSE_MIN_ROWS))
+        if self.parse_pool is None or len(head) < PARALLEL_PARSE_MIN_ROWS:
+            for idx, row_data in chain(head, rows):
+                yield idx, self._parse_row(row_data, **options)
+            return
+
+        pending = deque()
+        for batch in _iter_batches(chain(head, rows), PARSE_BATCH_SIZE):
+            pending.append(self.parse_pool.apply_async(_parse_row_batch, (batch, options)))
+            # Ventana acotada: la planilla se lee a la par de lo que se escribe.
+            if len(pending) >= PARSE_IN_FLIGHT_BATCHES:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+    def _build_record_slug(self, record, multi_name_skus):
+        if record["grouped"]:
+            return self._build_group_slug(nombre=record["nombre"], path_parts=record["path_parts"])
+        sku_raw = record["sku_raw"]
+        sku_upper = str(sku_raw).strip().upper()
+        effective_sku = "" if (sku_upper and sku_upper in multi_name_skus) else sku_raw
+        return self._build_identity_slug(
+            sku_raw=effective_sku,
+            slug_raw=record["slug_raw"],
+            nombre=record["nombre"],
+            path_parts=record["path_parts"],
+            parent_sku_raw=record["parent_sku_raw"] or sku_raw,
+        )
+
+    def _assign_record_fields(self, product, record):
+        """Vuelca una fila normalizada sobre el producto (sin guardar ni tocar la categoria)."""
+        sku_raw = record["sku_raw"]
+        precio = record["precio"]
+        stock = record["stock"]
+        product.sku = sku_raw
+        product.nombre = record["nombre"]
+        product.descripcion = record["descripcion"]
+        product.precio = precio
+        product.stock = stock if stock is not None else 0
+        product.sin_stock = record["sin_stock"]
+        product.activo = record["activo"]
+
+        attrs = {name: values for name, values in record["attr_pairs"]}
+
+        has_sku = bool(str(sku_raw).strip())
+        if record["grouped"]:
+            merged = {}
+            if isinstance(product.atributos, dict):
+                merged.update(product.atributos)
+            for key, values in attrs.items():
+                current = merged.get(key, [])
+                if not isinstance(current, list):
+                    current = [current] if current else []
+                for value in values:
+                    if value not in current:
+                        current.append(value)
+                merged[key] = current
+            product.atributos = merged if merged else {}
+
+            stock_map = product.atributos_stock if isinstance(product.atributos_stock, dict) else {}
+            price_map = product.atributos_precio if isinstance(product.atributos_precio, dict) else {}
+            if stock is not None:
+                for key, values in attrs.items():
+                    existing_map = stock_map.get(key, {}) if isinstance(stock_map.get(key), dict) else {}
+                    for value in values:
+                        existing_map[value] = max(int(existing_map.get(value, 0)), int(stock))
+                    stock_map[key] = existing_map
+            product.atributos_stock = stock_map if stock_map else {}
+            for key, values in attrs.items():
+                existing_prices = price_map.get(key, {}) if isinstance(price_map.get(key), dict) else {}
+                for value in values:
+                    existing_prices[value] = float(precio)
+                price_map[key] = existing_prices
+            product.atributos_precio = price_map if price_map else {}
+            product.precio = self._resolve_base_price(product, fallback=precio)
+        elif has_sku:
+            product.atributos = attrs if attrs else {}
+            if stock is not None and attrs:
+                stock_map = {}
+                for key, values in attrs.items():
+                    stock_map[key] = {value: int(stock) for value in values}
+                product.atributos_stock = stock_map
+            elif not attrs:
+                product.atributos_stock = {}
+            product.atributos_precio = {}
+        else:
+            product.atributos = {}
+            product.atributos_stock = {}
+            product.atributos_precio = {}
+
+        image_urls = record["image_urls"]
+        if image_urls:
+            product.image_url = image_urls[0]
+
     def _parse_bool(self, value, default=True):
         if value is None or value == "":
             return default
@@ -678,7 +1021,9 @@ class ProductXlsxImporter:
     def _find_existing_group_product(self, *, nombre, categoria_obj):
         return self._find_existing_product_by_name(nombre=nombre, categoria_obj=categoria_obj)
 
-    def _find_existing_product_identity(self, *, idproduct_raw, slug_raw, nombre, categoria_obj, grouped):
+    def _find_existing_product_identity(
+        self, *, idproduct_raw, slug_raw, nombre, categoria_obj, grouped, touched_ids=()
+    ):
         pk = self._parse_int(idproduct_raw)
         if pk:
             product = Product.objects.filter(pk=pk).first()
@@ -701,6 +1046,7 @@ class ProductXlsxImporter:
                 return self._select_best_duplicate_candidate(
                     category_matches,
                     preferred_category_id=categoria_obj.id,
+                    touched_ids=touched_ids,
                 ), None
 
         if len(name_matches) == 1:
@@ -709,70 +1055,127 @@ class ProductXlsxImporter:
             return self._select_best_duplicate_candidate(
                 name_matches,
                 preferred_category_id=categoria_obj.id if categoria_obj else None,
+                touched_ids=touched_ids,
             ), None
 
         if grouped:
             return self._find_existing_group_product(nombre=nombre, categoria_obj=categoria_obj), None
         return self._find_existing_product_by_name(nombre=nombre, categoria_obj=categoria_obj), None
 
-    def _select_best_duplicate_candidate(self, candidates, preferred_category_id=None):
-        def score(product):
-            has_primary_image = bool(str(product.image_url or "").strip()) or bool(getattr(product, "imagen", None))
-            has_gallery = product.extra_images.exists()
-            has_description = bool(str(product.descripcion or "").strip())
-            has_video = bool(str(product.video_url or "").strip())
-            has_stock = int(product.stock or 0) > 0
-            has_price = self._parse_decimal(product.precio) not in (None, Decimal("0"))
-            has_orders = product.order_items.exists()
-            has_offers = product.ofertas.exists()
-            return (
-                1 if preferred_category_id and product.categoria_id == preferred_category_id else 0,
-                1 if has_orders else 0,
-                1 if has_offers else 0,
-                1 if product.activo else 0,
-                1 if has_primary_image else 0,
-                1 if has_gallery else 0,
-                1 if has_description else 0,
-                1 if has_video else 0,
-                1 if has_stock else 0,
-                1 if has_price else 0,
-                product.creado_en,
-                product.pk,
-            )
+    def _select_best_duplicate_candidate(self, candidates, preferred_category_id=None, touched_ids=()):
+        """Elige el mejor candidato con una sola consulta para galeria, pedidos y ofertas.
+
+        Un producto ya importado en esta misma planilla gana siempre: sus duplicados
+        se fusionan en el al final de la importacion.
+        """
+        flags = self._duplicate_flags([product.pk for product in candidates])
+        return max(
+            candidates,
+            key=lambda product: (
+                1 if product.pk in touched_ids else 0,
+                *self._duplicate_score(
+                    product,
+                    preferred_category_id=preferred_category_id,
+                    **flags.get(product.pk, {}),
+                ),
+            ),
+        )
 
-        return max(candidates, key=score)
+    def _duplicate_flags(self, pks):
+        from orders.models import OrderItem
 
-    def _merge_same_name_duplicates(self, *, product, category_scoped=True):
-        target = self._norm_compare_text(product.nombre)
-        if not target:
-            return product
-        raw_name = str(product.nombre or "").strip()
-        if not raw_name:
-            return product
+        rows = (
+            Product.objects.filter(pk__in=pks)
+            .annotate(
+                has_gallery=Exists(ProductImage.objects.filter(product=OuterRef("pk"))),
+                has_orders=Exists(OrderItem.objects.filter(product=OuterRef("pk"))),
+                has_offers=Exists(Offer.objects.filter(producto=OuterRef("pk"))),
+            )
+            .values_list("pk", "has_gallery", "has_orders", "has_offers")
+        )
+        return {
+            pk: {"has_gallery": has_gallery, "has_orders": has_orders, "has_offers": has_offers}
+            for pk, has_gallery, has_orders, has_offers in rows
+        }
 
-        queryset = Product.objects.exclude(pk=product.pk).select_related("categoria")
-        if category_scoped:
-            if product.categoria_id:
-                queryset = queryset.filter(categoria_id=product.categoria_id)
-            else:
-                queryset = queryset.filter(categoria__isnull=True)
-        queryset = queryset.filter(nombre__iexact=raw_name)
+    def _duplicate_score(self, product, *, preferred_category_id, has_gallery, has_orders, has_offers):
+        has_primary_image = bool(str(product.image_url or "").strip()) or bool(getattr(product, "imagen", None))
+        has_description = bool(str(product.descripcion or "").strip())
+        has_video = bool(str(product.video_url or "").strip())
+        has_stock = int(product.stock or 0) > 0
+        has_price = self._parse_decimal(product.precio) not in (None, Decimal("0"))
+        return (
+            1 if preferred_category_id and product.categoria_id == preferred_category_id else 0,
+            1 if has_orders else 0,
+            1 if has_offers else 0,
+            1 if product.activo else 0,
+            1 if has_primary_image else 0,
+            1 if has_gallery else 0,
+            1 if has_description else 0,
+            1 if has_video else 0,
+            1 if has_stock else 0,
+            1 if has_price else 0,
+            product.creado_en,
+            product.pk,
+        )
 
-        duplicates = [
-            candidate
-            for candidate in queryset
-            if self._norm_compare_text(candidate.nombre) == target
-        ]
-        if not duplicates:
-            return product
+    def _merge_planned_duplicates(self, touched):
+        """Fusiona, una vez por importacion, los duplicados por nombre de lo importado.
+
+        ``touched`` son pares (producto, fusion acotada a la categoria) en orden de
+        importacion. Todos los candidatos se leen en una sola pasada y cada grupo de
+        nombres se fusiona en el primer producto importado de ese grupo.
+        """
+        touched = [(product, scoped) for product, scoped in touched if product.pk]
+        raw_names = {str(product.nombre or "").strip() for product, _scoped in touched}
+        raw_names.discard("")
+        if not raw_names:
+            return
+
+        by_name = {}
+        names = sorted(raw_names)
+        for start in range(0, len(names), MERGE_PLAN_NAME_CHUNK_SIZE):
+            chunk = names[start:start + MERGE_PLAN_NAME_CHUNK_SIZE]
+            queryset = (
+                Product.objects.annotate(nombre_lower=Lower("nombre"))
+                .filter(Q(nombre__in=chunk) | Q(nombre_lower__in=[name.lower() for name in chunk]))
+                .select_related("categoria")
+                .order_by("id")
+            )
+            for candidate in queryset:
+                key = self._norm_compare_text(candidate.nombre)
+                if key:
+                    by_name.setdefault(key, []).append(candidate)
+
+        absorbed = set()
+        # Los dias con ventas de los absorbidos se recalculan una sola vez al final.
+        sales_days = set()
+        for product, category_scoped in touched:
+            if product.pk in absorbed:
+                continue
+            target = self._norm_compare_text(product.nombre)
+            raw_name = str(product.nombre or "").strip().lower()
+            duplicates = [
+                candidate
+                for candidate in by_name.get(target, [])
+                if candidate.pk != product.pk
+                and candidate.pk not in absorbed
+                and str(candidate.nombre or "").strip().lower() == raw_name
+                and (not category_scoped or candidate.categoria_id == product.categoria_id)
+            ]
+            if not duplicates:
+                continue
+            self._merge_products(survivor=product, duplicates=duplicates, sales_days=sales_days)
+            absorbed.update(candidate.pk for candidate in duplicates)
+        refresh_merged_sales_days(sales_days)
 
-        product = self._merge_products(
-            survivor=product,
-            duplicates=duplicates,
-        )
-        return product
+    def _merge_products(self, *, survivor, duplicates, sales_days=None):
+        """Fusiona ``duplicates`` en ``survivor``.
 
-    def _merge_products(self, *, survivor, duplicates):
+        Con ``sales_days`` (un set) solo anota los dias de ventas a recalcular y el que
+        llama los refresca con ``refresh_merged_sales_days``; sin el, los refresca al terminar.
+        """
+        pending_days = set() if sales_days is None else sales_days
         attrs = survivor.atributos if isinstance(survivor.atributos, dict) else {}
         attrs_stock = survivor.atributos_stock if isinstance(survivor.atributos_stock, dict) else {}
         attrs_price = survivor.atributos_precio if isinstance(survivor.atributos_precio, dict) else {}
@@ -787,6 +1190,7 @@ class ProductXlsxImporter:
         for current in sorted(duplicates, key=lambda item: (item.creado_en, item.pk)):
             ProductImage.objects.filter(product=current).update(product=survivor)
             Offer.objects.filter(producto=current).update(producto=survivor)
+            pending_days.update(current.sales_rollups.values_list("fecha", flat=True).distinct())
             current.order_items.update(product=survivor)
 
             is_newer = (current.creado_en, current.pk) > (survivor.creado_en, survivor.pk)
@@ -873,6 +1277,8 @@ class ProductXlsxImporter:
         duplicate_ids = [candidate.pk for candidate in duplicates]
         if duplicate_ids:
             Product.objects.filter(pk__in=duplicate_ids).delete()
+        if sales_days is None:
+            refresh_merged_sales_days(pending_days)
         return survivor
 
     def _resolve_base_price(self, product, fallback):
@@ -900,13 +1306,12 @@ class ProductXlsxImporter:
         return f"{base_slug}-{digest}"[:110]
 
     def _build_export_workbook(self):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Productos"
-        ws.append(EXPORT_HEADERS)
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Productos")
         for column_letter, width in EXPORT_COLUMN_WIDTHS.items():
             ws.column_dimensions[column_letter].width = width
-        return wb
+        ws.append(EXPORT_HEADERS)
+        return wb, ws
 
     def _load_export_base_workbook(self):
         if self.template_xlsx_path and os.path.isfile(self.template_xlsx_path):
@@ -919,7 +1324,7 @@ class ProductXlsxImporter:
                 return workbook
         return None
 
-    def _serialize_product_for_export(self, product):
+    def _serialize_product_for_export(self, product, category_paths=None):
         row = {header: "" for header in EXPORT_HEADERS}
         row["Nombre"] = product.nombre or ""
         row["Stock"] = product.stock if product.stock is not None else ""
@@ -941,7 +1346,10 @@ class ProductXlsxImporter:
         else:
             row["Precio oferta"] = ""
             row["Oferta"] = ""
-        row["Categorías"] = self._build_export_category_path(product.categoria)
+        if category_paths is not None:
+            row["Categorías"] = category_paths.get(product.categoria_id, "")
+        else:
+            row["Categorías"] = self._build_export_category_path(product.categoria)
         row["Peso"] = ""
         row["Alto"] = ""
         row["Ancho"] = ""
@@ -954,7 +1362,7 @@ class ProductXlsxImporter:
         primary_image = self._get_export_image_value(product.image_url, getattr(product, "imagen", None))
         if primary_image:
             image_urls.append(primary_image)
-        for image in product.extra_images.all().order_by("order", "id"):
+        for image in product.extra_images.all():
             image_value = self._get_export_image_value(image.image_url, getattr(image, "image", None))
             if image_value and image_value not in image_urls:
                 image_urls.append(image_value)
@@ -983,6 +1391,10 @@ class ProductXlsxImporter:
     def _get_export_offer(self, product):
         if not product or not product.pk:
             return None
+        prefetched = getattr(product, "export_offers", None)
+        if prefetched is not None:
+            slug = self._xlsx_offer_slug(product)
+            return next((offer for offer in prefetched if offer.slug == slug), None)
         return Offer.objects.filter(
             producto=product,
             activo=True,
@@ -1051,6 +1463,36 @@ class ProductXlsxImporter:
             current = current.parent
         return " > ".join(reversed(parts))
 
+    def _build_export_category_paths(self):
+        """Arma todas las rutas "Padre > Hijo" con una sola consulta de categorias."""
+        categories = {
+            row["id"]: (row["nombre"], row["parent_id"])
+            for row in Category.objects.values("id", "nombre", "parent_id")
+        }
+        paths = {}
+
+        def resolve(category_id):
+            if category_id in paths:
+                return paths[category_id]
+            parts = []
+            chain = []
+            current = category_id
+            while current is not None and current in categories and current not in chain:
+                if current in paths:
+                    parts.append(paths[current])
+                    break
+                chain.append(current)
+                nombre, parent_id = categories[current]
+                parts.append(nombre)
+                current = parent_id
+            path = " > ".join(reversed(parts))
+            paths[category_id] = path
+            return path
+
+        for category_id in categories:
+            resolve(category_id)
+        return paths
+
     def _format_export_number(self, value):
         if value in (None, ""):
             return ""
@@ -1095,3 +1537,301 @@ class ProductXlsxImporter:
         }
         return self._export_row_signatures(row)
 
+
+class _CsvLineBuffer:
+    """Pseudo archivo para ``csv.writer``: devuelve cada linea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+class _CatalogPreviewIndex:
+    """Foto en memoria del catalogo para ``ProductXlsxImporter.preview_upload``.
+
+    Todo se carga con un puñado de consultas de solo lectura; los productos
+    que la simulacion modifica son instancias sin guardar.
+    """
+
+    def __init__(self, importer):
+        self.importer = importer
+        self.by_pk = {}
+        self.by_slug = {}
+        self.by_name = {}
+        self.name_key_of = {}
+        self.category_of = {}
+        self.originals = {}
+        self.rows_by_product = {}
+        self.merged = set()
+        self.merge_scope = {}
+        self._new_products = []
+        self._new_categories = {}
+
+        self.gallery = {}
+        gallery_by_pk = {}
+        for product_id, image_url in (
+            ProductImage.objects.exclude(image_url="")
+            .order_by("order", "id")
+            .values_list("product_id", "image_url")
+        ):
+            gallery_by_pk.setdefault(product_id, []).append(image_url)
+        self.with_gallery = set(ProductImage.objects.values_list("product_id", flat=True).distinct())
+
+        from orders.models import OrderItem
+
+        self.with_orders = set(OrderItem.objects.values_list("product_id", flat=True).distinct())
+
+        self.offers_by_product = {}
+        for offer in Offer.objects.filter(producto__isnull=False).values(
+            "id", "slug", "activo", "porcentaje", "precio_oferta", "producto_id"
+        ):
+            self.offers_by_product.setdefault(offer["producto_id"], []).append(offer)
+
+        self.categories = {}
+        self.children = {}
+        for category in Category.objects.order_by("nombre", "id").values("id", "nombre", "parent_id"):
+            self.categories[category["id"]] = category
+            key = importer._norm_header(category["nombre"])
+            self.children.setdefault(category["parent_id"], {}).setdefault(key, category["id"])
+
+        for product in Product.objects.prefetch_related("variants").order_by("id").iterator(chunk_size=2000):
+            self.by_pk[product.pk] = product
+            if product.slug:
+                self.by_slug.setdefault(product.slug, product)
+            self.category_of[id(product)] = product.categoria_id
+            self.gallery[id(product)] = gallery_by_pk.get(product.pk, [])
+            self._index_name(product)
+
+    def _index_name(self, product):
+        key = self.importer._norm_compare_text(product.nombre)
+        self.name_key_of[id(product)] = key
+        if key:
+            self.by_name.setdefault(key, []).append(product)
+
+    def reindex_name(self, product):
+        key = self.name_key_of.get(id(product))
+        if key and product in self.by_name.get(key, []):
+            self.by_name[key].remove(product)
+        self._index_name(product)
+
+    def resolve_category_path(self, path_parts):
+        """Igual que ``_get_or_create_category_normalized`` pero las altas son ids negativos."""
+        parent_id = None
+        for position, part in enumerate(path_parts):
+            key = self.importer._norm_header(part)
+            found = self.children.get(parent_id, {}).get(key)
+            if found is None:
+                found = -(len(self._new_categories) + 1)
+                self._new_categories[found] = " > ".join(path_parts[: position + 1])
+                self.categories[found] = {"id": found, "nombre": part, "parent_id": parent_id}
+                self.children.setdefault(parent_id, {})[key] = found
+            parent_id = found
+        return parent_id
+
+    def category_path(self, category_id):
+        parts = []
+        seen = set()
+        while category_id is not None and category_id not in seen:
+            seen.add(category_id)
+            category = self.categories.get(category_id)
+            if not category:
+                break
+            parts.append(category["nombre"])
+            category_id = category["parent_id"]
+        return " > ".join(reversed(parts))
+
+    def new_category_paths(self):
+        return [self._new_categories[key] for key in sorted(self._new_categories, reverse=True)]
+
+    def _name_matches(self, nombre):
+        target = self.importer._norm_compare_text(nombre)
+        raw_name = str(nombre or "").strip().lower()
+        if not target or not raw_name:
+            return []
+        return [
+            product
+            for product in self.by_name.get(target, [])
+            if str(product.nombre or "").lower() == raw_name
+        ]
+
+    def _best_candidate(self, candidates, preferred_category_id):
+        return max(
+            candidates,
+            key=lambda product: (
+                1 if id(product) in self.rows_by_product else 0,
+                *self.importer._duplicate_score(
+                    product,
+                    preferred_category_id=preferred_category_id,
+                    has_gallery=product.pk in self.with_gallery,
+                    has_orders=product.pk in self.with_orders,
+                    has_offers=bool(self.offers_by_product.get(product.pk)),
+                ),
+            ),
+        )
+
+    def find_identity(self, record, category_id):
+        pk = record["idproduct"]
+        if pk:
+            product = self.by_pk.get(pk)
+            if product is not None:
+                return product, None
+            return None, f"IDProduct {pk} no existe. Para evitar duplicados, esa fila no se importó."
+
+        slug_text = str(record["slug_raw"] or "").strip()
+        if slug_text and slug_text in self.by_slug:
+            return self.by_slug[slug_text], None
+
+        name_matches = self._name_matches(record["nombre"])
+        if category_id is not None:
+            category_matches = [
+                product for product in name_matches if self.category_of.get(id(product)) == category_id
+            ]
+            if len(category_matches) == 1:
+                return category_matches[0], None
+            if len(category_matches) > 1:
+                return self._best_candidate(category_matches, category_id), None
+        if len(name_matches) == 1:
+            return name_matches[0], None
+        if len(name_matches) > 1:
+            return self._best_candidate(name_matches, category_id), None
+        return None, None
+
+    def add_new_product(self, slug):
+        product = Product(slug=slug, user=self.importer.request_user)
+        self._new_products.append(product)
+        self.by_slug[slug] = product
+        self.gallery[id(product)] = []
+        return product
+
+    def touch(self, product, row, *, category_scoped):
+        key = id(product)
+        if key not in self.rows_by_product:
+            self.rows_by_product[key] = (product, [])
+            if product.pk is not None:
+                self.originals[product.pk] = self.snapshot(product)
+        self.rows_by_product[key][1].append(row)
+        # Como en ``import_upload``, cuenta la ultima fila que toco el producto.
+        self.merge_scope[key] = category_scoped
+
+    def touched(self):
+        return list(self.rows_by_product.values())
+
+    def snapshot(self, product):
+        importer = self.importer
+        return {
+            "nombre": product.nombre or "",
+            "sku": product.sku or "",
+            "descripcion": product.descripcion or "",
+            "precio": importer._format_export_number(product.precio),
+            "stock": product.stock,
+            "sin_stock": bool(product.sin_stock),
+            "activo": bool(product.activo),
+            "categoria": self.category_path(self.category_of.get(id(product))),
+            "image_url": product.image_url or "",
+            "galeria": list(self.gallery.get(id(product), [])),
+            "atributos": product.atributos or {},
+            "atributos_stock": product.atributos_stock or {},
+            "atributos_precio": product.atributos_precio or {},
+        }
+
+    def plan_offer(self, product, record):
+        """Replica las decisiones de ``_sync_xlsx_offer``; devuelve (cambio, error)."""
+        offer_flag = record["oferta_flag"]
+        offer_price = record["precio_oferta"]
+        base_price = record["precio"]
+        if offer_flag is None and offer_price is None:
+            return None, None
+
+        offers = self.offers_by_product.get(product.pk, []) if product.pk else []
+        xlsx_slug = f"{XLSX_OFFER_SLUG_PREFIX}-{product.pk}"
+        if offer_flag is False:
+            active = [offer for offer in offers if offer["activo"]]
+            if not active:
+                return None, None
+            return {
+                "id": product.pk,
+                "nombre": product.nombre,
+                "action": "desactivar",
+                "detail": ", ".join(offer["slug"] for offer in active),
+            }, None
+
+        if offer_price is None:
+            return None, "si Oferta es 'Si', Precio oferta es obligatorio."
+        if base_price is None or base_price <= 0:
+            return None, "no se puede calcular la oferta porque Precio debe ser mayor a 0."
+        if offer_price <= 0:
+            return None, "Precio oferta debe ser mayor a 0."
+        if offer_price >= base_price:
+            return None, "Precio oferta debe ser menor que Precio para generar descuento."
+        percent = (((base_price - offer_price) / base_price) * Decimal("100")).quantize(Decimal("0.01"))
+        if percent <= 0:
+            return None, "no se pudo calcular un porcentaje de descuento valido."
+
+        offer_price = offer_price.quantize(Decimal("0.01"))
+        current = next((offer for offer in offers if offer["slug"] == xlsx_slug), None)
+        others = [offer for offer in offers if offer["slug"] != xlsx_slug and offer["activo"]]
+        if current is None:
+            action = "crear"
+        elif current["activo"] and current["porcentaje"] == percent and current["precio_oferta"] == offer_price:
+            if not others:
+                return None, None
+            action = "desactivar otras"
+        else:
+            action = "actualizar"
+        detail = f"{self.importer._format_export_number(offer_price)} (-{percent}%)"
+        if others:
+            detail = f"{detail}; desactiva {', '.join(offer['slug'] for offer in others)}"
+        return {"id": product.pk, "nombre": product.nombre, "action": action, "detail": detail}, None
+
+    def same_name_duplicates(self, product, *, category_scoped):
+        target = self.name_key_of.get(id(product))
+        raw_name = str(product.nombre or "").strip().lower()
+        if not target or not raw_name:
+            return []
+        category_id = self.category_of.get(id(product))
+        duplicates = []
+        for candidate in self.by_name.get(target, []):
+            if candidate is product or candidate.pk is None or id(candidate) in self.merged:
+                continue
+            if str(candidate.nombre or "").strip().lower() != raw_name:
+                continue
+            if category_scoped and self.category_of.get(id(candidate)) != category_id:
+                continue
+            duplicates.append(candidate)
+        return duplicates
+
+    def plan_merges(self):
+        """Replica ``_merge_planned_duplicates``: fusiones al final, gana el primero tocado."""
+        merges = []
+        for product, rows in self.rows_by_product.values():
+            if product.pk is None or id(product) in self.merged:
+                continue
+            duplicates = self.same_name_duplicates(
+                product, category_scoped=self.merge_scope.get(id(product), False)
+            )
+            if not duplicates:
+                continue
+            merges.append({
+                "row": rows[0],
+                "survivor": product.pk,
+                "nombre": product.nombre,
+                "duplicates": [candidate.pk for candidate in duplicates],
+            })
+            self.drop(duplicates)
+        return merges
+
+    def drop(self, products):
+        for product in products:
+            self.merged.add(id(product))
+            self.by_pk.pop(product.pk, None)
+            if self.by_slug.get(product.slug) is product:
+                del self.by_slug[product.slug]
+            key = self.name_key_of.get(id(product))
+            if key and product in self.by_name.get(key, []):
+                self.by_name[key].remove(product)
+
+    def untouched_products(self):
+        return [
+            product
+            for product in self.by_pk.values()
+            if id(product) not in self.rows_by_product and id(product) not in self.merged
+        ]
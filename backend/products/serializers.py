@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Product, ProductImage, Category, Offer
+from .models import VARIANT_MAP_NAMES, Product, ProductImage, Category, Offer, variant_rows_from_maps
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -30,6 +30,18 @@ class OfferSerializer(serializers.ModelSerializer):
         ]
 
 
+class VariantMapField(serializers.JSONField):
+    """Mapa JSON de variantes; al grabar el producto se guarda en ``ProductVariant``."""
+
+    default_error_messages = {"not_a_dict": "Debe ser un objeto JSON."}
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not isinstance(value, dict):
+            self.fail("not_a_dict")
+        return value
+
+
 class ProductSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     categoria = CategorySerializer(read_only=True)
@@ -37,6 +49,10 @@ class ProductSerializer(serializers.ModelSerializer):
         source="categoria", queryset=Category.objects.all(), write_only=True, required=False, allow_null=True
     )
     images = serializers.SerializerMethodField()
+    atributos = VariantMapField(required=False)
+    atributos_stock = VariantMapField(required=False)
+    atributos_precio = VariantMapField(required=False)
+    atributos_sin_stock = VariantMapField(required=False)
 
     class Meta:
         model = Product
@@ -63,6 +79,16 @@ class ProductSerializer(serializers.ModelSerializer):
             "creado_en",
         ]
 
+    def validate(self, attrs):
+        if any(name in attrs for name in VARIANT_MAP_NAMES):
+            # Los mapas que no vienen se completan con los guardados, como hace save().
+            maps = {name: attrs.get(name, getattr(self.instance, name, {})) for name in VARIANT_MAP_NAMES}
+            try:
+                variant_rows_from_maps(*(maps[name] for name in VARIANT_MAP_NAMES))
+            except (TypeError, ValueError, ArithmeticError):
+                raise serializers.ValidationError({"atributos_stock": "Stock o precio de variante invalido."})
+        return attrs
+
     def get_images(self, instance):
         out = []
         seen = set()
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from cotidjango.api_bootstrap import invalidate_public_bootstrap
+
+from .changes import touch_category_products, touch_offer_products, touch_products
+from .documents import schedule_product_documents
+from .models import Category, HomeImage, HomeMarquee, Offer, Product, ProductDeletion, ProductImage, StoreSettings
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_document(sender, instance, **kwargs):
+    schedule_product_documents([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def record_product_deletion(sender, instance, **kwargs):
+    ProductDeletion.objects.create(product_id=instance.pk, slug=instance.slug or "")
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_image_product(sender, instance, **kwargs):
+    touch_products([instance.product_id])
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def touch_discounted_products(sender, instance, **kwargs):
+    touch_offer_products([instance])
+
+
+@receiver(post_save, sender=Category)
+def touch_renamed_category_products(sender, instance, created, **kwargs):
+    # El nombre y la ruta de la categoria viajan dentro de cada producto; guardar sin
+    # cambiarlos (por ejemplo solo la descripcion) no los marca.
+    if not created and instance.path_changed():
+        touch_category_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Category)
+def touch_deleted_category_products(sender, instance, **kwargs):
+    # Sus productos quedan sin categoria por SET_NULL, que no pasa por save(); las
+    # subcategorias borradas en cascada reciben su propia senal.
+    touch_products(Product.objects.filter(categoria_id=instance.pk).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+@receiver(post_save, sender=HomeImage)
+@receiver(post_delete, sender=HomeImage)
+@receiver(post_save, sender=HomeMarquee)
+@receiver(post_delete, sender=HomeMarquee)
+@receiver(post_save, sender=StoreSettings)
+def refresh_public_bootstrap(sender, **kwargs):
+    # Los precios de productos en oferta se actualizan al vencer BOOTSTRAP_CACHE_SECONDS.
+    invalidate_public_bootstrap()
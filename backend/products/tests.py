@@ -1,18 +1,43 @@
+import gzip
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 from io import BytesIO
 from io import StringIO
+from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest import mock
 
 import openpyxl
+from django.core.cache import cache
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase, override_settings
-from rest_framework.test import APIRequestFactory
-
-from products.models import Category, Offer, Product, ProductImage
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from products.models import (
+    Category, HomeImage, Offer, Product, ProductDeletion, ProductDocument, ProductImage, ProductVariant, StoreSettings,
+)
+from products.changes import PRODUCT_CHANGES_MAX_LIMIT, encode_changes_cursor, touch_category_products
+from products.documents import PRODUCT_DOCUMENT_VERSION, deferred_product_documents
 from products.product_importer import ProductXlsxImporter
-from cotidjango.api_products import CategoriesListView, ProductListView
+from products.forms import ProductAdminForm
+from products.views import ProductViewSet
+from cotidjango.api_common import serialize_product
+from cotidjango.api_products import CategoriesListView, ProductChangesView, ProductDetailView, ProductListView
+from cotidjango import renderers
+from cotidjango import catalog_snapshot
+from cotidjango.catalog_snapshot import deferred_catalog_snapshot, schedule_catalog_snapshot_refresh
+from cotidjango.renderers import FastJSONRenderer
 from users.models import CustomUser
 
 
@@ -64,7 +89,7 @@ class ProductXlsxImporterTests(TestCase):
 
         response = self.importer.export_products_response()
 
-        workbook = openpyxl.load_workbook(BytesIO(response.content), read_only=True)
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
         sheet = workbook.active
         rows = list(sheet.iter_rows(values_only=True))
 
@@ -101,7 +126,7 @@ class ProductXlsxImporterTests(TestCase):
 
                 response = self.importer.export_products_response()
 
-        workbook = openpyxl.load_workbook(BytesIO(response.content), read_only=True)
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
         sheet = workbook.active
         data_rows = list(sheet.iter_rows(min_row=2, values_only=True))
         exported = next(row for row in data_rows if row[0] == "Producto Con Archivo")
@@ -110,6 +135,44 @@ class ProductXlsxImporterTests(TestCase):
         self.assertIn("/media/products/principal.jpg", image_cell)
         self.assertIn("/media/products/gallery/galeria.jpg", image_cell)
 
+    def test_export_products_response_streams_with_constant_queries(self):
+        root = Category.objects.create(nombre="Cotillon")
+        child = Category.objects.create(nombre="Galeras", parent=root)
+        for index in range(3):
+            product = Product.objects.create(
+                user=self.user,
+                categoria=child,
+                nombre=f"Galera {index}",
+                slug=f"galera-{index}",
+                precio="100.00",
+                stock=index,
+                activo=True,
+                image_url=f"https://example.com/galera-{index}.jpg",
+            )
+            ProductImage.objects.create(product=product, image_url=f"https://example.com/extra-{index}.jpg", order=1)
+            Offer.objects.create(
+                nombre=f"Oferta XLSX - Galera {index}",
+                slug=f"xlsx-offer-product-{product.id}",
+                porcentaje="20.00",
+                producto=product,
+                activo=True,
+            )
+
+        # Categorias, productos y un prefetch por tabla (imagenes, variantes, ofertas).
+        with self.assertNumQueries(5):
+            response = self.importer.export_products_response()
+            content = b"".join(response.streaming_content)
+
+        headers_row, *data_rows = list(openpyxl.load_workbook(BytesIO(content), read_only=True).active.iter_rows(values_only=True))
+        column = {header: index for index, header in enumerate(headers_row)}
+        self.assertEqual(len(data_rows), 3)
+        self.assertEqual(data_rows[0][column["Categorías"]], "Cotillon > Galeras")
+        self.assertEqual(data_rows[0][column["Precio oferta"]], "80")
+        self.assertEqual(
+            data_rows[0][column["URL IMAGENES"]],
+            "https://example.com/galera-0.jpg | https://example.com/extra-0.jpg",
+        )
+
     def test_import_upload_updates_exact_product_when_idproduct_is_present(self):
         category = Category.objects.create(nombre="Velas")
         product = Product.objects.create(
@@ -240,6 +303,27 @@ class ProductXlsxImporterTests(TestCase):
         self.assertEqual(product.extra_images.count(), 1)
         self.assertEqual(product.extra_images.first().image_url, "/media/products/gallery/galeria.jpg")
 
+    def test_import_upload_touches_gallery_products_once_at_the_end(self):
+        category = Category.objects.create(nombre="Galerias")
+        upload = self._build_upload(
+            ["Nombre", "Stock", "SKU", "Precio", "Categorias", "Mostrar en tienda", "URL IMAGENES"],
+            [
+                [f"Producto galeria {index}", 1, "", 10, "Galerias", "Si", f"https://cdn.test/{index}-a.jpg | https://cdn.test/{index}-b.jpg"]
+                for index in range(3)
+            ],
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            created, updated, errors = self.importer.import_upload(upload)
+
+        self.assertEqual((created, updated, errors), (3, 0, []))
+        touches = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "products_product" SET "actualizado_en"')
+        ]
+        self.assertEqual(len(touches), 1)
+        self.assertEqual(ProductImage.objects.filter(product__categoria=category).count(), 3)
+
     def test_import_upload_creates_product_offer_when_xlsx_marks_oferta_si(self):
         category = Category.objects.create(nombre="Ofertas")
         product = Product.objects.create(
@@ -384,7 +468,7 @@ class ProductXlsxImporterTests(TestCase):
 
         response = self.importer.export_products_response()
 
-        workbook = openpyxl.load_workbook(BytesIO(response.content), read_only=True)
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
         sheet = workbook.active
         rows = list(sheet.iter_rows(values_only=True))
         exported = rows[1]
@@ -413,7 +497,7 @@ class ProductXlsxImporterTests(TestCase):
 
         response = self.importer.export_products_response()
 
-        workbook = openpyxl.load_workbook(BytesIO(response.content), read_only=True)
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
         sheet = workbook.active
         rows = list(sheet.iter_rows(values_only=True))
         exported = next(row for row in rows[1:] if row[0] == "Producto Exportado Oferta Manual")
@@ -549,6 +633,283 @@ class ProductXlsxImporterTests(TestCase):
         self.assertEqual(survivor.extra_images.count(), 1)
         self.assertEqual(survivor.extra_images.first().image_url, "https://example.com/galera-extra.jpg")
 
+    def test_select_best_duplicate_candidate_scores_all_candidates_in_one_query(self):
+        from orders.models import Order, OrderItem
+
+        category = Category.objects.create(nombre="Cotillon")
+        candidates = [
+            Product.objects.create(
+                user=self.user,
+                categoria=category,
+                nombre="Galera",
+                slug=f"galera-{i}",
+                precio="100.00",
+                stock=1,
+                activo=True,
+            )
+            for i in range(4)
+        ]
+        order = Order.objects.create(user=self.user, total="100.00")
+        OrderItem.objects.create(order=order, product=candidates[1], cantidad=1, precio_unitario="100.00")
+
+        with self.assertNumQueries(1):
+            best = self.importer._select_best_duplicate_candidate(candidates, preferred_category_id=category.id)
+
+        self.assertEqual(best, candidates[1])
+
+    def test_import_upload_merges_same_name_rows_into_first_imported_product(self):
+        category = Category.objects.create(nombre="Cotillon")
+        first = Product.objects.create(
+            user=self.user, categoria=category, nombre="Galera", slug="galera-a", precio="100.00", stock=1, activo=True,
+        )
+        second = Product.objects.create(
+            user=self.user, categoria=category, nombre="Galera", slug="galera-b", precio="100.00", stock=1, activo=True,
+        )
+        upload = self._build_upload(
+            ["Nombre", "Stock", "SKU", "Precio", "Categorias", "Mostrar en tienda", "IDProduct"],
+            [
+                ["Galera", 3, "", 150, "Cotillon", "Si", second.id],
+                ["Galera", 5, "", 160, "Cotillon", "Si", ""],
+            ],
+        )
+
+        created, updated, errors = self.importer.import_upload(upload)
+
+        self.assertEqual(errors, [])
+        self.assertEqual((created, updated), (0, 2))
+        self.assertFalse(Product.objects.filter(pk=first.pk).exists())
+        second.refresh_from_db()
+        self.assertEqual(second.precio, 160)
+        self.assertEqual(second.stock, 5)
+
+    def test_preview_upload_reports_changes_without_writing(self):
+        category = Category.objects.create(nombre="Cotillon")
+        product = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Galera Test",
+            slug="galera-test",
+            precio="100.00",
+            stock=2,
+            activo=True,
+        )
+        untouched = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Producto Fuera Del Archivo",
+            slug="producto-fuera",
+            precio="50.00",
+            stock=1,
+            activo=True,
+        )
+
+        upload = self._build_upload(
+            ["Nombre", "Stock", "SKU", "Precio", "Precio oferta", "Oferta", "Categorias", "Mostrar en tienda", "IDProduct"],
+            [
+                ["Galera Test", 5, "", 120, 90, "Si", "Cotillon", "Si", product.id],
+                ["Producto Nuevo", 3, "", 80, "", "", "Cotillon > Sombreros", "Si", ""],
+            ],
+        )
+
+        report = self.importer.preview_upload(upload)
+        product.refresh_from_db()
+
+        self.assertEqual(report["errors"], [])
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(product.precio, 100)
+        self.assertFalse(Offer.objects.exists())
+        self.assertFalse(Category.objects.filter(nombre="Sombreros").exists())
+
+        self.assertEqual([item["nombre"] for item in report["created"]], ["Producto Nuevo"])
+        self.assertEqual(report["created"][0]["categoria"], "Cotillon > Sombreros")
+        self.assertEqual(report["new_categories"], ["Cotillon > Sombreros"])
+        changes = {change["field"]: (change["before"], change["after"]) for change in report["updated"][0]["changes"]}
+        self.assertEqual(changes["precio"], ("100", "120"))
+        self.assertEqual(changes["stock"], (2, 5))
+        self.assertEqual(report["offers"][0]["action"], "crear")
+        self.assertEqual([item["id"] for item in report["missing"]], [untouched.id])
+
+    def test_preview_upload_plans_same_name_merge(self):
+        category = Category.objects.create(nombre="Cotillon")
+        old_product = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Galera Argentina",
+            slug="galera-argentina-vieja",
+            precio="100.00",
+            stock=0,
+            activo=False,
+        )
+        survivor = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Galera Argentina",
+            slug="galera-argentina-nueva",
+            precio="120.00",
+            stock=4,
+            activo=True,
+        )
+
+        upload = self._build_upload(
+            ["Nombre", "Stock", "SKU", "Precio", "Categorias", "Mostrar en tienda", "IDProduct"],
+            [["Galera Argentina", 9, "", 150, "Cotillon", "Si", survivor.id]],
+        )
+
+        report = self.importer.preview_upload(upload)
+
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(len(report["merges"]), 1)
+        self.assertEqual(report["merges"][0]["survivor"], survivor.id)
+        self.assertEqual(report["merges"][0]["duplicates"], [old_product.id])
+        self.assertEqual(report["missing"], [])
+
+    def test_preview_upload_matches_import_when_rows_update_same_name_duplicates(self):
+        category = Category.objects.create(nombre="Cotillon")
+        first = Product.objects.create(
+            user=self.user, categoria=category, nombre="Globo Prueba Zeta", slug="globo-zeta-a", precio="100.00", stock=1, activo=True,
+        )
+        second = Product.objects.create(
+            user=self.user, categoria=category, nombre="Globo Prueba Zeta", slug="globo-zeta-b", precio="100.00", stock=1, activo=True,
+        )
+        upload = self._build_upload(
+            ["Nombre", "Stock", "SKU", "Precio", "Categorias", "Mostrar en tienda", "IDProduct"],
+            [
+                ["Globo Prueba Zeta", 3, "", 150, "Cotillon", "Si", first.id],
+                ["Globo Prueba Zeta", 5, "", 160, "Cotillon", "Si", second.id],
+            ],
+        )
+
+        report = self.importer.preview_upload(upload)
+        created, updated, errors = self.importer.import_upload(upload)
+
+        self.assertEqual(report["errors"], errors)
+        self.assertEqual((created, updated, errors), (0, 2, []))
+        self.assertEqual(len(report["created"]), created)
+        self.assertEqual(len(report["updated"]) + report["unchanged"], updated)
+        self.assertEqual(
+            [(merge["survivor"], merge["duplicates"]) for merge in report["merges"]],
+            [(first.id, [second.id])],
+        )
+        self.assertEqual(list(Product.objects.values_list("pk", flat=True)), [first.id])
+
+    def test_import_catalog_xlsx_dry_run_does_not_persist_changes(self):
+        CustomUser.objects.create_superuser(username="root", password="secret123", email="root@example.com")
+        category = Category.objects.create(nombre="Velas")
+        product = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Vela Test",
+            slug="vela-test",
+            precio="100.00",
+            stock=5,
+            activo=True,
+        )
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Nombre", "Stock", "SKU", "Precio", "Categorias", "Mostrar en tienda", "IDProduct"])
+        sheet.append(["Vela Test", 7, "", 130, "Velas", "Si", product.id])
+
+        with TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/catalogo.xlsx"
+            workbook.save(path)
+            out = StringIO()
+            call_command("import_catalog_xlsx", path, "--dry-run", stdout=out)
+
+        product.refresh_from_db()
+        self.assertEqual(product.precio, 100)
+        self.assertIn("MODO SIMULACION", out.getvalue())
+        self.assertIn("productos con cambios: 1", out.getvalue())
+        self.assertIn("precio: '100' -> '130'", out.getvalue())
+
+    def test_import_catalog_xlsx_parses_rows_in_process_pool_preserving_order(self):
+        from multiprocessing.pool import Pool
+
+        CustomUser.objects.create_superuser(username="root", password="secret123", email="root@example.com")
+        Category.objects.create(nombre="Velas")
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Nombre", "Stock", "SKU", "Precio", "Categorias", "Mostrar en tienda", "IDProduct"])
+        for i in range(1, 8):
+            sheet.append([f"Vela {i}", i, f"V-{i}", f"{100 + i},50", "Velas", "Si", ""])
+
+        with TemporaryDirectory() as tmpdir, mock.patch(
+            "products.product_importer.PARALLEL_PARSE_MIN_ROWS", 3
+        ), mock.patch("products.product_importer.PARSE_BATCH_SIZE", 2), mock.patch.object(
+            Pool, "apply_async", autospec=True, side_effect=Pool.apply_async
+        ) as apply_async:
+            path = f"{tmpdir}/catalogo.xlsx"
+            workbook.save(path)
+            out = StringIO()
+            call_command("import_catalog_xlsx", path, "--workers", "2", stdout=out)
+
+        self.assertEqual(apply_async.call_count, 4)
+        self.assertIn("Nuevos: 7 | Actualizados: 0", out.getvalue())
+        self.assertEqual(
+            list(Product.objects.order_by("id").values_list("sku", "precio", "stock")),
+            [(f"V-{i}", Decimal(f"{100 + i}.50"), i) for i in range(1, 8)],
+        )
+
+    def test_import_upload_accepts_semicolon_csv(self):
+        category = Category.objects.create(nombre="Velas")
+        product = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Vela Ondulada",
+            slug="vela-ondulada",
+            precio="100.00",
+            stock=5,
+            activo=True,
+        )
+        content = (
+            "\ufeffNombre;Stock;SKU;Precio;Categorías;Mostrar en tienda;IDProduct\n"
+            f"Vela Ondulada;9;;150,50;Velas;Si;{product.id}\n"
+            "Vela Número 1;4;VN-1;80;Velas > Cumpleaños;Si;\n"
+        ).encode("utf-8")
+        upload = SimpleUploadedFile("productos.csv", content, content_type="text/csv")
+
+        created, updated, errors = self.importer.import_upload(upload)
+        product.refresh_from_db()
+
+        self.assertEqual(errors, [])
+        self.assertEqual((created, updated), (1, 1))
+        self.assertEqual(product.precio, Decimal("150.50"))
+        self.assertEqual(product.stock, 9)
+        nuevo = Product.objects.get(sku="VN-1")
+        self.assertEqual(nuevo.nombre, "Vela Número 1")
+        self.assertEqual(nuevo.categoria.nombre, "Cumpleaños")
+        self.assertEqual(nuevo.categoria.parent, category)
+
+    def test_export_products_csv_response_round_trips_through_import(self):
+        category = Category.objects.create(nombre="Velas")
+        product = Product.objects.create(
+            user=self.user,
+            categoria=category,
+            nombre="Vela, Test",
+            slug="vela-test",
+            sku="VT-1",
+            precio="100.00",
+            stock=5,
+            activo=True,
+        )
+
+        response = self.importer.export_products_csv_response()
+        content = b"".join(response.streaming_content)
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertTrue(content.startswith(b"\xef\xbb\xbf"))
+        self.assertIn("\r\nVela, Test;5;No;VT-1;100;", content.decode("utf-8"))
+
+        Product.objects.filter(pk=product.pk).update(precio="1.00", stock=0)
+        upload = SimpleUploadedFile("productos_existentes.csv", content, content_type="text/csv")
+        created, updated, errors = self.importer.import_upload(upload)
+        product.refresh_from_db()
+
+        self.assertEqual(errors, [])
+        self.assertEqual((created, updated), (0, 1))
+        self.assertEqual(product.precio, 100)
+        self.assertEqual(product.stock, 5)
+        self.assertEqual(product.nombre, "Vela, Test")
+
 
 class CategoryValidationTests(TestCase):
     def test_category_cannot_be_its_own_parent(self):
@@ -624,6 +985,28 @@ class SanitizeCategoryMovesCommandTests(TestCase):
         self.assertFalse(Category.objects.filter(pk=self.manualidades_source.pk).exists())
         self.assertIn("estado=applied", out.getvalue())
 
+    def test_sanitize_category_moves_keeps_preview_limit_and_nested_velas_lookup(self):
+        # El origen se busca por nombre del padre, aunque Velas no este en la raiz.
+        self.velas.parent = Category.objects.create(nombre="Decoracion")
+        self.velas.save()
+        for index in range(3):
+            Product.objects.create(
+                user=self.user, categoria=self.child_bengalas, nombre=f"Bengala extra {index}", precio="10.00",
+            )
+        out = StringIO()
+
+        call_command("sanitize_category_moves", "--preview-limit", "2", "--apply", stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("- productos involucrados: 4", output)
+        self.assertIn("  - ... y 2 mas", output)
+        self.assertEqual(Product.objects.filter(categoria=self.root_bengalas).count(), 4)
+        self.assertFalse(Category.objects.filter(pk=self.child_bengalas.pk).exists())
+
+        out = StringIO()
+        call_command("sanitize_category_moves", stdout=out)
+        self.assertIn("ya aplicado o categoria origen inexistente", out.getvalue())
+
 
 class DedupeCategoriesCommandTests(TestCase):
     def setUp(self):
@@ -677,6 +1060,103 @@ class DedupeCategoriesCommandTests(TestCase):
         self.assertIn("estado=applied", out.getvalue())
 
 
+class ApplyCategoryPlanCommandTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="plantester",
+            password="secret123",
+            email="plantester@example.com",
+            approval_status="approved",
+        )
+        self.cotillon = Category.objects.create(nombre="Cotillon")
+        self.cotillon_luz = Category.objects.create(nombre="Luminoso", parent=self.cotillon)
+        self.fiesta = Category.objects.create(nombre="Fiesta")
+        self.fiesta_luz = Category.objects.create(nombre="Luminoso", parent=self.fiesta)
+        self.globos = Category.objects.create(nombre="Globos", parent=self.fiesta)
+        self.product = Product.objects.create(
+            user=self.user,
+            categoria=self.fiesta_luz,
+            nombre="Vincha Luminosa",
+            slug="vincha-luminosa",
+            precio="10.00",
+        )
+        self.globo = Product.objects.create(
+            user=self.user,
+            categoria=self.globos,
+            nombre="Globo",
+            slug="globo-plan",
+            precio="10.00",
+        )
+        self.offer = Offer.objects.create(nombre="Oferta Fiesta", porcentaje="10.00", categoria=self.fiesta, activo=True)
+
+    def _run(self, plan, *args):
+        with TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/plan.json"
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump(plan, fh)
+            out = StringIO()
+            call_command("apply_category_plan", path, *args, stdout=out)
+        return out.getvalue()
+
+    def _plan(self):
+        return {
+            "operations": [
+                {"move": "Fiesta > Globos", "to": "Cotillon", "delete_source_if_empty": True},
+                {"merge": "Fiesta", "into": "Cotillon"},
+                {"rename": "Cotillon", "to": "Cotillon y Fiesta"},
+            ],
+            "dedupe": True,
+        }
+
+    def test_apply_category_plan_simulation_does_not_persist_changes(self):
+        output = self._run(self._plan())
+
+        self.assertIn("MODO SIMULACION", output)
+        self.assertIn("Detalle final por operacion:", output)
+        self.assertIn("Fusionar duplicadas: Luminoso", output)
+        self.assertIn("Categorias a eliminar/eliminadas en total: 3", output)
+        self.assertTrue(Category.objects.filter(pk=self.fiesta.pk).exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.categoria_id, self.fiesta_luz.pk)
+
+    def test_apply_category_plan_applies_moves_merges_renames_and_cascading_dedupe(self):
+        # Una carga + conteos, y UPDATE/DELETE por conjunto sin importar cuantas categorias toca
+        # (incluida la marca de actualizado_en de los productos afectados); solo cada categoria
+        # borrada suma una consulta para marcar los productos que le queden.
+        with self.assertNumQueries(22):
+            output = self._run(self._plan(), "--apply")
+
+        self.assertIn("estado=applied", output)
+        self.assertFalse(Category.objects.filter(pk__in=[self.fiesta.pk, self.fiesta_luz.pk, self.globos.pk]).exists())
+        self.cotillon.refresh_from_db()
+        self.assertEqual(self.cotillon.nombre, "Cotillon y Fiesta")
+        self.product.refresh_from_db()
+        self.globo.refresh_from_db()
+        self.offer.refresh_from_db()
+        self.assertEqual(self.product.categoria_id, self.cotillon_luz.pk)
+        self.assertEqual(self.globo.categoria_id, self.cotillon.pk)
+        self.assertEqual(self.offer.categoria_id, self.cotillon.pk)
+
+    def test_apply_category_plan_moves_chained_products_once_across_update_chunks(self):
+        plan = {
+            "operations": [
+                {"move": "Fiesta > Globos", "to": "Cotillon"},
+                {"move": "Fiesta > Luminoso", "to": "Fiesta > Globos"},
+            ],
+        }
+        with mock.patch("products.category_plan.UPDATE_CASE_CHUNK_SIZE", 1):
+            self._run(plan, "--apply")
+
+        self.product.refresh_from_db()
+        self.globo.refresh_from_db()
+        self.assertEqual(self.product.categoria_id, self.globos.pk)
+        self.assertEqual(self.globo.categoria_id, self.cotillon.pk)
+
+    def test_apply_category_plan_rejects_merge_into_descendant(self):
+        with self.assertRaises(CommandError):
+            self._run({"operations": [{"merge": "Fiesta", "into": "Fiesta > Globos"}]}, "--apply")
+
+
 class AuditCatalogXlsxCommandTests(TestCase):
     def _build_catalog_workbook(self, rows):
         workbook = openpyxl.Workbook()
@@ -744,6 +1224,178 @@ class AuditCatalogXlsxCommandTests(TestCase):
         self.assertIn("IDs duplicados en XLSX: 1", output)
 
 
+class SyncSkusCommandTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="skusync",
+            password="secret123",
+            email="skusync@example.com",
+            approval_status="approved",
+        )
+        category = Category.objects.create(nombre="Velas")
+        self.by_id = Product.objects.create(
+            user=self.user, categoria=category, nombre="Vela Uno", slug="vela-uno", precio="10.00", sku="OLD-1",
+        )
+        self.by_name = Product.objects.create(
+            user=self.user, categoria=category, nombre="Vela Dos", slug="vela-dos", precio="10.00",
+        )
+        for slug in ("globo-a", "globo-b"):
+            Product.objects.create(user=self.user, categoria=category, nombre="Globo", slug=slug, precio="10.00")
+
+    def _run(self, *args):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["IDProduct", "SKU", "Nombre"])
+        sheet.append([self.by_id.id, "V-001", "Otro nombre"])
+        sheet.append(["", 2002, "vela dos"])
+        sheet.append(["", "G-1", "Globo"])
+        sheet.append([99999, "X-1", "No existe"])
+        with TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/skus.xlsx"
+            workbook.save(path)
+            out = StringIO()
+            call_command("sync_skus", path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_sync_skus_simulation_reports_without_persisting(self):
+        output = self._run()
+
+        self.assertIn("MODO SIMULACION", output)
+        self.assertIn("SKU a actualizar: 2", output)
+        self.assertIn("no encontrados en la DB: 1", output)
+        self.assertIn("Nombre ambiguo", output)
+        self.by_id.refresh_from_db()
+        self.assertEqual(self.by_id.sku, "OLD-1")
+
+    def test_sync_skus_apply_updates_matched_products(self):
+        output = self._run("--apply")
+
+        self.assertIn("SKU actualizados: 2", output)
+        self.by_id.refresh_from_db()
+        self.by_name.refresh_from_db()
+        self.assertEqual(self.by_id.sku, "V-001")
+        self.assertEqual(self.by_name.sku, "2002")
+        self.assertFalse(Product.objects.filter(sku="G-1").exists())
+
+
+class NearDuplicatesTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_superuser(
+            username="neardup",
+            password="secret123",
+            email="neardup@example.com",
+        )
+        category = Category.objects.create(nombre="Globos")
+        self.globo = Product.objects.create(
+            user=self.user, categoria=category, nombre="Globo 12 pulgadas rojo", slug="globo-12-rojo", precio="10.00",
+        )
+        self.globos = Product.objects.create(
+            user=self.user, categoria=category, nombre="Globos 12'' Rojo", slug="globos-12-rojo", precio="12.00",
+        )
+        self.other_size = Product.objects.create(
+            user=self.user, categoria=category, nombre="Globo 10'' Rojo", slug="globo-10-rojo", precio="9.00",
+        )
+        self.other_color = Product.objects.create(
+            user=self.user, categoria=category, nombre="Globo 12 pulgadas azul", slug="globo-12-azul", precio="10.00",
+        )
+
+    def test_find_near_duplicates_pairs_only_equivalent_names(self):
+        from products.near_duplicates import find_near_duplicates
+
+        proposals = find_near_duplicates()
+
+        self.assertEqual(len(proposals), 1)
+        members = {proposals[0]["survivor"], *proposals[0]["duplicates"]}
+        self.assertEqual(members, {self.globo.id, self.globos.id})
+        self.assertGreaterEqual(proposals[0]["score"], 0.8)
+
+    def test_different_measurements_are_never_proposed(self):
+        from products.near_duplicates import _Entry, score_pair
+
+        left = _Entry(1, "Globo 10'' rojo", 7, "G-1", "https://cdn.test/globo.jpg", "")
+        right = _Entry(2, "Globo 12'' rojo", 7, "G-1", "https://cdn.test/globo.jpg", "")
+        self.assertEqual(score_pair(left, right), (0.0, ["numeros distintos"]))
+
+    def test_equivalent_names_in_different_categories_reach_the_default_threshold(self):
+        from products.near_duplicates import DEFAULT_MIN_SCORE, _Entry, find_near_duplicates, score_pair
+
+        left = _Entry(1, "Globo 12 pulgadas rojo", 7, "", "", "")
+        right = _Entry(2, "Globos 12'' Rojo", 8, "", "", "")
+
+        score, _reasons = score_pair(left, right, min_score=DEFAULT_MIN_SCORE)
+        self.assertEqual(score, 0.8)
+
+        self.globos.categoria = Category.objects.create(nombre="Cotillon")
+        self.globos.save()
+
+        members = [{proposal["survivor"], *proposal["duplicates"]} for proposal in find_near_duplicates()]
+        self.assertEqual(members, [{self.globo.id, self.globos.id}])
+
+    def test_groups_only_hold_products_that_match_the_anchor(self):
+        from products import near_duplicates
+
+        Product.objects.all().delete()
+        first, second, third = (
+            Product.objects.create(user=self.user, nombre=f"Vela {name}", precio="1.00") for name in ("alfa", "beta", "gama")
+        )
+        scores = {(first.pk, second.pk): 0.95, (second.pk, third.pk): 0.9, (first.pk, third.pk): 0.5}
+
+        def fake_score(left, right, *, min_score=0.0):
+            return scores[tuple(sorted((left.pk, right.pk)))], []
+
+        with mock.patch.object(near_duplicates, "score_pair", side_effect=fake_score):
+            proposals = near_duplicates.find_near_duplicates()
+
+        self.assertEqual(len(proposals), 1)
+        self.assertEqual({proposals[0]["survivor"], *proposals[0]["duplicates"]}, {first.pk, second.pk})
+
+    def test_command_writes_proposals_and_applies_reviewed_file(self):
+        with TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/propuestas.json"
+            out = StringIO()
+            call_command("find_near_duplicates", "--output", path, stdout=out)
+            self.assertIn("MODO SIMULACION", out.getvalue())
+            self.assertIn("propuestas de fusion: 1", out.getvalue())
+            self.assertEqual(Product.objects.count(), 4)
+
+            out = StringIO()
+            call_command("find_near_duplicates", "--proposals", path, "--apply", stdout=out)
+
+        self.assertIn("Productos fusionados: 1", out.getvalue())
+        self.assertEqual(Product.objects.filter(id__in=[self.globo.id, self.globos.id]).count(), 1)
+        self.assertTrue(Product.objects.filter(id=self.other_size.id).exists())
+
+    def test_apply_merge_proposals_refreshes_sales_days_once(self):
+        from orders.models import ProductSales
+        from products.near_duplicates import apply_merge_proposals
+
+        first_day, last_day = date(2024, 5, 1), date(2026, 5, 1)
+        ProductSales.objects.create(fecha=first_day, status="paid", product=self.globos, cantidad=1, revenue=12)
+        ProductSales.objects.create(fecha=last_day, status="paid", product=self.other_color, cantidad=1, revenue=10)
+        proposals = [
+            {"survivor": self.globo.id, "duplicates": [self.globos.id]},
+            {"survivor": self.other_size.id, "duplicates": [self.other_color.id]},
+        ]
+
+        with mock.patch("orders.sales.refresh_sales_rollups") as refresh:
+            self.assertEqual(apply_merge_proposals(proposals), 2)
+
+        refresh.assert_called_once_with({first_day, last_day})
+
+    def test_admin_report_lists_and_merges_proposal(self):
+        self.client.force_login(self.user)
+        url = reverse("admin:products_product_near_duplicates")
+
+        response = self.client.get(f"{url}?refresh=1")
+        self.assertContains(response, "Globos 12&#x27;&#x27; Rojo")
+        self.assertNotContains(response, "Globo 10&#x27;&#x27; Rojo")
+
+        response = self.client.post(url, {"survivor": self.globo.id, "duplicates": [self.globos.id]})
+
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertFalse(Product.objects.filter(id=self.globos.id).exists())
+
+
 class OffersVirtualCategoryApiTests(TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -788,3 +1440,553 @@ class OffersVirtualCategoryApiTests(TestCase):
         self.assertEqual(response.data["items"][0]["name"], "Producto con Oferta")
         self.assertEqual(response.data["items"][0]["priceOriginal"], 100.0)
         self.assertEqual(response.data["items"][0]["price"], 80.0)
+
+
+class ProductVariantTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(
+            username="variantes",
+            password="secret123",
+            email="variantes@example.com",
+            approval_status="approved",
+        )
+        self.product = Product.objects.create(
+            user=self.user,
+            nombre="Globo",
+            slug="globo",
+            precio="4.00",
+            atributos={"Color": ["Rojo", "Azul"], "Talle": ["M"]},
+            atributos_stock={"Color": {"Rojo": 3, "Azul": 7}},
+            atributos_precio={"Color": {"Azul": 4.5}},
+            atributos_sin_stock={"Color": ["Azul"]},
+        )
+
+    def test_attribute_maps_are_stored_as_variants_and_serialized_with_the_same_shape(self):
+        rows = list(ProductVariant.objects.filter(product=self.product).values_list("atributo", "valor", "stock", "disponible"))
+        self.assertEqual(rows, [("Color", "Rojo", 3, True), ("Color", "Azul", 7, False), ("Talle", "M", None, True)])
+
+        request = self.factory.get("/api/products", {"q": "Globo"})
+        with CaptureQueriesContext(connection) as queries:
+            response = ProductListView.as_view()(request)
+        self.assertEqual(sum("products_productvariant" in query["sql"] for query in queries.captured_queries), 1)
+        item = response.data["items"][0]
+        self.assertEqual(item["attributes"], {"Color": ["Rojo", "Azul"], "Talle": ["M"]})
+        self.assertEqual(item["attributes_stock"], {"Color": {"Rojo": 3, "Azul": 7}})
+        self.assertEqual(item["attributes_price"], {"Color": {"Azul": 4.5}})
+        self.assertEqual(item["atributos_sin_stock"], {"Color": ["Azul"]})
+
+    def test_rewriting_a_map_only_touches_changed_variants(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        stock_map = stale.atributos_stock
+        # Otro proceso descuenta Rojo mientras tanto.
+        ProductVariant.objects.filter(product=self.product, valor="Rojo").update(stock=1)
+
+        stock_map["Color"]["Azul"] = 9
+        stale.atributos_stock = stock_map
+        stale.atributos = {"Color": ["Rojo", "Azul"]}
+        stale.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.atributos_stock, {"Color": {"Rojo": 1, "Azul": 9}})
+        self.assertFalse(ProductVariant.objects.filter(product=self.product, atributo="Talle").exists())
+
+    def test_product_api_writes_attribute_maps_and_rejects_invalid_ones(self):
+        view = ProductViewSet.as_view({"patch": "partial_update"})
+        request = self.factory.patch(
+            f"/api/products/{self.product.pk}/",
+            {"atributos": {"Color": ["Rojo", "Verde"]}, "atributos_stock": {"Color": {"Verde": 4}}},
+            format="json",
+        )
+        force_authenticate(request, user=self.user)
+        response = view(request, pk=self.product.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["atributos"], {"Color": ["Rojo", "Verde"]})
+        self.assertEqual(response.data["atributos_stock"], {"Color": {"Verde": 4}})
+        self.assertEqual(
+            list(ProductVariant.objects.filter(product=self.product).values_list("valor", "stock")),
+            [("Rojo", None), ("Verde", 4)],
+        )
+
+        for payload in ({"atributos": ["Rojo"]}, {"atributos_stock": {"Color": {"Rojo": "muchos"}}}):
+            request = self.factory.patch(f"/api/products/{self.product.pk}/", payload, format="json")
+            force_authenticate(request, user=self.user)
+            response = view(request, pk=self.product.pk)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(ProductVariant.objects.filter(product=self.product).count(), 2)
+
+    def test_admin_form_rejects_invalid_variant_stock_or_price(self):
+        base = {"user": self.user.pk, "nombre": "Globo", "slug": "globo", "precio": "4.00", "stock": 0}
+        for name, value in (("atributos_stock", {"Color": {"Rojo": "3.5"}}), ("atributos_precio", {"Color": {"Rojo": "abc"}})):
+            form = ProductAdminForm(data={**base, name: json.dumps(value)}, instance=self.product)
+            self.assertFalse(form.is_valid())
+            self.assertEqual(form.errors["atributos_stock"], ["Stock o precio de variante invalido."])
+
+        form = ProductAdminForm(data={**base, "atributos_stock": json.dumps({"Color": {"Rojo": 5}})}, instance=self.product)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(ProductVariant.objects.get(product=self.product, valor="Rojo").stock, 5)
+
+    def test_saving_unchanged_maps_skips_variant_writes_and_savepoint(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.atributos = dict(product.atributos)
+        product.atributos_stock = {"Color": {"Rojo": 3, "Azul": 7}}
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        sql = [query["sql"] for query in queries.captured_queries]
+        self.assertFalse(any("products_productvariant" in statement for statement in sql))
+        self.assertFalse(any(statement.startswith("SAVEPOINT") for statement in sql))
+
+
+class AttributeFacetTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(
+            username="facetas",
+            password="secret123",
+            email="facetas@example.com",
+            approval_status="approved",
+        )
+        self.category = Category.objects.create(nombre="Globos", slug="globos")
+        for nombre, colores, talles in (
+            ("Globo liso", ["Rojo", "Azul"], ["M"]),
+            ("Globo perlado", ["Rojo"], ["L"]),
+            ("Globo metalizado", ["Azul", "Dorado"], ["M"]),
+        ):
+            Product.objects.create(
+                user=self.user,
+                categoria=self.category,
+                nombre=nombre,
+                precio="5.00",
+                atributos={"Color": colores, "Talle": talles},
+                atributos_sin_stock={"Color": ["Dorado"]},
+            )
+
+    def _list(self, params):
+        request = self.factory.get("/api/products", {"category": "globos", **params})
+        return ProductListView.as_view()(request).data
+
+    def test_attribute_filters_combine_values_and_attributes(self):
+        data = self._list({"attr[Color]": "Rojo"})
+        self.assertEqual(sorted(item["name"] for item in data["items"]), ["Globo liso", "Globo perlado"])
+
+        data = self._list({"attr[Color]": "Rojo,Azul", "attr[Talle]": "M"})
+        self.assertEqual(sorted(item["name"] for item in data["items"]), ["Globo liso", "Globo metalizado"])
+
+        # Los valores marcados sin stock no cuentan para el filtro.
+        self.assertEqual(self._list({"attr[Color]": "Dorado"})["total"], 0)
+
+    def test_facets_ignore_the_attribute_own_filter(self):
+        data = self._list({"attr[Color]": "Rojo", "facets": "1"})
+
+        facets = {facet["name"]: facet["values"] for facet in data["facets"]}
+        self.assertEqual(facets["Color"], [{"value": "Azul", "count": 2}, {"value": "Rojo", "count": 2}])
+        self.assertEqual(facets["Talle"], [{"value": "L", "count": 1}, {"value": "M", "count": 1}])
+        self.assertNotIn("facets", self._list({}))
+
+
+@override_settings(PRODUCT_CHANGES_SAFETY_SECONDS=0)
+class ProductChangesApiTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(
+            username="cambios",
+            password="secret123",
+            email="cambios@example.com",
+            approval_status="approved",
+        )
+        self.category = Category.objects.create(nombre="Velas", slug="velas")
+        self.first = Product.objects.create(user=self.user, categoria=self.category, nombre="Vela 1", precio="10.00")
+        self.second = Product.objects.create(user=self.user, nombre="Vela 2", precio="12.00")
+
+    def _changes(self, since="", limit=10):
+        request = self.factory.get("/api/products/changes", {"since": since, "limit": limit})
+        return ProductChangesView.as_view()(request).data
+
+    def test_changes_are_paginated_with_a_cursor_and_include_deletions(self):
+        page = self._changes(limit=1)
+        self.assertEqual((page["changed"], page["hasMore"]), ([self.first.pk], True))
+        page = self._changes(page["next"], limit=1)
+        self.assertEqual((page["changed"], page["hasMore"]), ([self.second.pk], False))
+        cursor = page["next"]
+        self.assertEqual(self._changes(cursor)["changed"], [])
+
+        Offer.objects.create(nombre="Promo velas", porcentaje="10.00", categoria=self.category)
+        second_pk = self.second.pk
+        self.second.delete()
+
+        page = self._changes(cursor)
+        self.assertEqual((page["changed"], page["deleted"]), ([self.first.pk], [second_pk]))
+        self.assertEqual(self._changes(page["next"]), {"changed": [], "deleted": [], "next": page["next"], "hasMore": False})
+
+    def test_invalid_or_oversized_limit(self):
+        response = ProductChangesView.as_view()(self.factory.get("/api/products/changes", {"limit": "muchos"}))
+        self.assertEqual((response.status_code, response.data["error"]), (400, "Parametro limit invalido"))
+
+        with mock.patch("cotidjango.api_products.product_changes", return_value={}) as changes:
+            self._changes(limit=10**9)
+        changes.assert_called_once_with("", limit=PRODUCT_CHANGES_MAX_LIMIT)
+
+    def test_bulk_updates_and_category_renames_touch_products(self):
+        cursor = self._changes()["next"]
+
+        self.category.nombre = "Velas y bengalas"
+        self.category.save()
+
+        self.assertEqual(self._changes(cursor)["changed"], [self.first.pk])
+        self.first.refresh_from_db()
+        self.assertEqual(
+            ProductListView.as_view()(self.factory.get("/api/products", {"q": "Vela 1"})).data["items"][0]["updatedAt"],
+            self.first.actualizado_en.isoformat(),
+        )
+
+    def test_saving_a_category_without_path_changes_does_not_touch_products(self):
+        cursor = self._changes()["next"]
+
+        self.category.descripcion = "Velas de todo tipo"
+        self.category.save()
+        Category.objects.get(pk=self.category.pk).save()
+        self.assertEqual(self._changes(cursor)["changed"], [])
+
+        category = Category.objects.get(pk=self.category.pk)
+        category.slug = "velas-y-mas"
+        category.save()
+        self.assertEqual(self._changes(cursor)["changed"], [self.first.pk])
+
+    def test_category_touch_walks_only_the_subtree(self):
+        child = Category.objects.create(nombre="Velas chicas", parent=self.category)
+        grandchild = Category.objects.create(nombre="Velas de cumple", parent=child)
+        Category.objects.create(nombre="Globos", slug="globos")
+        Product.objects.filter(pk=self.second.pk).update(categoria=grandchild)
+        cursor = self._changes()["next"]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(touch_category_products([self.category.pk]), 2)
+        category_queries = [query["sql"] for query in queries.captured_queries if '"products_category"' in query["sql"]]
+        # Un nivel por consulta y nunca la tabla entera.
+        self.assertEqual(len(category_queries), 3)
+        self.assertTrue(all("WHERE" in sql for sql in category_queries))
+        self.assertEqual(self._changes(cursor)["changed"], [self.first.pk, self.second.pk])
+
+    @override_settings(PRODUCT_CHANGES_SAFETY_SECONDS=60)
+    def test_recent_changes_wait_for_the_safety_window(self):
+        self.assertEqual(self._changes(), {"changed": [], "deleted": [], "next": "", "hasMore": False})
+
+        Product.objects.filter(pk=self.first.pk).update(actualizado_en=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(self._changes()["changed"], [self.first.pk])
+
+    def test_deletions_at_the_cursor_time_are_compared_by_id(self):
+        moment = timezone.now() - timedelta(minutes=1)
+        ProductDeletion.objects.create(product_id=900, eliminado_en=moment)
+        ProductDeletion.objects.create(product_id=50, eliminado_en=moment)
+
+        self.assertEqual(self._changes(encode_changes_cursor(moment, 100))["deleted"], [900])
+        self.assertEqual(self._changes(encode_changes_cursor(moment, 900))["deleted"], [])
+
+    def test_changes_route_accepts_a_trailing_slash(self):
+        for path in ("/api/products/changes", "/api/products/changes/"):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["changed"], [self.first.pk, self.second.pk])
+
+    def test_invalid_cursor_is_rejected(self):
+        request = self.factory.get("/api/products/changes", {"since": "no-es-un-cursor"})
+        self.assertEqual(ProductChangesView.as_view()(request).status_code, 400)
+
+
+
+class ProductDocumentTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(
+            username="documentos",
+            password="secret123",
+            email="documentos@example.com",
+            approval_status="approved",
+        )
+        self.parent = Category.objects.create(nombre="Cotillon", slug="cotillon")
+        self.category = Category.objects.create(nombre="Globos", slug="globos", parent=self.parent)
+        self.product = Product.objects.create(user=self.user, categoria=self.category, nombre="Globo", precio="100.00")
+        ProductImage.objects.create(product=self.product, image_url="https://example.com/globo-2.jpg", order=1)
+
+    def _detail(self):
+        request = self.factory.get(f"/api/products/{self.product.pk}")
+        return ProductDetailView.as_view()(request, pk=self.product.pk).data
+
+    def test_detail_and_listing_match_serialize_product_and_reuse_the_stored_document(self):
+        request = self.factory.get(f"/api/products/{self.product.pk}")
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(self._detail(), serialize_product(product, request))
+        self.assertEqual(ProductDocument.objects.get(pk=self.product.pk).version, PRODUCT_DOCUMENT_VERSION)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self._detail()
+        self.assertEqual(data, serialize_product(product, request))
+        self.assertEqual(len(queries), 1)
+
+        listing = ProductListView.as_view()(self.factory.get("/api/products", {"q": "Globo"})).data
+        self.assertEqual(listing["items"], [serialize_product(product, request)])
+
+    def test_documents_follow_image_offer_and_category_changes(self):
+        self._detail()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image_url="https://example.com/globo-3.jpg", order=2)
+            Offer.objects.create(nombre="Promo", porcentaje="10.00", categoria=self.parent)
+            self.parent.nombre = "Fiesta"
+            self.parent.save()
+
+        document = ProductDocument.objects.get(pk=self.product.pk).data
+        self.assertIn("https://example.com/globo-3.jpg", document["images"])
+        self.assertEqual((document["price"], document["discount"]["percent"]), (90.0, 10.0))
+        self.assertEqual(document["category"]["path"], ["Fiesta", "Globos"])
+
+        Product.objects.filter(pk=self.product.pk).update(precio="200.00", actualizado_en=timezone.now())
+        self.assertEqual(self._detail()["price"], 180.0)
+
+    def test_timed_offer_expires_the_document(self):
+        now = timezone.now()
+        Offer.objects.create(
+            nombre="Flash",
+            porcentaje="50.00",
+            categoria=self.category,
+            termina=now + timezone.timedelta(hours=1),
+        )
+        self.assertEqual(self._detail()["price"], 50.0)
+        self.assertEqual(ProductDocument.objects.get(pk=self.product.pk).valido_hasta, now + timezone.timedelta(hours=1))
+
+        with mock.patch("django.utils.timezone.now", return_value=now + timezone.timedelta(hours=2)):
+            data = self._detail()
+        self.assertEqual((data["price"], data["discount"]), (100.0, None))
+
+    def test_bulk_changes_refresh_documents_once(self):
+        other = Product.objects.create(user=self.user, nombre="Vela", precio="5.00")
+
+        with mock.patch("products.documents.refresh_product_documents") as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with deferred_product_documents():
+                    self.product.save()
+                    other.save()
+                    touch_category_products([self.category.pk])
+
+        refresh.assert_called_once_with({self.product.pk, other.pk})
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="snapshot",
+            password="secret123",
+            email="snapshot@example.com",
+            approval_status="approved",
+        )
+        self.root = Category.objects.create(nombre="Cotillon", slug="cotillon")
+        self.child = Category.objects.create(nombre="Vinchas", slug="vinchas", parent=self.root)
+        for index in range(25):
+            Product.objects.create(
+                user=self.user,
+                categoria=self.child if index % 2 else self.root,
+                nombre=f"Vincha {index}",
+                precio="100.00",
+            )
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.settings_override = override_settings(CATALOG_SNAPSHOT_ROOT=Path(self.tmpdir.name) / "catalog_snapshot")
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_command_writes_same_pages_as_the_api_and_whitenoise_serves_them(self):
+        out = StringIO()
+        call_command("build_catalog_snapshot", "--pages", "1", stdout=out)
+        self.assertIn("Snapshot del catalogo publicado", out.getvalue())
+
+        manifest = self.client.get("/catalog-snapshot/manifest.json")
+        self.assertEqual(manifest.status_code, 200)
+        self.assertEqual(manifest["Content-Type"], "application/json")
+        categories = json.loads(b"".join(manifest.streaming_content))["categories"]
+        self.assertEqual(categories["cotillon"], {"total": 25, "pages": 2, "snapshotPages": 1})
+        self.assertEqual(categories["cotillon/vinchas"], {"total": 12, "pages": 1, "snapshotPages": 1})
+        self.assertIn("ofertas", categories)
+
+        response = self.client.get("/catalog-snapshot/products/cotillon/vinchas/1.json", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        live = self.client.get("/api/products", {"category": "cotillon/vinchas", "page": 1, "limit": 20}).json()
+        snapshot = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(snapshot, live)
+        # Mas alla de --pages el frontend vuelve a la API.
+        self.assertEqual(self.client.get("/catalog-snapshot/products/cotillon/2.json").status_code, 404)
+
+    def test_refresh_is_scheduled_only_after_first_build(self):
+        with mock.patch("cotidjango.catalog_snapshot._start_catalog_snapshot_refresh") as start:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertFalse(schedule_catalog_snapshot_refresh())
+            call_command("build_catalog_snapshot", "--pages", "1", stdout=StringIO())
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(schedule_catalog_snapshot_refresh())
+        start.assert_called_once_with()
+
+    def test_only_imports_refresh_snapshot_not_single_admin_edits(self):
+        call_command("build_catalog_snapshot", "--pages", "1", stdout=StringIO())
+        product = Product.objects.filter(categoria=self.child).first()
+        with mock.patch("cotidjango.catalog_snapshot._start_catalog_snapshot_refresh") as start:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.precio = Decimal("150.00")
+                product.save()
+                Offer.objects.create(nombre="Promo", slug="promo", porcentaje="10.00", categoria=self.root, activo=True)
+                touch_category_products([self.root.pk])
+        start.assert_not_called()
+
+        upload = SimpleUploadedFile(
+            "productos.csv", f"Nombre;SKU;Precio;IDProduct\n{product.nombre};;175;{product.pk}\n".encode("utf-8")
+        )
+        importer = ProductXlsxImporter(request_user=self.user, template_xlsx_path="")
+        with mock.patch.object(catalog_snapshot, "build_catalog_snapshot", return_value=({}, 7)) as build:
+            with deferred_catalog_snapshot(wait=True) as snapshot:
+                self.assertEqual(importer.import_upload(upload), (0, 1, []))
+        build.assert_called_once_with()
+        self.assertEqual(snapshot.files, 7)
+
+    def test_build_waiting_on_the_lock_skips_when_another_worker_already_built(self):
+        requested_at = timezone.now()
+        call_command("build_catalog_snapshot", "--pages", "1", stdout=StringIO())
+        version = json.loads(b"".join(self.client.get("/catalog-snapshot/manifest.json").streaming_content))["version"]
+
+        self.assertEqual(catalog_snapshot.build_catalog_snapshot(unless_built_since=requested_at), (None, 0))
+        manifest, _files = catalog_snapshot.build_catalog_snapshot(unless_built_since=timezone.now())
+        self.assertNotEqual(manifest["version"], version)
+
+    def test_snapshot_stops_being_served_once_an_offer_ends(self):
+        termina = timezone.now() + timedelta(hours=2)
+        Offer.objects.create(
+            nombre="Promo", slug="promo", porcentaje="10.00", categoria=self.root, activo=True, termina=termina
+        )
+        call_command("build_catalog_snapshot", "--pages", "1", stdout=StringIO())
+
+        manifest = self.client.get("/catalog-snapshot/manifest.json")
+        valid_until = json.loads(b"".join(manifest.streaming_content))["validUntil"]
+        self.assertEqual(datetime.fromisoformat(valid_until), termina)
+
+        later = termina + timedelta(seconds=1)
+        with (
+            mock.patch("cotidjango.middleware.timezone.now", return_value=later),
+            mock.patch("cotidjango.catalog_snapshot._start_catalog_snapshot_refresh") as start,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.assertEqual(self.client.get("/catalog-snapshot/offers.json").status_code, 404)
+            self.assertEqual(self.client.get("/catalog-snapshot/manifest.json").status_code, 404)
+        start.assert_called_once_with()
+
+    def test_republishing_swaps_a_link_and_keeps_the_previous_version(self):
+        snapshot_root = Path(self.tmpdir.name) / "catalog_snapshot"
+        for _ in range(3):
+            call_command("build_catalog_snapshot", "--pages", "1", stdout=StringIO())
+
+        self.assertTrue(snapshot_root.is_symlink())
+        versions = sorted(Path(self.tmpdir.name).glob("catalog_snapshot.v-*"))
+        self.assertEqual(len(versions), 2)
+        self.assertTrue(all((version / "manifest.json").is_file() for version in versions))
+        self.assertEqual(self.client.get("/catalog-snapshot/manifest.json").status_code, 200)
+
+    def test_refresh_requested_during_a_build_builds_again(self):
+        cache.delete_many([catalog_snapshot.CATALOG_SNAPSHOT_LOCK_KEY, catalog_snapshot.CATALOG_SNAPSHOT_DIRTY_KEY])
+        builds = []
+
+        def build(**kwargs):
+            builds.append(len(builds))
+            if len(builds) == 1:
+                # Otra importacion se confirma mientras se arma el primer snapshot.
+                catalog_snapshot._start_catalog_snapshot_refresh()
+
+        def inline_thread(target, daemon):
+            return mock.Mock(start=target)
+
+        with (
+            mock.patch.object(catalog_snapshot, "CATALOG_SNAPSHOT_DEBOUNCE_SECONDS", 0),
+            mock.patch.object(catalog_snapshot, "build_catalog_snapshot", side_effect=build),
+            mock.patch.object(catalog_snapshot.threading, "Thread", side_effect=inline_thread) as thread,
+            mock.patch.object(catalog_snapshot, "connection"),
+        ):
+            catalog_snapshot._start_catalog_snapshot_refresh()
+
+        self.assertEqual(builds, [0, 1])
+        thread.assert_called_once()
+        self.assertIsNone(cache.get(catalog_snapshot.CATALOG_SNAPSHOT_LOCK_KEY))
+
+
+class BootstrapApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = CustomUser.objects.create_user(
+            username="arranque",
+            password="secret123",
+            email="arranque@example.com",
+            approval_status="approved",
+        )
+        StoreSettings.objects.update_or_create(pk=1, defaults={"min_order_amount": 5000})
+        Category.objects.create(nombre="Globos", slug="globos")
+        HomeImage.objects.create(key="hero-1", section="hero", image_url="https://cdn.example.com/hero.jpg")
+
+    def test_bootstrap_combines_startup_payloads_and_revalidates_with_etag(self):
+        response = self.client.get("/api/bootstrap")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["storeConfig"], self.client.get("/api/store-config").json())
+        self.assertEqual(data["homeImages"], self.client.get("/api/home-images").json())
+        self.assertEqual(data["categories"], self.client.get("/api/categories-list").json())
+        self.assertEqual(data["offers"], self.client.get("/api/offers").json())
+        self.assertIsNone(data["user"])
+
+        # La parte publica sale del cache y sin cambios el frontend recibe un 304 vacio.
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/bootstrap", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], response["ETag"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HomeImage.objects.create(key="hero-2", section="hero", image_url="https://cdn.example.com/hero-2.jpg")
+        changed = self.client.get("/api/bootstrap", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()["homeImages"]["items"]), 2)
+
+    def test_bootstrap_includes_the_logged_in_user_in_the_etag(self):
+        anonymous = self.client.get("/api/bootstrap")
+        self.client.force_login(self.user)
+
+        response = self.client.get("/api/bootstrap", HTTP_IF_NONE_MATCH=anonymous["ETag"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"], self.client.get("/api/auth/me").json()["user"])
+        self.assertIn("Cookie", response["Vary"])
+
+
+class FastJSONRendererTests(TestCase):
+    def _payload(self):
+        return {
+            "price": Decimal("1234.50"),
+            "createdAt": datetime(2026, 3, 1, 12, 30, 0, 123456, tzinfo=dt_timezone.utc),
+            "localAt": timezone.localtime(datetime(2026, 3, 1, 15, 0, tzinfo=dt_timezone.utc)),
+            "day": date(2026, 3, 1),
+            "label": gettext_lazy("Productos"),
+            "token": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+            "byId": {1: "uno", 2: "dos"},
+            "tags": ("a", "b"),
+            "text": "linea\u2028separada ñandú",
+            "items": [{"qty": 2, "ok": True, "none": None, "ratio": 0.25}],
+        }
+
+    def test_output_matches_drf_json_renderer(self):
+        expected = JSONRenderer().render(self._payload())
+
+        self.assertEqual(FastJSONRenderer().render(self._payload()), expected)
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(FastJSONRenderer().render(self._payload()), expected)
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_api_views_use_fast_renderer_by_default(self):
+        StoreSettings.objects.update_or_create(pk=1, defaults={"min_order_amount": Decimal("2500.00")})
+
+        response = self.client.get("/api/store-config")
+
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.content, b'{"minOrderAmount":2500.0,"showPricesToGuests":true}')
@@ -9,8 +9,15 @@ from django.urls import path, reverse
 from rest_framework.authtoken.models import Token, TokenProxy
 
 from .forms import AdminCustomUserCreationForm
-from .models import CustomUser, GlobalStoreSettings
-from .user_importer import USER_IMPORT_HEADERS, USER_SAMPLE_ROWS, UserXlsxImporter
+from .models import CustomUser, GlobalStoreSettings, UserImportJob
+from .user_importer import (
+    USER_IMPORT_HEADERS,
+    USER_SAMPLE_ROWS,
+    UserXlsxImporter,
+    create_user_import_job,
+    fail_stale_user_import_jobs,
+    start_user_import_job,
+)
 
 
 for model in (Token, TokenProxy, Group):
@@ -80,6 +87,7 @@ class CustomUserAdmin(UserAdmin):
 
     def import_xlsx_view(self, request):
         importer = UserXlsxImporter(template_xlsx_path=self.template_xlsx_path)
+        import_url = reverse("admin:users_customuser_import_xlsx")
 
         if request.method == "GET" and request.GET.get("sample"):
             return importer.export_workbook(USER_SAMPLE_ROWS, "clientes_ejemplo.xlsx")
@@ -87,42 +95,33 @@ class CustomUserAdmin(UserAdmin):
         if request.method == "GET" and request.GET.get("template"):
             return importer.export_template_response()
 
-        created = 0
-        updated = 0
-        errors = []
-
         if request.method == "POST":
             upload = request.FILES.get("file")
             if not upload:
                 messages.error(request, "Selecciona un archivo XLSX.")
-                return redirect(reverse("admin:users_customuser_import_xlsx"))
-            try:
-                created, updated, errors = importer.import_upload(upload)
-                if created or updated:
-                    messages.success(
-                        request,
-                        f"Importacion completada. Nuevos: {created} | Actualizados: {updated}",
-                    )
-                for err in errors:
-                    messages.error(request, err)
-            except Exception as exc:  # pragma: no cover
-                messages.error(request, f"No se pudo procesar el XLSX: {exc}")
-                return redirect(reverse("admin:users_customuser_import_xlsx"))
+                return redirect(import_url)
+            job = create_user_import_job(upload, user=request.user)
+            start_user_import_job(job.pk)
+            messages.info(request, "Importacion en curso. Esta pantalla se actualiza sola hasta terminar.")
+            return redirect(f"{import_url}?job={job.pk}")
+
+        fail_stale_user_import_jobs()
+        job = None
+        job_id = str(request.GET.get("job") or "").strip()
+        if job_id.isdigit():
+            job = UserImportJob.objects.filter(pk=int(job_id)).first()
 
         context = {
             **self.admin_site.each_context(request),
             "opts": self.model._meta,
             "title": "Importar clientes via XLSX",
             "headers": USER_IMPORT_HEADERS,
-            "example_url": f"{reverse('admin:users_customuser_import_xlsx')}?sample=1",
-            "template_url": f"{reverse('admin:users_customuser_import_xlsx')}?template=1",
-            "created": created,
-            "updated": updated,
-            "errors": errors,
+            "example_url": f"{import_url}?sample=1",
+            "template_url": f"{import_url}?template=1",
+            "job": job,
+            "recent_jobs": UserImportJob.objects.all()[:5],
         }
-        return TemplateResponse(request, "admin/users_import.html", context)
-
-
+        return TemplateResponse(request, "admin/users/customuser/import_xlsx.html", context)
 
     @admin.action(description="Aprobar usuarios seleccionados")
     def approve_users(self, request, queryset):
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_globalstoresettings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'En cola'), ('running', 'Procesando'), ('done', 'Terminada'), ('failed', 'Fallida')], default='pending', max_length=10, verbose_name='estado')),
+                ('filename', models.CharField(blank=True, default='', max_length=255, verbose_name='archivo')),
+                ('source_path', models.CharField(blank=True, default='', max_length=500, verbose_name='ruta temporal')),
+                ('total_rows', models.PositiveIntegerField(default=0, verbose_name='filas')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='filas procesadas')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='nuevos')),
+                ('updated', models.PositiveIntegerField(default=0, verbose_name='actualizados')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='errores')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creada el')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='terminada el')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='user_import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='iniciada por')),
+            ],
+            options={
+                'verbose_name': 'Importacion de clientes',
+                'verbose_name_plural': 'Importaciones de clientes',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
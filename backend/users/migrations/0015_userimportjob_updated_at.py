@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_userimportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimportjob',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='ultima actividad'),
+        ),
+    ]
@@ -107,6 +107,55 @@ class PasswordResetToken(models.Model):
     def is_active(self):
         return self.used_at is None and self.expires_at > timezone.now()
 
+class UserImportJob(models.Model):
+    STATUS_CHOICES = (
+        ("pending", "En cola"),
+        ("running", "Procesando"),
+        ("done", "Terminada"),
+        ("failed", "Fallida"),
+    )
+    status = models.CharField("estado", max_length=10, choices=STATUS_CHOICES, default="pending")
+    filename = models.CharField("archivo", max_length=255, blank=True, default="")
+    source_path = models.CharField("ruta temporal", max_length=500, blank=True, default="")
+    total_rows = models.PositiveIntegerField("filas", default=0)
+    processed_rows = models.PositiveIntegerField("filas procesadas", default=0)
+    created = models.PositiveIntegerField("nuevos", default=0)
+    updated = models.PositiveIntegerField("actualizados", default=0)
+    errors = models.JSONField("errores", default=list, blank=True)
+    created_by = models.ForeignKey(
+        CustomUser,
+        verbose_name="iniciada por",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="user_import_jobs",
+    )
+    created_at = models.DateTimeField("creada el", auto_now_add=True)
+    # Latido del hilo: se renueva en cada tanda; sin latido reciente el job se da por muerto.
+    updated_at = models.DateTimeField("ultima actividad", default=timezone.now)
+    finished_at = models.DateTimeField("terminada el", null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Importacion de clientes"
+        verbose_name_plural = "Importaciones de clientes"
+
+    @property
+    def is_finished(self):
+        return self.status in {"done", "failed"}
+
+    @property
+    def progress_percent(self):
+        if self.is_finished:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
+
+    def __str__(self) -> str:
+        return f"Importacion {self.pk} ({self.get_status_display()})"
+
+
 class GlobalStoreSettings(StoreSettings):
     class Meta:
         proxy = True
@@ -1,3 +1,182 @@
-from django.test import TestCase
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import CustomUser, UserImportJob
+from users.user_importer import (
+    UserXlsxImporter, create_user_import_job, fail_stale_user_import_jobs, run_user_import_job,
+)
+
+
+def build_users_upload(rows, headers=("nombre", "apellido", "email", "password", "approval_status")):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(list(headers))
+    for row in rows:
+        sheet.append(list(row))
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return SimpleUploadedFile(
+        "clientes.xlsx",
+        buffer.getvalue(),
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+class UserXlsxImporterTests(TestCase):
+    def test_import_upload_creates_and_updates_users_in_bulk(self):
+        existing = CustomUser.objects.create_user(
+            username="ana@example.com",
+            email="Ana@Example.com",
+            password="vieja123",
+            approval_status="pending",
+        )
+        upload = build_users_upload([
+            ["Ana", "Perez", "ana@example.com", "", "aprobado"],
+            ["Luis", "Gomez", "luis@example.com", "Clave123!", "approved"],
+            ["Luis", "Gomez", "LUIS@example.com", "Otra123!", "approved"],
+            ["Sin", "Mail", "", "", ""],
+            ["Eva", "Diaz", "eva@example.com", "", "quizas"],
+        ])
+        progress = mock.Mock()
+
+        created, updated, errors = UserXlsxImporter().import_upload(upload, progress=progress)
+
+        self.assertEqual((created, updated), (1, 2))
+        self.assertEqual(errors, [
+            "Fila 5: nombre, apellido y email son obligatorios.",
+            "Fila 6: estado de aprobacion invalido.",
+        ])
+        progress.assert_called_with(5, 5)
+        existing.refresh_from_db()
+        self.assertEqual(existing.email, "ana@example.com")
+        self.assertEqual(existing.name, "Ana Perez")
+        self.assertTrue(existing.is_active)
+        self.assertTrue(existing.check_password("vieja123"))
+        luis = CustomUser.objects.get(email="luis@example.com")
+        self.assertEqual(luis.username, "luis@example.com")
+        self.assertFalse(luis.check_password("Clave123!"))
+        self.assertTrue(luis.check_password("Otra123!"))
+        self.assertFalse(CustomUser.objects.filter(email="eva@example.com").exists())
+
+    @override_settings(USER_IMPORT_HASH_WORKERS=2)
+    def test_import_upload_hashes_passwords_in_thread_pool(self):
+        upload = build_users_upload([
+            [f"Cliente{i}", "Mayorista", f"cliente{i}@example.com", f"Clave{i}!", "approved"]
+            for i in range(3)
+        ])
+
+        with mock.patch("users.user_importer.USER_IMPORT_PARALLEL_HASH_MIN", 2), mock.patch(
+            "users.user_importer.ThreadPoolExecutor",
+            wraps=ThreadPoolExecutor,
+        ) as pool:
+            created, updated, errors = UserXlsxImporter().import_upload(upload)
+
+        self.assertTrue(pool.called)
+        self.assertEqual((created, updated, errors), (3, 0, []))
+        for i in range(3):
+            user = CustomUser.objects.get(email=f"cliente{i}@example.com")
+            self.assertTrue(user.check_password(f"Clave{i}!"))
+
+
+class UserImportJobAdminTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            password="secret123",
+        )
+        self.client.force_login(self.admin)
+
+    def test_import_runs_as_background_job_with_progress(self):
+        url = reverse("admin:users_customuser_import_xlsx")
+        upload = build_users_upload([["Ana", "Perez", "ana@example.com", "", "approved"]])
+
+        # El hilo se lanza en on_commit; aca se captura sin ejecutarlo y el job corre inline.
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url, {"file": upload})
+
+        job = UserImportJob.objects.get()
+        self.assertRedirects(response, f"{url}?job={job.pk}", fetch_redirect_response=False)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(job.status, "pending")
+
+        run_user_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.created, job.updated, job.processed_rows, job.total_rows), (1, 0, 1, 1))
+        self.assertEqual(job.source_path, "")
+        self.assertTrue(CustomUser.objects.filter(email="ana@example.com").exists())
+
+        response = self.client.get(f"{url}?job={job.pk}")
+        self.assertContains(response, "Terminada")
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+    def test_failed_job_removes_the_file_and_reports_partial_import(self):
+        upload = build_users_upload([["Ana", "Perez", "ana@example.com", "", "approved"]])
+        job = create_user_import_job(upload)
+        path = job.source_path
+
+        def fail_after_first_batch(importer, fh, progress=None):
+            progress(500, 1000)
+            raise RuntimeError("disco lleno")
+
+        with mock.patch.object(UserXlsxImporter, "import_upload", fail_after_first_batch):
+            run_user_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.source_path), ("failed", ""))
+        self.assertFalse(os.path.exists(path))
+        self.assertIn("disco lleno", job.errors[0])
+        self.assertIn("500 filas", job.errors[1])
+
+    def test_stale_jobs_are_failed_when_the_admin_page_loads(self):
+        upload = build_users_upload([["Ana", "Perez", "ana@example.com", "", "approved"]])
+        stale = create_user_import_job(upload)
+        stale_path = stale.source_path
+        fresh = create_user_import_job(upload)
+        UserImportJob.objects.filter(pk=stale.pk).update(
+            status="running",
+            processed_rows=500,
+            created_at=timezone.now() - timedelta(days=1),
+            updated_at=timezone.now() - timedelta(days=1),
+        )
+        # Una importacion larga que sigue latiendo no se da por muerta.
+        UserImportJob.objects.filter(pk=fresh.pk).update(created_at=timezone.now() - timedelta(days=1))
+
+        self.client.get(reverse("admin:users_customuser_import_xlsx"))
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.source_path), ("failed", ""))
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertIn("500 filas", stale.errors[-1])
+        self.assertEqual(fresh.status, "pending")
+        self.assertTrue(os.path.exists(fresh.source_path))
+        os.remove(fresh.source_path)
+
+    def test_thread_does_not_overwrite_a_job_failed_as_stale(self):
+        upload = build_users_upload([["Ana", "Perez", "ana@example.com", "", "approved"]])
+        job = create_user_import_job(upload)
+
+        def finish_after_being_failed(importer, fh, progress=None):
+            progress(1, 1)
+            UserImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(days=1))
+            fail_stale_user_import_jobs()
+            return 1, 0, []
+
+        with mock.patch.object(UserXlsxImporter, "import_upload", finish_after_being_failed):
+            run_user_import_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("se interrumpio", job.errors[0])
@@ -1,10 +1,22 @@
 import os
+import shutil
+import tempfile
+import threading
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
 
 import openpyxl
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.http import HttpResponse
+from django.utils import timezone
 
-from .models import CustomUser
+from .models import CustomUser, UserImportJob
 
 
 USER_IMPORT_HEADERS = [
@@ -35,6 +47,27 @@ USER_SAMPLE_ROWS = [
 ]
 
 
+USER_IMPORT_CHUNK_SIZE = 500
+USER_IMPORT_MAX_HASH_WORKERS = 8
+# Por debajo de esta cantidad de claves no conviene levantar hilos.
+USER_IMPORT_PARALLEL_HASH_MIN = 8
+USER_IMPORT_UPDATE_FIELDS = [
+    "username",
+    "email",
+    "first_name",
+    "last_name",
+    "name",
+    "phone",
+    "address",
+    "city",
+    "zip_code",
+    "approval_status",
+    "is_active",
+    "role",
+    "password",
+]
+
+
 HEADER_ALIAS = {
     "nombre": "nombre",
     "name": "nombre",
@@ -93,82 +126,173 @@ class UserXlsxImporter:
                 return response
         return self.export_workbook([{header: "" for header in USER_IMPORT_HEADERS}], "plantilla_clientes.xlsx")
 
-    def import_upload(self, upload):
+    def import_upload(self, upload, progress=None):
+        """Crea o actualiza clientes por tandas.
+
+        Los emails se resuelven contra un indice precargado por tanda, las claves se
+        hashean en un pool de hilos y la DB se escribe con bulk_create/bulk_update.
+        ``progress(procesadas, total)`` se llama al terminar cada tanda.
+        """
+        upload.seek(0)
         wb = openpyxl.load_workbook(upload, data_only=True, read_only=True)
-        sheet = wb.active
-        rows = list(sheet.iter_rows(values_only=True))
-        wb.close()
+        try:
+            sheet = wb.active
+            total_rows = max(0, int(sheet.max_row or 0) - 1)
+            rows = sheet.iter_rows(values_only=True)
+            header_row = next(rows, None)
+            if header_row is None:
+                return 0, 0, ["El archivo no contiene filas."]
 
-        if not rows:
-            return 0, 0, ["El archivo no contiene filas."]
+            headers = [self._norm_header(value) for value in header_row]
+            mapped = {}
+            for idx, header in enumerate(headers):
+                canonical = HEADER_ALIAS.get(header)
+                if canonical:
+                    mapped[canonical] = idx
 
-        headers = [self._norm_header(value) for value in rows[0]]
-        mapped = {}
-        for idx, header in enumerate(headers):
-            canonical = HEADER_ALIAS.get(header)
-            if canonical:
-                mapped[canonical] = idx
+            required = {"nombre", "apellido", "email"}
+            missing = required - set(mapped.keys())
+            if missing:
+                return 0, 0, [f"Faltan columnas obligatorias: {', '.join(sorted(missing))}"]
+
+            created = 0
+            updated = 0
+            errors = []
+            processed = 0
+            index = {}
+            with _PasswordHasher(self._hash_workers()) as hasher:
+                for batch in _iter_batches(enumerate(rows, start=2), USER_IMPORT_CHUNK_SIZE):
+                    records = []
+                    for row_number, raw in batch:
+                        record, error = self._parse_row(row_number, raw, mapped)
+                        if error:
+                            errors.append(error)
+                        elif record:
+                            records.append(record)
+                    batch_created, batch_updated = self._write_batch(records, index, hasher)
+                    created += batch_created
+                    updated += batch_updated
+                    processed += len(batch)
+                    if progress:
+                        progress(processed, max(total_rows, processed))
+        finally:
+            wb.close()
+
+        return created, updated, errors
 
-        required = {"nombre", "apellido", "email"}
-        missing = required - set(mapped.keys())
-        if missing:
-            return 0, 0, [f"Faltan columnas obligatorias: {', '.join(sorted(missing))}"]
+    def _parse_row(self, row_number, raw, mapped):
+        data = {
+            key: raw[idx] if idx < len(raw) else ""
+            for key, idx in mapped.items()
+        }
+        if all(value in ("", None) for value in data.values()):
+            return None, None
+
+        first_name = str(data.get("nombre") or "").strip()
+        last_name = str(data.get("apellido") or "").strip()
+        email = str(data.get("email") or "").strip().lower()
+        approval_status = self._parse_approval_status(data.get("approval_status"))
+        if not first_name or not last_name or not email:
+            return None, f"Fila {row_number}: nombre, apellido y email son obligatorios."
+        if approval_status is None:
+            return None, f"Fila {row_number}: estado de aprobacion invalido."
+
+        return {
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": email,
+            "password": str(data.get("password") or "").strip(),
+            "approval_status": approval_status,
+            "phone": str(data.get("phone") or "").strip(),
+            "address": str(data.get("address") or "").strip(),
+            "city": str(data.get("city") or "").strip(),
+            "zip_code": str(data.get("zip_code") or "").strip(),
+        }, None
+
+    def _preload_users(self, emails, index):
+        pending = sorted({email for email in emails if email not in index})
+        if not pending:
+            return
+        queryset = (
+            CustomUser.objects.annotate(email_lower=Lower("email"), username_lower=Lower("username"))
+            .filter(Q(email_lower__in=pending) | Q(username_lower__in=pending))
+            .order_by("id")
+        )
+        by_username = {}
+        for user in queryset:
+            email_key = str(user.email or "").strip().lower()
+            if email_key in pending:
+                index.setdefault(email_key, user)
+            by_username.setdefault(str(user.username or "").strip().lower(), user)
+        # Un usuario cuyo username ya es ese email se actualiza en vez de chocar con el unique.
+        for email in pending:
+            if email not in index and email in by_username:
+                index[email] = by_username[email]
+
+    def _write_batch(self, records, index, hasher):
+        if not records:
+            return 0, 0
+        self._preload_users([record["email"] for record in records], index)
 
         created = 0
         updated = 0
-        errors = []
-
-        for row_number, raw in enumerate(rows[1:], start=2):
-            data = {
-                key: raw[idx] if idx < len(raw) else ""
-                for key, idx in mapped.items()
-            }
-            if all(value in ("", None) for value in data.values()):
-                continue
-
-            first_name = str(data.get("nombre") or "").strip()
-            last_name = str(data.get("apellido") or "").strip()
-            email = str(data.get("email") or "").strip().lower()
-            password = str(data.get("password") or "").strip()
-            approval_status = self._parse_approval_status(data.get("approval_status"))
-            phone = str(data.get("phone") or "").strip()
-            address = str(data.get("address") or "").strip()
-            city = str(data.get("city") or "").strip()
-            zip_code = str(data.get("zip_code") or "").strip()
-
-            if not first_name or not last_name or not email:
-                errors.append(f"Fila {row_number}: nombre, apellido y email son obligatorios.")
-                continue
-            if approval_status is None:
-                errors.append(f"Fila {row_number}: estado de aprobacion invalido.")
-                continue
-
-            user = CustomUser.objects.filter(email__iexact=email).first()
+        to_create = {}
+        to_update = {}
+        passwords = []
+        for record in records:
+            email = record["email"]
+            user = index.get(email)
             is_new = user is None
             if is_new:
                 user = CustomUser(username=email, email=email)
+                index[email] = user
             user.username = email
             user.email = email
-            user.first_name = first_name
-            user.last_name = last_name
-            user.name = f"{first_name} {last_name}".strip()
-            user.phone = phone
-            user.address = address
-            user.city = city
-            user.zip_code = zip_code
-            user.approval_status = approval_status
-            if password:
-                user.set_password(password)
+            user.first_name = record["first_name"]
+            user.last_name = record["last_name"]
+            user.name = f"{record['first_name']} {record['last_name']}".strip()
+            user.phone = record["phone"]
+            user.address = record["address"]
+            user.city = record["city"]
+            user.zip_code = record["zip_code"]
+            user.approval_status = record["approval_status"]
+            user._sync_access_flags()
+            if record["password"]:
+                passwords.append((user, record["password"]))
             elif is_new:
                 user.set_unusable_password()
-            user.save()
 
+            if user.pk is None:
+                to_create[id(user)] = user
+            else:
+                to_update[user.pk] = user
             if is_new:
                 created += 1
             else:
                 updated += 1
 
-        return created, updated, errors
+        # Una misma fila repetida deja solo la ultima clave, como al guardar fila por fila.
+        latest = {id(user): (user, password) for user, password in passwords}
+        pairs = list(latest.values())
+        for (user, _password), hashed in zip(pairs, hasher.hash([password for _user, password in pairs])):
+            user.password = hashed
+
+        with transaction.atomic():
+            if to_create:
+                CustomUser.objects.bulk_create(list(to_create.values()), batch_size=USER_IMPORT_CHUNK_SIZE)
+            if to_update:
+                CustomUser.objects.bulk_update(
+                    list(to_update.values()),
+                    USER_IMPORT_UPDATE_FIELDS,
+                    batch_size=USER_IMPORT_CHUNK_SIZE,
+                )
+        return created, updated
+
+    def _hash_workers(self):
+        configured = int(getattr(settings, "USER_IMPORT_HASH_WORKERS", 0) or 0)
+        if configured > 0:
+            return configured
+        return min(os.cpu_count() or 1, USER_IMPORT_MAX_HASH_WORKERS)
 
     def _norm_header(self, value):
         text = str(value or "").strip().lower()
@@ -188,3 +312,148 @@ class UserXlsxImporter:
         if raw in {"no", "inactivo"}:
             return "pending"
         return None
+
+
+def _iter_batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _PasswordHasher:
+    """Hashea claves en un pool de hilos que vive lo que dura la importacion.
+
+    ``hashlib.pbkdf2_hmac`` suelta el GIL, asi que los hilos hashean en paralelo sin
+    hacer fork de un worker web que ya tiene hilos y conexiones abiertas.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def hash(self, passwords):
+        if self.workers < 2 or len(passwords) < USER_IMPORT_PARALLEL_HASH_MIN:
+            return [make_password(password) for password in passwords]
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="user-import-hash")
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def create_user_import_job(upload, *, user=None):
+    """Guarda el archivo en un temporal (tiene claves en texto plano, no va a MEDIA) y crea el job."""
+    handle, path = tempfile.mkstemp(prefix="clientes-", suffix=".xlsx")
+    try:
+        with os.fdopen(handle, "wb") as fh:
+            upload.seek(0)
+            shutil.copyfileobj(upload, fh)
+        return UserImportJob.objects.create(
+            filename=str(getattr(upload, "name", "") or "")[:255],
+            source_path=path,
+            created_by=user,
+        )
+    except BaseException:
+        _remove_source(path)
+        raise
+
+
+def _remove_source(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _partial_import_note(processed_rows):
+    if not processed_rows:
+        return "No se guardo ningun cliente."
+    return (
+        f"Las tandas ya procesadas ({processed_rows} filas) quedaron guardadas: "
+        "la importacion puede haber quedado a medias, revisar antes de volver a subir el archivo."
+    )
+
+
+def fail_stale_user_import_jobs():
+    """Marca como fallidos los jobs en cola o procesando sin actividad en ``USER_IMPORT_STALE_SECONDS``.
+
+    Pasa cuando el worker se reinicia o muere a mitad de camino: el hilo no vuelve y
+    el archivo temporal (con claves en texto plano) quedaria en disco. Se mide desde el
+    ultimo latido (``updated_at``), asi una importacion grande que sigue avanzando no cuenta.
+    """
+    limit = timezone.now() - timedelta(seconds=settings.USER_IMPORT_STALE_SECONDS)
+    stale = UserImportJob.objects.filter(status__in=["pending", "running"], updated_at__lt=limit)
+    count = 0
+    for job in stale:
+        _remove_source(job.source_path)
+        job.status = "failed"
+        job.errors = [
+            *(job.errors or []),
+            "La importacion se interrumpio (el servidor se reinicio o el proceso murio).",
+            _partial_import_note(job.processed_rows),
+        ]
+        job.source_path = ""
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "errors", "source_path", "finished_at"])
+        count += 1
+    return count
+
+
+def start_user_import_job(job_id):
+    """Lanza la importacion en un hilo aparte una vez confirmado el job en la DB."""
+    transaction.on_commit(
+        lambda: threading.Thread(target=_run_user_import_job_thread, args=(job_id,), daemon=True).start()
+    )
+
+
+def _run_user_import_job_thread(job_id):
+    try:
+        run_user_import_job(job_id)
+    finally:
+        connection.close()
+
+
+def run_user_import_job(job_id):
+    # Tomar el job con un UPDATE condicional: uno ya marcado como fallido no se reabre.
+    claimed = UserImportJob.objects.filter(pk=job_id, status="pending").update(
+        status="running", updated_at=timezone.now()
+    )
+    if not claimed:
+        return
+    job = UserImportJob.objects.get(pk=job_id)
+
+    def progress(processed, total):
+        UserImportJob.objects.filter(pk=job.pk).update(
+            processed_rows=processed, total_rows=total, updated_at=timezone.now()
+        )
+
+    try:
+        with open(job.source_path, "rb") as fh:
+            job.created, job.updated, job.errors = UserXlsxImporter().import_upload(fh, progress=progress)
+        job.status = "done"
+    except Exception as exc:
+        job.status = "failed"
+        job.processed_rows = UserImportJob.objects.values_list("processed_rows", flat=True).get(pk=job.pk)
+        job.errors = [f"No se pudo procesar el XLSX: {exc}", _partial_import_note(job.processed_rows)]
+    finally:
+        _remove_source(job.source_path)
+
+    # Si mientras tanto se dio por muerto (fail_stale_user_import_jobs), queda como fallido.
+    now = timezone.now()
+    UserImportJob.objects.filter(pk=job.pk, status="running").update(
+        status=job.status,
+        created=job.created,
+        updated=job.updated,
+        errors=job.errors,
+        source_path="",
+        finished_at=now,
+        updated_at=now,
+    )